@@ -1,14 +1,23 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional, Union
 
-from fastapi import WebSocket, Request, APIRouter, Depends
+from fastapi import WebSocket, Request, Response, APIRouter, Depends
 from fastapi.exception_handlers import HTTPException
 from fastapi.websockets import WebSocketDisconnect
+from pydantic import ValidationError
 
 from app.application.services.auth.auth_manager import AuthManager, get_auth_manager, get_current_user
 from app.infrastructure.config.config import templates
-from .dependencies import ChatServiceDep, UserServiceDep
+from .dependencies import ChatServiceDep, UserServiceDep, UnitOfWorkDep
 from app.application.services.websocket.websocket_manager import websocket_manager
-from .schemas.chat import ChatItemSchema
+from .schemas.chat import (
+    ChatItemSchema,
+    HistoryRequestSchema,
+    MessagePageSchema,
+    MessageSchema,
+    ReadReceiptSchema,
+    RoomRetentionSchema,
+)
 from .schemas.users import UserRead
 
 router = APIRouter()
@@ -16,12 +25,15 @@ router = APIRouter()
 @router.websocket("/ws/chat-list")
 async def websocket_chat_list(
     websocket: WebSocket,
+    uow: UnitOfWorkDep,
     auth_manager: AuthManager = Depends(get_auth_manager)
 ):
     """
     WebSocket for updated chat list (new messages, latest messages update).
+    The database session of the handshake is released for the lifetime of the socket.
     """
     user = await websocket_manager.connect_chat_list(websocket, auth_manager)
+    await uow.release()
     if not user:
         return
 
@@ -29,24 +41,26 @@ async def websocket_chat_list(
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
-        if websocket in websocket_manager.chat_listeners:
-            websocket_manager.chat_listeners.remove(websocket)
+        await websocket_manager.disconnect_chat_list(user.id, websocket)
 
 @router.websocket("/ws/{user_id_recipient}")
 async def websocket_endpoint(
     websocket: WebSocket,
     user_id_recipient: int,
+    uow: UnitOfWorkDep,
     chat_service: ChatServiceDep,
     user_service: UserServiceDep,
-    auth_manager: AuthManager = Depends(get_auth_manager)
+    auth_manager: AuthManager = Depends(get_auth_manager),
+    last_seq: Optional[int] = None,
 ):
     """
         Handles real-time WebSocket communication for a chat between users.
         Establishes a connection, manages incoming messages, and handles disconnections.
+        A reconnecting client passes `last_seq` to receive only the messages it missed.
+        The database session of the handshake is released for the lifetime of the socket.
         """
 
-    (room_connections,
-     room,
+    (room,
      user,
      recipient
      ) = await websocket_manager.connect(
@@ -54,31 +68,56 @@ async def websocket_endpoint(
         user_id_recipient,
         chat_service,
         user_service,
-        auth_manager
+        auth_manager,
+        last_seq
     )
+    await uow.release()
     try:
         while True:
             raw_text = await websocket.receive_text()
+            frame = websocket_manager.parse_frame(raw_text)
+
+            if frame["type"] == "history":
+                try:
+                    request = HistoryRequestSchema.model_validate(frame)
+                except ValidationError:
+                    continue
+                await websocket_manager.send_history_page(
+                    websocket,
+                    room.id,
+                    request,
+                    chat_service,
+                    user,
+                    recipient
+                )
+                continue
+
+            if frame["type"] == "read":
+                try:
+                    receipt = ReadReceiptSchema.model_validate(frame)
+                except ValidationError:
+                    continue
+                await websocket_manager.mark_read(chat_service, room.id, user, recipient, receipt.seq)
+                continue
 
-            if not raw_text.strip():
+            text = frame.get("text")
+            if not isinstance(text, str) or not text.strip():
                 continue
 
             message_data = {
                 "username": user.username,
-                "text": raw_text[:1024],
+                "text": text[:1024],
                 "avatarUrl": user.profile.avatar
             }
             await websocket_manager.send_message(
                 message_data,
                 chat_service,
                 room.id,
-                user
+                user,
+                recipient
             )
     except WebSocketDisconnect:
-        if websocket:
-            room_connections.remove(websocket)
-        if len(room_connections) == 0:
-            await websocket_manager.delete_room(room.id)
+        await websocket_manager.disconnect(room.id, websocket)
 
 
 
@@ -109,26 +148,95 @@ def get_access_token_cookie(request: Request):
 
 @router.get("/api/chats", response_model=List[ChatItemSchema])
 async def get_user_chats(
+    request: Request,
+    response: Response,
     chat_service: ChatServiceDep,
     user_service: UserServiceDep,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    since: Optional[int] = None,
     user: UserRead = Depends(get_current_user),
 ):
-    """Gets a list of recent messages from chats"""
-    rooms = await chat_service.get_user_room_ids(user.id)
+    """
+        Gets a page of the user's chats ordered by last activity, starting after the `cursor`.
+        The cursor of the next page is returned in the X-Next-Cursor header.
+
+        With `since`, only the chats changed after that chat list version are returned.
+        If they cannot be determined, the first page is returned with X-Chat-List-Reset.
+        The current version is returned in X-Chat-List-Version and as the ETag,
+        304 is returned if the list has not changed.
+    """
+    version = await chat_service.get_chat_list_version(user.id)
+    headers = {"ETag": f'"{version}"', "X-Chat-List-Version": str(version)}
+
+    if since == version or request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    rooms = None
+    if since is not None:
+        rooms = await chat_service.get_chat_list_changes(user.id, since)
+        if rooms is None:
+            response.headers["X-Chat-List-Reset"] = "1"
+
+    if rooms is None:
+        try:
+            rooms, next_cursor = await chat_service.get_inbox_page(user.id, limit, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        if next_cursor is not None:
+            response.headers["X-Next-Cursor"] = next_cursor
 
     if not rooms:
         return []
 
-    recipient_ids = [
-        recipient_id if sender_id == user.id else sender_id
-        for room_id, sender_id, recipient_id in rooms
-    ]
+    recipient_ids = [partner_id for room_id, user_id, partner_id in rooms]
 
-    recipients = await user_service.get_users_with_profiles(recipient_ids)
+    recipients = await user_service.load_users(recipient_ids)
     chat_list = await chat_service.get_user_chat_list(user.id, rooms, recipients)
 
     return chat_list
 
+@router.get("/api/chats/{room_id}/messages", response_model=MessagePageSchema)
+async def get_chat_messages(
+    room_id: int,
+    chat_service: ChatServiceDep,
+    before: Optional[Union[int, datetime]] = None,
+    limit: Optional[int] = None,
+    user: UserRead = Depends(get_current_user),
+):
+    """
+        Returns a page of messages of a chat older than the `before` cursor
+        (a sequence number or a creation time), or the latest page without it.
+    """
+    room = await chat_service.get_room(room_id)
+    if not room or user.id not in (room.sender_id, room.recipient_id):
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    messages, next_before = await chat_service.get_messages_page(room_id, before, limit)
+    return MessagePageSchema(
+        messages=[MessageSchema.model_validate(message) for message in messages],
+        next_before=next_before
+    )
+
+@router.put("/api/chats/{room_id}/retention", response_model=RoomRetentionSchema)
+async def set_chat_retention(
+    room_id: int,
+    retention: RoomRetentionSchema,
+    chat_service: ChatServiceDep,
+    user: UserRead = Depends(get_current_user),
+):
+    """
+        Sets the number of messages kept in a chat, for both participants.
+        A null retention restores the global setting. Applies from the next message.
+    """
+    room = await chat_service.get_room(room_id)
+    if not room or user.id not in (room.sender_id, room.recipient_id):
+        raise HTTPException(status_code=404, detail="Chat not found")
+
+    await chat_service.set_room_retention(room_id, retention.retention)
+    return retention
+
 @router.get("/chats/")
 async def get_index(request: Request):
     """Renders the chats."""
@@ -1,10 +1,32 @@
-from typing import Annotated
+from typing import Annotated, AsyncIterator
 from fastapi import Depends
 
 from app.application.services.user import UserService
 from app.application.unit_of_work.unit_of_work import UnitOfWork
-from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.config.database import session_router
 from app.application.services.chat import ChatService
 
-ChatServiceDep = Annotated[ChatService, Depends(lambda: ChatService(UnitOfWork(async_session_maker)))]
-UserServiceDep = Annotated[UserService, Depends(lambda: UserService(UnitOfWork(async_session_maker)))]
+
+async def get_unit_of_work() -> AsyncIterator[UnitOfWork]:
+    """
+        Provides a unit of work whose session is shared by all services of the request.
+        Read-only units of work are routed to the replicas, if any.
+    """
+    uow = UnitOfWork(session_router)
+    async with uow.scope():
+        yield uow
+
+
+UnitOfWorkDep = Annotated[UnitOfWork, Depends(get_unit_of_work)]
+
+
+def get_chat_service(uow: UnitOfWorkDep) -> ChatService:
+    return ChatService(uow)
+
+
+def get_user_service(uow: UnitOfWorkDep) -> UserService:
+    return UserService(uow)
+
+
+ChatServiceDep = Annotated[ChatService, Depends(get_chat_service)]
+UserServiceDep = Annotated[UserService, Depends(get_user_service)]
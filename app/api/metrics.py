@@ -0,0 +1,23 @@
+import secrets
+from typing import Optional
+
+from fastapi import APIRouter, Header, HTTPException
+
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.metrics import metrics
+
+router = APIRouter()
+
+
+@router.get("/api/metrics")
+async def get_metrics(authorization: Optional[str] = Header(None)):
+    """
+        Returns the in-process metrics of the worker that served the request.
+        Internal: requires `Authorization: Bearer <metrics_token>` and does not exist without
+        a configured token. nginx does not proxy it, so it is reached on the workers directly.
+    """
+    if not settings.metrics_token:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(authorization or "", f"Bearer {settings.metrics_token}"):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return metrics.snapshot()
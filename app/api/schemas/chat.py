@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Optional
+from typing import Optional, List, Union
 
-from pydantic import model_validator, BaseModel, EmailStr, ConfigDict
+from pydantic import model_validator, BaseModel, EmailStr, ConfigDict, Field
 
 from app.api.schemas.users import FriendSchema
 
@@ -20,6 +20,33 @@ class ChatItemSchema(BaseModel):
     recipient: FriendSchema
     last_message: Optional[str]
     last_message_time: Optional[datetime]
+    last_sender_id: Optional[int] = None
+    message_count: Optional[int] = None
+    unread_count: Optional[int] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+class MessageSchema(BaseModel):
+    seq: Optional[int] = None
+    user_id: int
+    username: str
+    text: str
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class MessagePageSchema(BaseModel):
+    messages: List[MessageSchema]
+    next_before: Optional[Union[int, datetime]]
+
+class ReadReceiptSchema(BaseModel):
+    seq: int
+
+class RoomRetentionSchema(BaseModel):
+    retention: Optional[int] = Field(None, gt=0)
+
+class HistoryRequestSchema(BaseModel):
+    before: Optional[Union[int, datetime]] = None
+    limit: Optional[int] = None
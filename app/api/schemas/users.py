@@ -39,6 +39,7 @@ class ProfileSchema(BaseModel):
 
 class UserRead(UserBase):
     profile: Optional[ProfileSchema]
+    friends_count: int = 0
 
     class Config:
         from_attributes = True
@@ -9,13 +9,14 @@ from fastapi import (
     File,
     HTTPException,
     Response,
+    Query,
 )
 from fastapi.responses import JSONResponse
 from app.application.services.auth.auth_manager import get_auth_manager, get_current_user, \
     AuthManager
 from app.api.dependencies import UserServiceDep
 from app.infrastructure.models.relational.users import User
-from app.infrastructure.config.config import templates
+from app.infrastructure.config.config import settings, templates
 from .schemas.users import UserCreate, FriendSchema, UserRead
 from app.infrastructure.utils.other import filter_none_values
 from ..application.exceptions import EmailAlreadyExistsException, UsernameAlreadyExistsException
@@ -125,19 +126,40 @@ async def add_friend(
     return Response("ok")
 
 
+@router.post("/remove/friend/{friend_id}/")
+async def remove_friend(
+    friend_id: int,
+    user_service: UserServiceDep,
+    user: User = Depends(get_current_user),
+):
+    """
+        Removes the specified user from the current user's friend list.
+    """
+    if not await user_service.remove_user_friend(friend_id, user.id):
+        raise HTTPException(status_code=404, detail="Friend not found")
+    return Response("ok")
+
+
 @router.get("/friends/", response_model=Optional[List[FriendSchema]])
 async def get_friends(
+        response: Response,
         user_service: UserServiceDep,
-        page: int = 1,
-        limit: int = 10,
+        limit: int = Query(10, ge=1, le=settings.friends_max_page_size),
+        after_id: Optional[int] = None,
         user: User = Depends(get_current_user),
         pagination: bool = False,
 ):
     """
-        Retrieves a paginated list of friends for the current user.
+        Retrieves a page of friends of the current user, starting after `after_id`.
+        The ID to continue from is returned in the X-Next-After-Id header.
+        Without pagination, returns a random sample of three friends.
     """
-    friends = await user_service.get_user_friends(user.id, page, limit,
-                                                  pagination)
+    if not pagination:
+        return await user_service.get_random_friends(user.id)
+
+    friends, next_after_id = await user_service.get_user_friends(user.id, limit, after_id)
+    if next_after_id is not None:
+        response.headers["X-Next-After-Id"] = str(next_after_id)
     return friends
 
 
@@ -170,7 +192,7 @@ async def register_user(
         Registers a new user with the provided details.
     """
 
-    hashed_password = authorization_manager.get_password_hash(user.password)
+    hashed_password = await authorization_manager.get_password_hash(user.password)
     try:
         await user_service.register_user({
             "email": user.email,
@@ -199,7 +221,7 @@ async def login_user(
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
 
-    if not authorization_manager.verify_password(password, user.hashed_password):
+    if not await authorization_manager.verify_password(password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect password")
 
     access_token = authorization_manager.create_access_token(
@@ -222,17 +244,23 @@ async def logout_user(response: Response):
 
 @router.get("/search/", response_model=Optional[List[FriendSchema]])
 async def search_users(
+    response: Response,
     user_service: UserServiceDep,
     query: str,
-    page: int = 1,
-    limit: int = 50,
+    limit: int = Query(50, ge=1, le=settings.search_max_page_size),
+    after_score: Optional[int] = None,
+    after_id: Optional[int] = None,
     current_user: User = Depends(get_current_user),
 ):
     """
-        Searches for users based on the provided query string.
+        Searches for users based on the provided query string, exact and prefix matches first.
+        The position of the next page is returned in the X-Next-After-Score and X-Next-After-Id headers.
     """
 
-    users = await user_service.find_users_by_username(query, page, limit)
+    users, next_position = await user_service.find_users_by_username(query, limit, after_score, after_id)
+    if next_position:
+        response.headers["X-Next-After-Score"] = str(next_position[0])
+        response.headers["X-Next-After-Id"] = str(next_position[1])
     return users
 
 
@@ -1,12 +1,13 @@
 from jose import jwt
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
 
 from fastapi import HTTPException, Request, Depends
 
 from app.api.schemas.users import UserRead
 from app.infrastructure.config.config import settings
+from app.infrastructure.utils.password_hasher import password_hasher
 from app.application.services.user import UserService
+from app.application.services.auth.token_cache import token_cache
 from app.api.dependencies import UserServiceDep
 
 
@@ -18,24 +19,24 @@ class AuthManager:
 
     def __init__(self, user_service: UserService):
         """
-            Initializes the AuthManager with the user service for user lookup and a password context for password hashing.
+            Initializes the AuthManager with the user service for user lookup and the shared password hasher.
         """
         self.user_service = user_service
-        self.pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.password_hasher = password_hasher
         self.ACCESS_TOKEN_EXPIRE_MINUTES = 1440
         self.ALGORITHM = "HS256"
 
-    def verify_password(self, plain_password, hashed_password):
+    async def verify_password(self, plain_password, hashed_password):
         """
-           Verifies that the provided plain password matches the hashed password.
+           Verifies that the provided plain password matches the hashed password, off the event loop.
        """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await self.password_hasher.verify(plain_password, hashed_password)
 
-    def get_password_hash(self, password):
+    async def get_password_hash(self, password):
         """
-            Hashes the provided password using bcrypt.
+            Hashes the provided password using bcrypt, off the event loop.
         """
-        return self.pwd_context.hash(password)
+        return await self.password_hasher.hash(password)
 
     def create_access_token(self, data: dict):
         """
@@ -54,6 +55,7 @@ class AuthManager:
     ) -> UserRead | None:
         """
             Retrieves the user associated with the provided access token. If the token is not provided, it checks the cookies.
+            Users resolved from tokens are cached until the token expires or the user changes.
         """
         access_token = token if token else request.cookies.get("access_token")
 
@@ -71,7 +73,11 @@ class AuthManager:
             if not email:
                 raise HTTPException(status_code=401, detail="Invalid token")
 
-            user = await self.user_service.get_user_by_email(email)
+            user = await token_cache.get_user(
+                access_token,
+                payload.get("exp", 0),
+                lambda: self.user_service.load_user_by_email(email),
+            )
 
             if not user:
                 raise HTTPException(status_code=404, detail="User not found")
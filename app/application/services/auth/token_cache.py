@@ -0,0 +1,140 @@
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+from app.api.schemas.users import UserRead
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.json_codec import codec
+from app.infrastructure.utils.metrics import metrics
+from app.infrastructure.utils.redis_utils.redis_utils import RedisUtils, redis_utils
+
+TOKEN_INVALIDATION_CHANNEL = "auth:tokens:invalidate"
+
+
+class TokenCache:
+    """
+        Cache of the users resolved from verified access tokens, keyed by the SHA-256 digest of the token.
+
+        L1 is a bounded in-process LRU. L2, enabled with `token_cache_redis`, is shared by the workers.
+        An entry lives `token_cache_ttl` seconds at most and never past the `exp` of its token.
+        The entries of a user are dropped when the user changes: in Redis by `invalidate_user`
+        and in every worker through TOKEN_INVALIDATION_CHANNEL.
+    """
+
+    def __init__(self, redis: RedisUtils):
+        self.redis_utils = redis
+        self.ttl = settings.token_cache_ttl
+        self.max_entries = settings.token_cache_max_entries
+        self.use_redis = settings.token_cache_redis
+        self._local: OrderedDict[str, tuple[UserRead, float]] = OrderedDict()
+        self._invalidations = 0
+
+        metrics.gauge("token_cache.entries", lambda: len(self._local))
+
+    async def get_user(
+            self,
+            token: str,
+            expires_at: float,
+            load: Callable[[], Awaitable[Optional[UserRead]]],
+    ) -> Optional[UserRead]:
+        """
+            Returns the user of a verified token, calling `load` on a miss.
+            `expires_at` is the `exp` of the token as a UNIX timestamp.
+        """
+        digest = hashlib.sha256(token.encode()).hexdigest()
+        now = time.time()
+
+        entry = self._local.get(digest)
+        if entry is not None:
+            user, valid_until = entry
+            if valid_until > now:
+                self._local.move_to_end(digest)
+                metrics.incr("token_cache.local_hits")
+                return user
+            del self._local[digest]
+
+        valid_until = min(now + self.ttl, expires_at)
+        if valid_until <= now:
+            return await load()
+
+        invalidations = self._invalidations
+        user = await self._get_shared(digest) if self.use_redis else None
+        if user is not None:
+            metrics.incr("token_cache.hits")
+        else:
+            metrics.incr("token_cache.misses")
+            user = await load()
+            if user is None:
+                return None
+            if self.use_redis and invalidations == self._invalidations:
+                await self._set_shared(digest, user, int(valid_until - now))
+
+        # A user invalidated while it was loaded may be stale, so it is not kept.
+        if invalidations == self._invalidations:
+            self._store_local(digest, user, valid_until)
+        return user
+
+    async def invalidate_user(self, user_id: int) -> None:
+        """
+            Drops the cached entries of a user in Redis and in every worker.
+        """
+        self.discard_local(user_id)
+        try:
+            if self.use_redis:
+                await self.redis_utils.delete_indexed(self._index_key(user_id))
+            await self.redis_utils.publish(TOKEN_INVALIDATION_CHANNEL, str(user_id))
+        except Exception:
+            metrics.incr("token_cache.invalidation_errors")
+
+    def discard_local(self, user_id: int) -> None:
+        """
+            Drops the in-process entries of a user.
+        """
+        self._invalidations += 1
+        for digest in [digest for digest, (user, _) in self._local.items() if user.id == user_id]:
+            del self._local[digest]
+
+    def clear_local(self) -> None:
+        """
+            Drops every in-process entry, e.g. after invalidations may have been missed.
+        """
+        self._invalidations += 1
+        self._local.clear()
+
+    def _store_local(self, digest: str, user: UserRead, valid_until: float) -> None:
+        self._local[digest] = (user, valid_until)
+        self._local.move_to_end(digest)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+    async def _get_shared(self, digest: str) -> Optional[UserRead]:
+        try:
+            data = await self.redis_utils.get(self._key(digest))
+        except Exception:
+            return None
+        return UserRead.model_validate(codec.loads(data)) if data else None
+
+    async def _set_shared(self, digest: str, user: UserRead, ttl: int) -> None:
+        if ttl <= 0:
+            return
+        try:
+            await self.redis_utils.set_indexed(
+                self._key(digest),
+                codec.dumps(user.model_dump(mode="json")),
+                self._index_key(user.id),
+                ttl,
+            )
+        except Exception:
+            pass
+
+    @staticmethod
+    def _key(digest: str) -> str:
+        return f"auth:token:{digest}"
+
+    @staticmethod
+    def _index_key(user_id: int) -> str:
+        return f"auth:user:{user_id}:tokens"
+
+
+token_cache = TokenCache(redis_utils)
@@ -1,13 +1,28 @@
+import asyncio
 from datetime import datetime
-from typing import Sequence, List
+from typing import Sequence, List, Optional, Tuple
 
 from app.api.schemas.chat import RoomSchema, ChatItemSchema
 from app.api.schemas.users import UserRead, FriendSchema
 from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.models.nosql.rooms import RoomState
 from app.infrastructure.repositories.nosql.messages import MessageRepositoryMongoDB
+from app.infrastructure.repositories.nosql.read_states import ReadStateRepositoryMongoDB
+from app.infrastructure.repositories.nosql.rooms import RoomStateRepositoryMongoDB
 from app.infrastructure.repositories.relational.room import RoomRepository
 from app.application.unit_of_work.unit_of_work import IUnitOfWork
-from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
+from app.application.services.history_cache import history_cache
+from app.application.services.inbox import inbox
+from app.application.services.room_cache import room_cache
+from app.application.services.unread import unread_counters
+from app.application.services.write_behind import message_write_behind
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.background import run_in_background
+from app.infrastructure.utils.metrics import metrics
+from app.infrastructure.utils.single_flight import SingleFlight, single_flight
+
+_trims = SingleFlight("retention.trim")
+_inbox_builds = SingleFlight("inbox.build")
 
 
 class ChatService:
@@ -23,18 +38,121 @@ class ChatService:
         """
         self.uow = uow
         self.message_repository = MessageRepositoryMongoDB()
+        self.room_state_repository = RoomStateRepositoryMongoDB()
+        self.read_state_repository = ReadStateRepositoryMongoDB()
         self.uow.set_repository('room', RoomRepository)
 
-    async def get_messages_for_room(self, room_id: int) -> Sequence[Message]:
+    def fork(self) -> "ChatService":
+        """
+        Returns a chat service on a fork of the unit of work, for calls shared between requests.
+        """
+        return ChatService(self.uow.fork())
+
+    @single_flight
+    async def get_messages_for_room(self, room_id: int, limit: int = 500) -> Sequence[Message]:
+        """
+        Retrieves the latest messages for a specific chat room.
+        """
+        messages = await self.message_repository.get_messages_by_room_id(room_id, limit)
+        return await self._merge_unflushed(room_id, messages, limit=limit)
+
+    @single_flight
+    async def get_messages_page(
+            self,
+            room_id: int,
+            before: Optional[int | datetime] = None,
+            limit: Optional[int] = None
+    ) -> Tuple[Sequence[Message], Optional[int | datetime]]:
+        """
+        Retrieves a page of messages older than the cursor, or the latest page without one.
+        Returns the messages in ascending order and the cursor of the next older page,
+        which is None when there are no more messages.
+        """
+        limit = max(1, min(limit or settings.history_page_size, settings.history_max_page_size))
+
+        if before is None:
+            messages = await self.message_repository.get_messages_by_room_id(room_id, limit)
+            messages = await self._merge_unflushed(room_id, messages, limit=limit)
+        else:
+            messages = await self.message_repository.get_messages_before(room_id, before, limit)
+            if not isinstance(before, datetime):
+                messages = await self._merge_unflushed(room_id, messages, before_seq=before, limit=limit)
+
+        next_before = None
+        if len(messages) == limit:
+            oldest = messages[0]
+            next_before = oldest.seq if oldest.seq is not None else oldest.created_at
+
+        return messages, next_before
+
+    @single_flight
+    async def get_messages_after_seq(self, room_id: int, after_seq: int, limit: int = 500) -> Sequence[Message]:
         """
-        Retrieves all messages for a specific chat room.
+        Retrieves the messages of a room stored after the given sequence number, in ascending order.
+        At most `limit` stored messages are read, so a result of `limit` messages or more
+        may be incomplete.
         """
-        return await self.message_repository.get_messages_by_room_id(room_id)
+        messages = await self.message_repository.get_messages_after_seq(room_id, after_seq, limit)
+        return await self._merge_unflushed(room_id, messages, after_seq=after_seq)
+
+    async def _merge_unflushed(
+            self,
+            room_id: int,
+            messages: Sequence[Message],
+            after_seq: Optional[int] = None,
+            before_seq: Optional[int] = None,
+            limit: Optional[int] = None
+    ) -> list[Message]:
+        """
+        Adds to messages read from Mongo the ones of the same range still in the write-behind buffer.
+        Returns them in ascending order, only the newest `limit` with a limit.
+        """
+        if not settings.message_write_behind:
+            return list(messages)
+
+        unflushed = await message_write_behind.get_unflushed(room_id, after_seq, before_seq, limit)
+        if not unflushed:
+            return list(messages)
+
+        stored_seqs = {message.seq for message in messages}
+        merged = list(messages) + [message for message in unflushed if message.seq not in stored_seqs]
+        # Messages stored before sequence numbers were introduced are older than all numbered ones.
+        merged.sort(key=lambda message: (message.seq is not None, message.seq or 0, message.created_at))
+        return merged[-limit:] if limit else merged
+
+    async def _count_unread(self, user_id: int, after_seqs: dict[int, int]) -> dict[int, int]:
+        """
+        Counts for each room of `after_seqs` ({room_id: after_seq}) the messages written by others
+        after the given sequence number, including the ones still in the write-behind buffer.
+        The stored messages of all rooms are counted with one query.
+        """
+        unflushed: dict[int, list[Message]] = {}
+        if settings.message_write_behind:
+            buffered = await asyncio.gather(*(
+                message_write_behind.get_unflushed(room_id, after_seq=after_seq)
+                for room_id, after_seq in after_seqs.items()
+            ))
+            unflushed = dict(zip(after_seqs, buffered))
+
+        # A message may be both stored and still buffered until its batch is acknowledged.
+        stored = await self.message_repository.count_unread(
+            user_id,
+            after_seqs,
+            exclude_seqs={room_id: [message.seq for message in messages] for room_id, messages in unflushed.items()},
+        )
+        return {
+            room_id: stored.get(room_id, 0)
+            + sum(1 for message in unflushed.get(room_id, []) if message.user_id != user_id)
+            for room_id in after_seqs
+        }
 
     async def add_message_to_room(self, room_id: int, data: dict) -> Message:
         """
-        Adds a new message to a chat room. If the room has more than 500 messages,
-        deletes the oldest message.
+        Adds a new message to a chat room with the next sequence number of the room.
+        In write-behind mode the message is only appended to the write-behind buffer,
+        unless the buffer is lagging behind by more than the maximum persistence lag.
+        Old messages are not deleted here: once the room holds `retention + slack` messages
+        past the last trim, a background trim deletes everything beyond the retention at once.
         """
         message_text = data.get("text")
         user_id = data.get("user_id")
@@ -44,65 +162,260 @@ class ChatService:
             "room_id": room_id,
             "text": message_text,
             "user_id": user_id,
-            "username": username
+            "username": username,
+            "created_at": datetime.now(),
         }
 
-        new_message = await self.message_repository.add_one(new_message_data)
-        messages_count = await self.message_repository.get_messages_count(room_id)
+        state = await self.room_state_repository.next_seq(room_id, new_message_data)
+        new_message_data["seq"] = state.seq
+
+        if settings.message_write_behind and not message_write_behind.lagging:
+            new_message = self.message_repository.build_one(new_message_data)
+            await message_write_behind.append(new_message)
+        else:
+            new_message = await self.message_repository.add_one(new_message_data)
 
-        if messages_count > 500:
-            oldest_message = await self.message_repository.get_oldest_message(room_id)
-            if oldest_message:
-                await self.message_repository.delete(oldest_message)
-                await redis_utils.delete_all_messages(room_id)
+        retention = state.retention or settings.message_retention
+        if state.seq - state.trimmed_seq > retention + settings.message_retention_slack:
+            run_in_background(
+                _trims.do(room_id, lambda: self.trim_room(room_id, state.seq - retention, retention)),
+                name="retention.trim",
+            )
 
         return new_message
 
+    async def trim_room(self, room_id: int, through_seq: int, retention: int) -> None:
+        """
+        Deletes the messages of a room up to the given sequence number in a single request.
+        The cached history is dropped if it may still hold the deleted messages.
+        """
+        deleted = await self.message_repository.delete_through_seq(room_id, through_seq)
+        await self.room_state_repository.set_trimmed_seq(room_id, through_seq, deleted)
+        metrics.incr("retention.deleted", deleted)
+
+        if retention < settings.history_cache_size:
+            await history_cache.invalidate(room_id)
+
+    async def set_room_retention(self, room_id: int, retention: Optional[int]) -> None:
+        """
+        Sets the number of messages kept in a chat room. None restores the global setting.
+        Applies from the next message sent to the room.
+        """
+        await self.room_state_repository.set_retention(room_id, retention)
+
     async def get_and_create_room_by_users(self, sender: int, recipient: int) -> RoomSchema:
         """
-        Retrieves a chat room that connects two users.
+        Retrieves a chat room that connects two users, creating it on the first call.
+        Rooms are cached by the pair of users, so repeat calls do not touch the database.
         """
+        room = await room_cache.get(sender, recipient)
+        if room is not None:
+            return room
+
         async with self.uow:
             room = await self.uow.room.get_and_create_room_by_users(sender, recipient)
-            return RoomSchema.model_validate(room)
+            room = RoomSchema.model_validate(room)
+
+        await room_cache.set(room)
+        return room
+
+    @single_flight
+    async def get_room(self, room_id: int) -> Optional[RoomSchema]:
+        """
+        Retrieves a chat room by its ID.
+        """
+        async with self.uow.read_only():
+            room = await self.uow.room.get_by_id(room_id)
+            return RoomSchema.model_validate(room) if room else None
 
+    @single_flight
     async def get_user_room_ids(self, user_id: int) -> list[tuple[int, int, int]]:
         """
         Returns a list of rooms in the format (room_id, sender_id, recipient_id).
         """
-        async with self.uow:
+        async with self.uow.read_only():
             return await self.uow.room.get_user_room_ids(user_id)
 
+    async def get_inbox_page(
+            self,
+            user_id: int,
+            limit: Optional[int] = None,
+            cursor: Optional[str] = None
+    ) -> Tuple[list[tuple[int, int, int]], Optional[str]]:
+        """
+        Returns a page of the chats of a user ordered by last activity as
+        (room_id, user_id, partner_id) tuples, and the cursor of the next page.
+        The inbox is built from the rooms of the user if it is not in Redis.
+        """
+        limit = min(limit or settings.chat_list_page_size, settings.chat_list_max_page_size)
+
+        if not await inbox.is_ready(user_id):
+            await _inbox_builds.do(user_id, lambda: self._build_inbox(user_id))
+
+        rooms, next_cursor = await inbox.get_page(user_id, limit, cursor)
+        return [(room_id, user_id, partner_id) for room_id, partner_id in rooms], next_cursor
+
+    async def get_chat_list_version(self, user_id: int) -> int:
+        """
+        Returns the current chat list version of a user.
+        """
+        version, _ = await inbox.get_version(user_id)
+        return version
+
+    async def get_chat_list_changes(self, user_id: int, since: int) -> Optional[list[tuple[int, int, int]]]:
+        """
+        Returns the chats of a user changed after version `since` as (room_id, user_id, partner_id)
+        tuples, or None if the changes are not known since that version or are too many,
+        in which case the client has to reload the chat list.
+        """
+        version, base = await inbox.get_version(user_id)
+        if since > version or since < base:
+            return None
+
+        rooms = await inbox.get_changes(user_id, since, settings.chat_list_max_page_size + 1)
+        if len(rooms) > settings.chat_list_max_page_size:
+            return None
+
+        return [(room_id, user_id, partner_id) for room_id, partner_id in rooms]
+
+    async def _build_inbox(self, user_id: int) -> None:
+        metrics.incr("inbox.rebuilds")
+        rooms = await self.get_user_room_ids(user_id)
+        summaries = await self.get_room_summaries([room_id for room_id, _, _ in rooms])
+
+        entries = []
+        for room_id, sender_id, recipient_id in rooms:
+            summary = summaries.get(room_id)
+            if summary:
+                partner_id = recipient_id if sender_id == user_id else sender_id
+                entries.append((room_id, partner_id, summary.last_message_time))
+
+        await inbox.fill(user_id, entries)
+
     async def get_user_chat_list(
             self,
             user_id: int,
             rooms: list[tuple[int, int, int]],
             recipients: list[UserRead]
     ) -> List[ChatItemSchema]:
-
+        """
+        Builds the chat list of a user from the room summaries.
+        Rooms without a summary yet are summarized from their messages once and backfilled.
+        """
         recipients_map = {u.id: u for u in recipients}
         room_ids = [r[0] for r in rooms]
-        last_messages = await self.message_repository.get_last_messages_for_rooms(room_ids)
+        summaries = await self.get_room_summaries(room_ids)
+        unread_counts = await self.get_unread_counts(user_id, room_ids)
 
         chat_list = []
         for room_id, sender_id, recipient_id in rooms:
             recipient_id = recipient_id if sender_id == user_id else sender_id
             recipient = recipients_map.get(recipient_id)
-            msg = last_messages.get(room_id)
+            summary = summaries.get(room_id)
 
-            if not msg:
+            if not summary:
                 continue
 
             chat_list.append(ChatItemSchema(
                 room_id=room_id,
                 recipient=FriendSchema.model_validate(recipient),
-                last_message=msg.text if msg else None,
-                last_message_time=msg.created_at if msg else None,
+                last_message=summary.last_message,
+                last_message_time=summary.last_message_time,
+                last_sender_id=summary.last_sender_id,
+                message_count=summary.message_count,
+                unread_count=unread_counts.get(room_id, 0),
             ))
 
         chat_list.sort(key=lambda chat: chat.last_message_time or datetime.min, reverse=True)
 
         return chat_list
 
+    async def increment_unread(self, user_id: int, room_id: int) -> Optional[int]:
+        """
+        Counts a new message in a room as unread by the user.
+        Returns the new unread count, or None if the count is not known yet.
+        """
+        return await unread_counters.increment(user_id, room_id)
+
+    async def mark_read(self, user_id: int, room_id: int, read_seq: int) -> int:
+        """
+        Marks the messages of a room up to the given sequence number as read by the user
+        and checkpoints the position. Returns the number of messages left unread.
+        The count starts from the stored checkpoint, so a receipt arriving after a later one
+        does not bring back messages that were already read.
+        """
+        read_seq = await self.read_state_repository.set_read_seq(user_id, room_id, read_seq)
+
+        state = (await self.room_state_repository.get_states([room_id])).get(room_id)
+        unread = 0
+        if state and state.seq > read_seq:
+            unread = (await self._count_unread(user_id, {room_id: read_seq}))[room_id]
+
+        await unread_counters.set(user_id, {room_id: unread})
+        return unread
+
+    async def get_unread_counts(self, user_id: int, room_ids: list[int]) -> dict[int, int]:
+        """
+        Returns the unread counts of a user by room ID.
+        Counts missing from Redis are computed once from the read checkpoints, all rooms together.
+        """
+        counts = await unread_counters.get(user_id, room_ids)
+
+        missing = [room_id for room_id in room_ids if room_id not in counts]
+        if missing:
+            metrics.incr("unread.rebuilds", len(missing))
+            read_seqs = await self.read_state_repository.get_read_seqs(user_id, missing)
+            rebuilt = await self._count_unread(
+                user_id, {room_id: read_seqs.get(room_id, 0) for room_id in missing}
+            )
+            await unread_counters.set(user_id, rebuilt)
+            counts.update(rebuilt)
+
+        return counts
+
+    async def get_room_summaries(self, room_ids: list[int]) -> dict[int, RoomState]:
+        """
+        Returns the summaries of the given rooms that have at least one message.
+        Rooms without a summary or a message count yet are counted once and backfilled.
+        """
+        states = await self.room_state_repository.get_states(room_ids)
+        summaries = {room_id: state for room_id, state in states.items() if state.last_message_time}
+
+        missing = [room_id for room_id in room_ids if room_id not in summaries]
+        if missing:
+            metrics.incr("chat_list.summary_backfills", len(missing))
+            last_messages = await self.message_repository.get_last_messages_for_rooms(missing)
+
+            for room_id, message in last_messages.items():
+                state = states.get(room_id) or RoomState(room_id=room_id)
+                message_count = await self._count_messages(room_id, state)
+                summary = {"text": message.text, "created_at": message.created_at, "user_id": message.user_id}
+                await self.room_state_repository.backfill_summary(room_id, summary, message_count)
+
+                state.last_message = message.text
+                state.last_message_time = message.created_at
+                state.last_sender_id = message.user_id
+                state.message_count = message_count
+                summaries[room_id] = state
+
+        uncounted = [state for state in summaries.values() if state.message_count is None]
+        if uncounted:
+            metrics.incr("chat_list.count_backfills", len(uncounted))
+            for state in uncounted:
+                message_count = await self._count_messages(state.room_id, state)
+                # A room that changed while it was counted is counted again on the next read.
+                if await self.room_state_repository.set_message_count(state.room_id, message_count, state):
+                    state.message_count = message_count
+
+        return summaries
+
+    async def _count_messages(self, room_id: int, state: RoomState) -> int:
+        """
+        Counts the messages of a room as of the given state: the numbered ones that were
+        not trimmed, including those still in the write-behind buffer, and the unnumbered ones.
+        """
+        unnumbered = await self.message_repository.get_unnumbered_count(room_id)
+        return unnumbered + state.seq - state.trimmed_seq
+
 
 
@@ -0,0 +1,181 @@
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Optional
+
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.json_codec import codec
+from app.infrastructure.utils.metrics import metrics
+from app.infrastructure.utils.redis_utils.redis_utils import RedisUtils, redis_utils
+
+INVALIDATION_CHANNEL = "chat:history:invalidate"
+
+
+class LocalHistory:
+    """
+        Room history held in process: encoded messages (newest first),
+        the sequence number of the newest one and the encoded latest page.
+    """
+
+    __slots__ = ("messages", "head_seq", "page")
+
+    def __init__(self, messages: list[str], size: int):
+        self.messages: deque[str] = deque(messages, maxlen=size)
+        self.head_seq: Optional[int] = codec.loads(messages[0]).get("seq") if messages else None
+        self.page: Optional[tuple[int, str]] = None
+
+
+class HistoryCache:
+    """
+        Two-tier cache of the latest messages of each room.
+
+        L2 is a write-through window in Redis: every sent message is appended to the cached
+        window of its room, which is trimmed to `history_cache_size` entries instead of being deleted.
+        A room stays cached while it is read or written within `history_cache_ttl` seconds, and the
+        least recently used rooms are evicted once more than `history_cache_max_rooms` rooms are cached.
+
+        L1 is a bounded in-process LRU of the rooms hosted by this worker. It is kept current by the
+        messages the worker receives through its pub/sub listener, dropped when the room is no longer
+        hosted and invalidated across workers through INVALIDATION_CHANNEL.
+    """
+
+    def __init__(self, redis: RedisUtils):
+        self.redis_utils = redis
+        self.size = settings.history_cache_size
+        self.ttl = settings.history_cache_ttl
+        self.max_rooms = settings.history_cache_max_rooms
+        self.max_local_rooms = settings.history_local_cache_max_rooms
+        self._local: OrderedDict[int, LocalHistory] = OrderedDict()
+
+        metrics.gauge("history_cache.hit_rate", self.hit_rate)
+        metrics.gauge("history_cache.local_rooms", lambda: len(self._local))
+
+    @staticmethod
+    def hit_rate() -> float:
+        hits = metrics.counter("history_cache.local_hits") + metrics.counter("history_cache.hits")
+        total = hits + metrics.counter("history_cache.misses")
+        return hits / total if total else 0.0
+
+    async def get(self, room_id: int, count: Optional[int] = None) -> Optional[list[str]]:
+        """
+            Returns up to `count` of the newest cached messages as encoded JSON strings,
+            newest first, or None if the room is not cached.
+        """
+        local = await self._get_local(room_id)
+        if local is None:
+            return None
+        return list(islice(local.messages, count))
+
+    async def get_page(self, room_id: int, count: int) -> Optional[str]:
+        """
+            Returns the newest `count` cached messages as an encoded JSON array (oldest first),
+            or None if the room is not cached. The encoded page is reused until the room changes.
+        """
+        local = await self._get_local(room_id)
+        if local is None:
+            return None
+
+        if local.page is None or local.page[0] != count:
+            # Cached entries are already encoded, so the page is assembled without decoding them.
+            local.page = (count, "[" + ",".join(reversed(list(islice(local.messages, count)))) + "]")
+        return local.page[1]
+
+    async def _get_local(self, room_id: int) -> Optional[LocalHistory]:
+        local = self._local.get(room_id)
+        if local is not None:
+            self._local.move_to_end(room_id)
+            metrics.incr("history_cache.local_hits")
+            return local
+
+        try:
+            messages = await self.redis_utils.get_raw_messages_list(room_id, ttl=self.ttl)
+        except Exception:
+            messages = None
+
+        if not messages:
+            metrics.incr("history_cache.misses")
+            return None
+
+        metrics.incr("history_cache.hits")
+        return self._store_local(room_id, messages)
+
+    def _store_local(self, room_id: int, messages: list[str]) -> LocalHistory:
+        local = LocalHistory(messages, self.size)
+        self._local[room_id] = local
+        self._local.move_to_end(room_id)
+        while len(self._local) > self.max_local_rooms:
+            self._local.popitem(last=False)
+        return local
+
+    async def fill(self, room_id: int, messages: list[dict]) -> None:
+        """
+            Caches the latest messages of a room (oldest first) after a miss.
+        """
+        encoded = [codec.dumps(message) for message in messages[-self.size:]]
+        try:
+            await self.redis_utils.fill_message_list(room_id, encoded, self.size, self.ttl)
+            evicted = await self.redis_utils.evict_message_lists(self.max_rooms)
+        except Exception:
+            return
+
+        metrics.incr("history_cache.evictions", evicted)
+        if encoded:
+            self._store_local(room_id, list(reversed(encoded)))
+
+    async def append(self, room_id: int, message: str, seq: Optional[int]) -> None:
+        """
+            Appends an encoded message to the Redis window of a room, if the room is cached there.
+            The in-process tier is updated by the listener when the message comes back through pub/sub.
+        """
+        try:
+            result = await self.redis_utils.append_message_to_list(room_id, message, seq, self.size, self.ttl)
+        except Exception:
+            return
+
+        if result < 0:
+            metrics.incr("history_cache.invalidations")
+            await self.redis_utils.publish(INVALIDATION_CHANNEL, str(room_id))
+
+    async def invalidate(self, room_id: int) -> None:
+        """
+            Drops the cached history of a room in Redis and in every worker.
+        """
+        await self.redis_utils.delete_all_messages(room_id)
+        await self.redis_utils.publish(INVALIDATION_CHANNEL, str(room_id))
+
+    def apply_local(self, room_id: int, message: str) -> None:
+        """
+            Adds a message received through pub/sub to the in-process history of its room.
+            The room is dropped instead if the message does not directly follow the newest one.
+        """
+        local = self._local.get(room_id)
+        if local is None:
+            return
+
+        try:
+            seq = codec.loads(message).get("seq")
+        except ValueError:
+            seq = None
+
+        if seq is not None and local.head_seq is not None and seq != local.head_seq + 1:
+            if seq > local.head_seq:
+                self.discard_local(room_id)
+            return
+
+        local.messages.appendleft(message)
+        local.head_seq = seq
+        local.page = None
+
+    def discard_local(self, room_id: int) -> None:
+        """
+            Drops the in-process history of a room.
+        """
+        self._local.pop(room_id, None)
+
+    def clear_local(self) -> None:
+        """
+            Drops the in-process history of all rooms, e.g. after pub/sub messages may have been missed.
+        """
+        self._local.clear()
+
+
+history_cache = HistoryCache(redis_utils)
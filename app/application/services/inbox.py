@@ -0,0 +1,102 @@
+from datetime import datetime
+from typing import Optional
+
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.redis_utils.redis_utils import RedisUtils, redis_utils
+
+
+class Inbox:
+    """
+        Per-user index of chats ordered by last activity, kept in Redis sorted sets,
+        with a version counter and a change log used to sync chat lists incrementally.
+
+        Members are "<room_id>:<partner_id>" scored by the time of the last message of the room,
+        so a page of the chat list is read without loading the rooms of the user.
+        An inbox is complete only once it has been built from the database, which is
+        tracked by a separate marker key because an empty sorted set cannot be stored.
+    """
+
+    def __init__(self, redis_utils: RedisUtils):
+        self.redis_utils = redis_utils
+        self.ttl = settings.inbox_ttl
+
+    async def touch(self, room_id: int, user_id: int, partner_id: int, time: datetime) -> None:
+        """
+            Moves the room to the top of the inboxes of both participants.
+        """
+        await self.redis_utils.add_to_inboxes(
+            {user_id: f"{room_id}:{partner_id}", partner_id: f"{room_id}:{user_id}"},
+            time.timestamp(),
+            self.ttl,
+        )
+
+    async def fill(self, user_id: int, rooms: list[tuple[int, int, datetime]]) -> None:
+        """
+            Stores the complete inbox of a user from (room_id, partner_id, last message time) tuples.
+        """
+        members = {f"{room_id}:{partner_id}": time.timestamp() for room_id, partner_id, time in rooms}
+        await self.redis_utils.fill_inbox(user_id, members, self.ttl)
+
+    async def is_ready(self, user_id: int) -> bool:
+        return await self.redis_utils.inbox_ready(user_id)
+
+    async def get_page(
+            self,
+            user_id: int,
+            limit: int,
+            cursor: Optional[str] = None
+    ) -> tuple[list[tuple[int, int]], Optional[str]]:
+        """
+            Returns (room_id, partner_id) pairs of the chats of a user that come after the cursor,
+            most recent first, and the cursor of the next page (None on the last page).
+            A cursor is the "<score>:<member>" position of the last chat of a page, so chats
+            active at the same time are neither skipped nor repeated across pages.
+            Raises ValueError for a malformed cursor.
+        """
+        members = await self.redis_utils.get_inbox_page(user_id, limit, self._parse_cursor(cursor), self.ttl)
+
+        rooms = []
+        for member, _ in members:
+            room_id, partner_id = member.split(":")
+            rooms.append((int(room_id), int(partner_id)))
+
+        next_cursor = None
+        if len(members) == limit:
+            member, score = members[-1]
+            next_cursor = f"{score!r}:{member}"
+        return rooms, next_cursor
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Optional[tuple[float, str]]:
+        if cursor is None:
+            return None
+        score, member = cursor.split(":", 1)
+        return float(score), member
+
+    async def bump_version(self, user_id: int, room_id: int, partner_id: int) -> int:
+        """
+            Records a change of a chat in the chat list of a user. Returns the new version.
+        """
+        version, _ = await self.redis_utils.chat_list_version(user_id, self.ttl, f"{room_id}:{partner_id}")
+        return version
+
+    async def get_version(self, user_id: int) -> tuple[int, int]:
+        """
+            Returns the chat list version of a user and the oldest version changes are known since.
+        """
+        return await self.redis_utils.chat_list_version(user_id, self.ttl)
+
+    async def get_changes(self, user_id: int, since: int, limit: int) -> list[tuple[int, int]]:
+        """
+            Returns (room_id, partner_id) pairs of the chats changed after version `since`,
+            at most `limit` of them.
+        """
+        members = await self.redis_utils.get_chat_list_changes(user_id, since, limit)
+        rooms = []
+        for member in members:
+            room_id, partner_id = member.split(":")
+            rooms.append((int(room_id), int(partner_id)))
+        return rooms
+
+
+inbox = Inbox(redis_utils)
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+from typing import Optional
+
+from app.api.schemas.chat import RoomSchema
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.json_codec import codec
+from app.infrastructure.utils.metrics import metrics
+from app.infrastructure.utils.redis_utils.redis_utils import RedisUtils, redis_utils
+
+
+class RoomCache:
+    """
+        Cache of the room of each pair of users, keyed by the canonical pair (min_id, max_id).
+
+        Rooms are never deleted or moved to another pair while the application runs, so entries need
+        no invalidation, except after a maintenance such as merging duplicate rooms (see `invalidate`).
+        L1 is a bounded in-process LRU, L2 a Redis key per pair that lives `room_cache_ttl` seconds.
+    """
+
+    def __init__(self, redis: RedisUtils):
+        self.redis_utils = redis
+        self.ttl = settings.room_cache_ttl
+        self.max_entries = settings.room_cache_max_entries
+        self._local: OrderedDict[tuple[int, int], RoomSchema] = OrderedDict()
+
+        metrics.gauge("room_cache.entries", lambda: len(self._local))
+
+    @staticmethod
+    def pair(user_id: int, other_user_id: int) -> tuple[int, int]:
+        return min(user_id, other_user_id), max(user_id, other_user_id)
+
+    @staticmethod
+    def _key(pair: tuple[int, int]) -> str:
+        return f"chat:room_pair:{pair[0]}:{pair[1]}"
+
+    async def get(self, user_id: int, other_user_id: int) -> Optional[RoomSchema]:
+        """
+            Returns the cached room of two users, or None.
+        """
+        pair = self.pair(user_id, other_user_id)
+        room = self._local.get(pair)
+        if room is not None:
+            self._local.move_to_end(pair)
+            metrics.incr("room_cache.local_hits")
+            return room
+
+        try:
+            data = await self.redis_utils.get(self._key(pair))
+        except Exception:
+            data = None
+
+        if data is None:
+            metrics.incr("room_cache.misses")
+            return None
+
+        metrics.incr("room_cache.hits")
+        room = RoomSchema.model_validate(codec.loads(data))
+        self._store_local(pair, room)
+        return room
+
+    async def set(self, room: RoomSchema) -> None:
+        """
+            Caches the room of its pair of users.
+        """
+        pair = self.pair(room.sender_id, room.recipient_id)
+        self._store_local(pair, room)
+        try:
+            await self.redis_utils.set(self._key(pair), codec.dumps(room.model_dump()), expire=self.ttl)
+        except Exception:
+            pass
+
+    async def invalidate(self, user_id: int, other_user_id: int) -> None:
+        """
+            Drops the cached room of two users in this process and in Redis.
+        """
+        pair = self.pair(user_id, other_user_id)
+        self._local.pop(pair, None)
+        await self.redis_utils.delete(self._key(pair))
+
+    def _store_local(self, pair: tuple[int, int], room: RoomSchema) -> None:
+        self._local[pair] = room
+        self._local.move_to_end(pair)
+        while len(self._local) > self.max_entries:
+            self._local.popitem(last=False)
+
+
+room_cache = RoomCache(redis_utils)
@@ -0,0 +1,48 @@
+from typing import Optional
+
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.redis_utils.redis_utils import RedisUtils, redis_utils
+
+
+class UnreadCounters:
+    """
+        Unread message counters per (user, room), kept in one Redis hash per user.
+
+        A counter is only incremented once it is known, i.e. it has been reset by a read
+        or computed from the read checkpoint in the database. An unset counter is never
+        mistaken for zero after the hash has expired or Redis has lost it.
+    """
+
+    def __init__(self, redis_utils: RedisUtils):
+        self.redis_utils = redis_utils
+        self.ttl = settings.unread_ttl
+
+    @staticmethod
+    def _key(user_id: int) -> str:
+        return f"chat:user:{user_id}:unread"
+
+    async def increment(self, user_id: int, room_id: int) -> Optional[int]:
+        """
+            Counts a new unread message. Returns the new counter, or None if it is not known.
+        """
+        return await self.redis_utils.increment_hash_field(self._key(user_id), str(room_id), self.ttl)
+
+    async def set(self, user_id: int, counts: dict[int, int]) -> None:
+        """
+            Sets the counters of a user by room ID.
+        """
+        await self.redis_utils.set_hash_fields(
+            self._key(user_id),
+            {str(room_id): count for room_id, count in counts.items()},
+            self.ttl,
+        )
+
+    async def get(self, user_id: int, room_ids: list[int]) -> dict[int, int]:
+        """
+            Returns the known counters of a user by room ID. Unknown counters are left out.
+        """
+        values = await self.redis_utils.get_hash_fields(self._key(user_id), [str(room_id) for room_id in room_ids])
+        return {room_id: int(value) for room_id, value in zip(room_ids, values) if value is not None}
+
+
+unread_counters = UnreadCounters(redis_utils)
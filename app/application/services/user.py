@@ -1,9 +1,12 @@
-from typing import Optional, Dict, Any, Sequence
+from typing import Optional, Dict, Any, Sequence, Tuple
 
 from app.infrastructure.repositories.relational.user import UserRepository
 from app.application.unit_of_work.unit_of_work import UnitOfWork
 from ..exceptions import EmailAlreadyExistsException, UsernameAlreadyExistsException
 from app.api.schemas.users import UserRead, FriendSchema, UserReadPrivate
+from app.application.services.auth.token_cache import token_cache
+from app.infrastructure.utils.batch_loader import BatchLoader
+from app.infrastructure.utils.single_flight import single_flight
 
 
 class UserService:
@@ -15,24 +18,75 @@ class UserService:
     def __init__(self, uow: UnitOfWork):
         """
             Initializes the UserService with a UnitOfWork instance.
-            Configures the user repository for interacting with user data.
+            Configures the user repository for interacting with user data
+            and the loaders batching user lookups for the lifetime of the service.
         """
         self.uow = uow
         self.uow.set_repository('user', UserRepository)
+        self.users_by_id: BatchLoader[int, UserRead] = BatchLoader(self._load_users_by_id, name="user_loader.id")
+        self.users_by_email: BatchLoader[str, UserRead] = BatchLoader(
+            self._load_users_by_email,
+            name="user_loader.email"
+        )
 
+    def fork(self) -> "UserService":
+        """
+            Returns a user service on a fork of the unit of work, with its own loaders,
+            for lookups that run concurrently with the ones of this service.
+        """
+        return UserService(self.uow.fork())
+
+    async def load_user(self, user_id: int) -> Optional[UserRead]:
+        """
+            Retrieves a user with their profile by ID.
+            Lookups made in the same event loop tick are loaded with one query and cached
+            for the lifetime of the service.
+        """
+        return await self.users_by_id.load(user_id)
+
+    async def load_users(self, user_ids: list[int]) -> list[UserRead]:
+        """
+            Retrieves the found users with their profiles by ID, through the same batching and cache.
+        """
+        users = await self.users_by_id.load_many(user_ids)
+        return [user for user in users if user is not None]
+
+    async def load_user_by_email(self, email: str) -> Optional[UserRead]:
+        """
+            Retrieves a user with their profile by email, batched and cached like `load_user`.
+        """
+        return await self.users_by_email.load(email)
+
+    async def _load_users_by_id(self, user_ids: list[int]) -> dict[int, UserRead]:
+        users = await self.get_users_with_profiles(user_ids)
+        for user in users:
+            self.users_by_email.prime(user.email, user)
+        return {user.id: user for user in users}
+
+    async def _load_users_by_email(self, emails: list[str]) -> dict[str, UserRead]:
+        async with self.uow.read_only():
+            users = await self.uow.user.get_users_by_emails(emails)
+            users = [UserRead.model_validate(user) for user in users]
+
+        for user in users:
+            self.users_by_id.prime(user.id, user)
+        return {user.email: user for user in users}
+
+    @single_flight
     async def get_user_with_profile(self, user_id: int) -> Optional[UserRead]:
         """
             Retrieves a user along with their profile information.
         """
-        async with self.uow:
+        async with self.uow.read_only():
             user = await self.uow.user.get_user_with_profile(user_id)
             return UserRead.model_validate(user)
 
+    @single_flight
     async def get_user_profile(self, user_id: int) -> Optional[UserRead]:
         """
             Retrieves the profile information for a specific user.
         """
-        async with self.uow:
+        async with self.uow.read_only():
             profile = await self.uow.user.get_user_profile(user_id)
             return UserRead.model_validate(profile)
 
@@ -43,52 +97,127 @@ class UserService:
         async with self.uow:
             await self.uow.user.update_user_profile(user_id, update_data)
 
+        await self._forget_user(user_id)
+
+    @single_flight
     async def get_user_by_id(self, user_id: int) -> Optional[UserRead]:
         """
             Retrieves a user by their ID.
         """
-        async with self.uow:
+        async with self.uow.read_only():
             user = await self.uow.user.get_by_id(user_id)
             return UserRead.model_validate(user)
 
+    @single_flight
     async def get_user_by_email(self, email: str) -> Optional[UserRead]:
         """
            Retrieves a user by their email.
        """
-        async with self.uow:
+        async with self.uow.read_only():
             user = await self.uow.user.get_user_by_email(email)
             return UserRead.model_validate(user)
 
+    @single_flight
     async def get_user_by_email_private(self, email: str) -> Optional[UserReadPrivate]:
-        async with self.uow:
+        async with self.uow.read_only():
             user = await self.uow.user.get_user_by_email(email)
             if user:
                 return UserReadPrivate.model_validate(user)
             return None
 
-    async def find_users_by_username(self, username_substring: str, page: int, limit: int) -> Sequence[FriendSchema]:
+    @single_flight
+    async def find_users_by_username(
+            self,
+            username_substring: str,
+            limit: int,
+            after_score: Optional[int] = None,
+            after_id: Optional[int] = None
+    ) -> Tuple[Sequence[FriendSchema], Optional[Tuple[int, int]]]:
         """
-            Finds users by a partial username.
+            Finds users by a partial username, exact and prefix matches first.
+            Returns a page of users and the (score, id) position of the next page,
+            or None on the last page.
         """
-        async with self.uow:
-            users = await self.uow.user.find_users_by_username(username_substring, page, limit)
-            return [FriendSchema.model_validate(user) for user in users]
+        async with self.uow.read_only():
+            rows = await self.uow.user.find_users_by_username(username_substring, limit, after_score, after_id)
+            users = [FriendSchema.model_validate(user) for user, _ in rows]
+
+        next_position = None
+        if len(rows) == limit:
+            last_user, last_score = rows[-1]
+            next_position = (last_score, last_user.id)
+
+        return users, next_position
 
-    async def get_user_friends(self, user_id: int, page: int, limit: int, paginated: bool) -> Sequence[FriendSchema]:
+    @single_flight
+    async def get_user_friends(
+            self,
+            user_id: int,
+            limit: int,
+            after_id: Optional[int] = None
+    ) -> Tuple[Sequence[FriendSchema], Optional[int]]:
         """
-           Retrieves a user's friends.
+           Retrieves a page of a user's friends ordered by ID, starting after `after_id`.
+           Returns the friends and the ID to continue from, or None on the last page.
        """
-        async with self.uow:
-            friends = await self.uow.user.user_friends(user_id, page, limit, paginated)
-            return [FriendSchema.model_validate(friend) for friend in friends]
+        async with self.uow.read_only():
+            friends = await self.uow.user.user_friends(user_id, limit, after_id)
+            friends = [FriendSchema.model_validate(friend) for friend in friends]
+
+        next_after_id = friends[-1].id if len(friends) == limit else None
+        return friends, next_after_id
 
+    async def get_random_friends(self, user_id: int, size: int = 3) -> Sequence[FriendSchema]:
+        """
+           Retrieves a random sample of a user's friends.
+       """
+        async with self.uow.read_only():
+            friends = await self.uow.user.random_friends(user_id, size)
+            return [FriendSchema.model_validate(friend) for friend in friends]
 
-    async def add_user_friend(self, friend_id: int, user_id: int) -> None:
+    async def add_user_friend(self, friend_id: int, user_id: int) -> bool:
         """
             Adds a user to the current user's friend list.
+            Returns False if the user was already a friend or does not exist.
         """
         async with self.uow:
-            await self.uow.user.add_user_friend(friend_id, user_id)
+            added = await self.uow.user.add_user_friend(friend_id, user_id)
+
+        if added:
+            await self._forget_user(user_id)
+        return added
+
+    async def remove_user_friend(self, friend_id: int, user_id: int) -> bool:
+        """
+            Removes a user from the current user's friend list.
+            Returns False if the user was not a friend.
+        """
+        async with self.uow:
+            removed = await self.uow.user.remove_user_friend(friend_id, user_id)
+
+        if removed:
+            await self._forget_user(user_id)
+        return removed
+
+    async def reconcile_friends_counts(self) -> list[int]:
+        """
+            Repairs the friend counters that drifted from the friend lists.
+            Returns the IDs of the repaired users.
+        """
+        async with self.uow:
+            user_ids = await self.uow.user.reconcile_friends_counts()
+
+        for user_id in user_ids:
+            await self._forget_user(user_id)
+        return user_ids
+
+    async def _forget_user(self, user_id: int) -> None:
+        """
+            Drops the cached copies of a user that has changed, including its friend counter.
+        """
+        self.users_by_id.clear()
+        self.users_by_email.clear()
+        await token_cache.invalidate_user(user_id)
 
     async def register_user(self, user_data: Dict[str, Any]) -> None:
         """
@@ -110,7 +239,7 @@ class UserService:
         """
             Checks if a user is a friend of another user.
         """
-        async with self.uow:
+        async with self.uow.read_only():
             is_friend = await self.uow.user.check_user_in_friend(user_id, friend_id)
             return is_friend
 
@@ -118,12 +247,13 @@ class UserService:
         """
             Retrieves the count of a user's friends.
         """
-        async with self.uow:
+        async with self.uow.read_only():
             count = await self.uow.user.get_user_friends_count(user_id)
             return count
 
+    @single_flight
     async def get_users_with_profiles(self, user_ids: list[int]) -> list[UserRead]:
-        async with self.uow:
+        async with self.uow.read_only():
             users = await self.uow.user.get_users_with_profiles(user_ids)
             return [UserRead.model_validate(user) for user in users]
 
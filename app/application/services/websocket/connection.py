@@ -0,0 +1,89 @@
+import asyncio
+from typing import Literal, Optional
+
+from fastapi import WebSocket
+
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.metrics import metrics
+
+
+class WebsocketConnection:
+    """
+        Wraps a WebSocket with a bounded outbound queue drained by its own writer task.
+
+        Payloads are already encoded JSON strings, so a broadcast is serialized once
+        regardless of the number of recipients.
+        Sending only enqueues the payload, so a stalled client never delays other recipients.
+        When the queue overflows, the connection is either closed (policy "disconnect")
+        or the payload is discarded for this client (policy "drop").
+    """
+
+    def __init__(
+            self,
+            websocket: WebSocket,
+            max_queue_size: int = settings.ws_send_queue_size,
+            overflow_policy: Literal["disconnect", "drop"] = settings.ws_overflow_policy,
+    ):
+        self.websocket = websocket
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.overflow_policy = overflow_policy
+        self.closed = False
+        self._writer: Optional[asyncio.Task] = None
+        self._closer: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        """
+            Starts the writer task. Payloads enqueued before the start are sent first.
+        """
+        if self._writer is None and not self.closed:
+            self._writer = asyncio.create_task(self._write_loop())
+
+    def send(self, payload: str) -> bool:
+        """
+            Enqueues a payload without waiting.
+            Returns False if the connection is closed or has just been evicted.
+        """
+        if self.closed:
+            return False
+
+        try:
+            self.queue.put_nowait(payload)
+        except asyncio.QueueFull:
+            if self.overflow_policy == "drop":
+                metrics.incr("ws.messages_dropped")
+                return True
+
+            metrics.incr("ws.evictions")
+            self.close(code=1013)
+            return False
+
+        return True
+
+    def close(self, code: Optional[int] = None) -> None:
+        """
+            Stops the writer task. If a code is given, the socket is also closed with it.
+        """
+        if self.closed:
+            return
+
+        self.closed = True
+        if self._writer:
+            self._writer.cancel()
+        if code is not None:
+            self._closer = asyncio.create_task(self._close_socket(code))
+
+    async def _write_loop(self) -> None:
+        try:
+            while True:
+                payload = await self.queue.get()
+                await self.websocket.send_text(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.closed = True
+
+    async def _close_socket(self, code: int) -> None:
+        try:
+            await self.websocket.close(code=code)
+        except Exception:
+            pass
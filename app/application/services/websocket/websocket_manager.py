@@ -1,14 +1,45 @@
-from typing import Tuple, List, Optional
+import asyncio
+import time
+from datetime import datetime
+from typing import Awaitable, Tuple, Optional, TypeVar
 
 from fastapi import WebSocket, HTTPException
 
-from app.api.schemas.chat import ChatItemSchema
+from app.api.schemas.chat import ChatItemSchema, HistoryRequestSchema
 from app.api.schemas.users import UserRead, FriendSchema
 from app.application.services.auth.auth_manager import AuthManager
+from app.application.services.history_cache import HistoryCache, history_cache
+from app.application.services.inbox import inbox
+from app.application.services.websocket.connection import WebsocketConnection
+from app.infrastructure.models.nosql.messages import Message
 from app.infrastructure.models.relational.rooms import Room
 from app.application.services.chat import ChatService
 from app.application.services.user import UserService
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.json_codec import codec
+from app.infrastructure.utils.metrics import metrics
 from app.infrastructure.utils.redis_utils.redis_utils import RedisUtils, redis_utils
+from app.infrastructure.utils.single_flight import SingleFlight
+
+
+T = TypeVar("T")
+
+
+async def _timed(step: str, awaitable: Awaitable[T]) -> T:
+    """Awaits one step of the connect handshake and records its duration."""
+    with metrics.timer(f"ws.connect.{step}"):
+        return await awaitable
+
+
+def room_channel(room_id: int) -> str:
+    """Pub/sub channel with the messages of a room."""
+    return f"chat:room:{room_id}:channel"
+
+
+def user_channel(user_id: int) -> str:
+    """Pub/sub channel with the chat list updates of a user."""
+    return f"chat:user:{user_id}:channel"
+
 
 class WebsocketManager:
     """
@@ -16,10 +47,20 @@ class WebsocketManager:
         sending messages in the chat, and caching messages in Redis.
     """
 
-    def __init__(self, redis: RedisUtils):
+    def __init__(self, redis: RedisUtils, cache: HistoryCache):
         self.redis_utils = redis
-        self.rooms: dict[int, dict[str, list[WebSocket]]] = {}
-        self.chat_listeners: list[WebSocket] = []
+        self.history_cache = cache
+        self._history_fills = SingleFlight("history_cache.fill")
+        self.rooms: dict[int, dict[WebSocket, WebsocketConnection]] = {}
+        self.chat_listeners: dict[int, dict[WebSocket, WebsocketConnection]] = {}
+
+        metrics.gauge("ws.connections", lambda: len(self._all_connections()))
+        metrics.gauge("ws.queue_depth.total", lambda: sum(c.queue.qsize() for c in self._all_connections()))
+        metrics.gauge("ws.queue_depth.max", lambda: max((c.queue.qsize() for c in self._all_connections()), default=0))
+
+    def _all_connections(self) -> list[WebsocketConnection]:
+        groups = list(self.rooms.values()) + list(self.chat_listeners.values())
+        return [connection for group in groups for connection in group.values()]
 
     async def connect_chat_list(
             self,
@@ -36,39 +77,63 @@ class WebsocketManager:
             await websocket.close(code=1008)
             return
 
-        self.chat_listeners.append(websocket)
+        connection = WebsocketConnection(websocket)
+        if user.id not in self.chat_listeners:
+            self.chat_listeners[user.id] = {}
+            await self.redis_utils.subscribe_channel(user_channel(user.id))
+        self.chat_listeners[user.id][websocket] = connection
+        connection.start()
         return user
 
-    async def broadcast_to_room(self, room_id: int, payload: dict):
-        """Sending a message to everyone in the room"""
-        connections = self.rooms.get(room_id, {}).get("connections", [])
+    async def disconnect_chat_list(self, user_id: int, websocket: WebSocket) -> None:
+        """
+            Removes a chat list connection. When the last connection of the user is gone,
+            the worker unsubscribes from the user's channel.
+        """
+        connections = self.chat_listeners.get(user_id)
+        if connections is None:
+            return
+
+        connection = connections.pop(websocket, None)
+        if connection:
+            connection.close()
         if not connections:
-            await self.delete_room(room_id)
+            del self.chat_listeners[user_id]
+            await self.redis_utils.unsubscribe_channel(user_channel(user_id))
+
+    async def disconnect(self, room_id: int, websocket: WebSocket) -> None:
+        """Removes a room connection and deletes the room once the last one is gone."""
+        connections = self.rooms.get(room_id)
+        if connections is None:
             return
 
-        dead = []
-        for ws in connections:
-            try:
-                await ws.send_json(payload)
-            except Exception:
-                dead.append(ws)
-        for ws in dead:
-            connections.remove(ws)
+        connection = connections.pop(websocket, None)
+        if connection:
+            connection.close()
+        if not connections:
+            await self.delete_room(room_id)
 
+    async def broadcast_to_room(self, room_id: int, payload: str):
+        """
+            Enqueues an encoded message for everyone in the room.
+            Connections that are closed or overflowed their queue are removed.
+        """
+        connections = self.rooms.get(room_id)
         if not connections:
             await self.delete_room(room_id)
+            return
 
-    async def broadcast_chat_update(self, payload: dict):
-        """Sending chat list updates"""
-        dead = []
-        for ws in self.chat_listeners:
-            try:
-                await ws.send_json(payload)
-            except Exception:
-                dead.append(ws)
+        dead = [ws for ws, connection in connections.items() if not connection.send(payload)]
         for ws in dead:
-            self.chat_listeners.remove(ws)
+            await self.disconnect(room_id, ws)
+
+    async def broadcast_chat_update(self, user_id: int, payload: str):
+        """Enqueues an encoded chat list update for the chat list connections of one user"""
+        connections = self.chat_listeners.get(user_id, {})
 
+        dead = [ws for ws, connection in connections.items() if not connection.send(payload)]
+        for ws in dead:
+            await self.disconnect_chat_list(user_id, ws)
 
     async def connect(
             self,
@@ -76,54 +141,186 @@ class WebsocketManager:
             user_id_recipient: int,
             chat_service: ChatService,
             user_service: UserService,
-            auth_manager: AuthManager
-    ) -> Optional[Tuple[List[WebSocket], Room, UserRead, UserRead]]:
+            auth_manager: AuthManager,
+            last_seq: Optional[int] = None,
+    ) -> Optional[Tuple[Room, UserRead, UserRead]]:
 
         """
             Establishes a WebSocket connection, authenticates the user with a token,
             finds or creates a chat room, and sends the message history from Redis or a database using Redis pub/sub.
+            A reconnecting client passes the last sequence number it has seen and receives only the missing messages,
+            or a "history_reset" frame with the latest page if it missed more than `history_reconnect_max_messages`.
+
+            The user is authenticated while the recipient is looked up on a unit of work of its own,
+            so the two queries do not take turns on the request session; the room needs both
+            and the history needs the room. Every step is timed as ws.connect.<step>,
+            the whole handshake up to the history frame as ws.connect.handshake.
         """
 
         await websocket.accept()
+        access_token = await websocket.receive_text()
+        started = time.perf_counter()
 
+        auth = asyncio.create_task(_timed("auth", auth_manager.get_user(token=access_token)))
+        recipients = user_service.fork()
+        recipient_lookup = asyncio.create_task(_timed("recipient", recipients.load_user(user_id_recipient)))
         try:
-            access_token = await websocket.receive_text()
-            user = await auth_manager.get_user(token=access_token)
+            user, recipient = await asyncio.gather(auth, recipient_lookup)
         except HTTPException:
             await websocket.close(code=1008)
             return
+        finally:
+            auth.cancel()
+            recipient_lookup.cancel()
 
-        recipient = await user_service.get_user_with_profile(user_id_recipient)
         if not recipient:
             await websocket.close(code=1008)
             return
+        user_service.users_by_id.prime(recipient.id, recipient)
 
-        room = await chat_service.get_and_create_room_by_users(user.id, user_id_recipient)
+        room = await _timed("room", chat_service.get_and_create_room_by_users(user.id, user_id_recipient))
         room_id = room.id
-        room_data = self.rooms.setdefault(room_id, {"connections": []})
-        room_data["connections"].append(websocket)
 
-        try:
-            cached_messages = await self.redis_utils.get_messages_list(room_id)
-        except Exception:
-            cached_messages = None
+        # The writer starts only after the history is sent, so messages broadcast
+        # in the meantime are queued and delivered after it.
+        connection = WebsocketConnection(websocket)
+        if room_id not in self.rooms:
+            self.rooms[room_id] = {}
+            await self.redis_utils.subscribe_channel(room_channel(room_id))
+        self.rooms[room_id][websocket] = connection
 
-        if cached_messages:
-            await websocket.send_json(list(reversed(cached_messages)))
+        if last_seq is None:
+            history = await _timed("history", self._get_history(room_id, chat_service, user, recipient))
         else:
-            messages = await chat_service.get_messages_for_room(room_id)
-            message_list = [
-                {   "username": message.username,
-                    "text": message.text,
-                    "user_id": message.user_id,
-                    "avatarUrl": user.profile.avatar if message.user_id == user.id else recipient.profile.avatar
-                }
-                for message in messages
-            ]
-            await websocket.send_json(message_list)
-            await self.redis_utils.add_message_to_list(room_id, message_list)
-
-        return room_data["connections"], room, user, recipient
+            history = await _timed(
+                "history",
+                self._get_history_after(room_id, last_seq, chat_service, user, recipient),
+            )
+        await websocket.send_text(history)
+        metrics.observe("ws.connect.handshake", time.perf_counter() - started)
+
+        connection.start()
+        return room, user, recipient
+
+    async def _get_history(
+            self,
+            room_id: int,
+            chat_service: ChatService,
+            user: UserRead,
+            recipient: UserRead
+    ) -> str:
+        """
+            Returns the encoded latest page of the room history from the history cache,
+            filling the cache from the database on a miss.
+            Older pages are requested by the client with a "history" frame.
+        """
+        page_size = settings.history_page_size
+        cached_page = await self.history_cache.get_page(room_id, page_size)
+        if cached_page is not None:
+            return cached_page
+
+        # Sockets joining the same room at once share one database read and cache fill.
+        message_list = await self._history_fills.do(
+            room_id,
+            lambda: self._fill_history(room_id, chat_service, user, recipient)
+        )
+        return codec.dumps(message_list[-page_size:])
+
+    async def _fill_history(
+            self,
+            room_id: int,
+            chat_service: ChatService,
+            user: UserRead,
+            recipient: UserRead
+    ) -> list[dict]:
+        messages = await chat_service.get_messages_for_room(room_id)
+        message_list = [self._message_payload(message, user, recipient) for message in messages]
+        await self.history_cache.fill(room_id, message_list)
+        return message_list
+
+    async def _get_history_after(
+            self,
+            room_id: int,
+            last_seq: int,
+            chat_service: ChatService,
+            user: UserRead,
+            recipient: UserRead
+    ) -> str:
+        """
+            Returns the encoded messages stored after `last_seq`.
+            The Redis cache is used when it reaches back to `last_seq`, otherwise the database is queried.
+            If too many messages were missed, returns a "history_reset" frame with the latest page
+            instead, so the client reloads the history rather than showing it with a gap.
+        """
+        cached_messages = await self.history_cache.get(room_id) or []
+
+        missing = []
+        for raw_message in cached_messages:
+            seq = codec.loads(raw_message).get("seq")
+            if seq is None:
+                break
+            if seq <= last_seq:
+                return "[" + ",".join(reversed(missing)) + "]"
+            missing.append(raw_message)
+
+        max_messages = settings.history_reconnect_max_messages
+        messages = await chat_service.get_messages_after_seq(room_id, last_seq, max_messages + 1)
+        if len(messages) > max_messages:
+            metrics.incr("ws.reconnect.resets")
+            page = await self._get_history(room_id, chat_service, user, recipient)
+            return '{"type":"history_reset","messages":' + page + '}'
+
+        return codec.dumps([self._message_payload(message, user, recipient) for message in messages])
+
+    async def send_history_page(
+            self,
+            websocket: WebSocket,
+            room_id: int,
+            request: HistoryRequestSchema,
+            chat_service: ChatService,
+            user: UserRead,
+            recipient: UserRead
+    ) -> None:
+        """
+            Enqueues a page of messages older than the requested cursor.
+            The reply carries the cursor of the next older page in "next_before".
+        """
+        connection = self.rooms.get(room_id, {}).get(websocket)
+        if connection is None:
+            return
+
+        messages, next_before = await chat_service.get_messages_page(room_id, request.before, request.limit)
+        connection.send(codec.dumps({
+            "type": "history",
+            "messages": [self._message_payload(message, user, recipient) for message in messages],
+            "next_before": next_before.isoformat() if isinstance(next_before, datetime) else next_before
+        }))
+
+    @staticmethod
+    def parse_frame(raw_text: str) -> dict:
+        """
+            Parses an incoming chat frame.
+            JSON objects with a known "type" are commands, anything else is the text of a message.
+        """
+        if raw_text.startswith("{"):
+            try:
+                frame = codec.loads(raw_text)
+            except ValueError:
+                frame = None
+            if isinstance(frame, dict) and frame.get("type") in ("message", "history", "read"):
+                return frame
+        return {"type": "message", "text": raw_text}
+
+    @staticmethod
+    def _message_payload(message: Message, user: UserRead, recipient: UserRead) -> dict:
+        return {
+            "username": message.username,
+            "text": message.text,
+            "user_id": message.user_id,
+            "seq": message.seq,
+            "avatarUrl": user.profile.avatar if message.user_id == user.id else recipient.profile.avatar,
+            "type": "chat_message"
+        }
 
     async def send_message(
             self,
@@ -131,6 +328,7 @@ class WebsocketManager:
             chat_service: ChatService,
             room_id: int,
             sender: UserRead,
+            recipient: UserRead,
     ) -> None:
         """
             Sends a message to all users in the room, adds the message to Redis,
@@ -148,42 +346,70 @@ class WebsocketManager:
             "username": message.username,
             "text": message.text,
             "user_id": message.user_id,
+            "seq": message.seq,
             "avatarUrl": avatar_url,
             "type": "chat_message"
         }
 
-        chat_list_item = ChatItemSchema(
+        # The same encoded payload is broadcast and written through to the history cache.
+        encoded_message = codec.dumps(message_data)
+        await self.redis_utils.publish(room_channel(room_id), encoded_message)
+        await self.history_cache.append(room_id, encoded_message, message.seq)
+        await inbox.touch(room_id, sender.id, recipient.id, message.created_at)
+
+        unread_counts = {
+            recipient.id: await chat_service.increment_unread(recipient.id, room_id),
+            sender.id: None,
+        }
+
+        # Each participant sees the other one as the chat partner in their list.
+        for owner, partner in ((recipient, sender), (sender, recipient)):
+            chat_list_item = ChatItemSchema(
                 room_id=room_id,
-                recipient=FriendSchema.model_validate(sender),
+                recipient=FriendSchema.model_validate(partner),
                 last_message=message.text,
-                last_message_time=message.created_at
+                last_message_time=message.created_at,
+                last_sender_id=message.user_id,
+                unread_count=unread_counts[owner.id]
             ).model_dump(mode="json")
-        chat_list_item["type"] = "chat_update"
+            chat_list_item["type"] = "chat_update"
+            chat_list_item["version"] = await inbox.bump_version(owner.id, room_id, partner.id)
 
+            await self.redis_utils.publish(
+                user_channel(owner.id),
+                codec.dumps(chat_list_item)
+            )
+
+    async def mark_read(
+            self,
+            chat_service: ChatService,
+            room_id: int,
+            user: UserRead,
+            recipient: UserRead,
+            read_seq: int
+    ) -> None:
+        """
+            Marks the messages of a room up to `read_seq` as read by the user
+            and updates the unread count in the chat lists of the user.
+        """
+        unread = await chat_service.mark_read(user.id, room_id, read_seq)
+        version = await inbox.bump_version(user.id, room_id, recipient.id)
         await self.redis_utils.publish(
-            f"chat:room:{room_id}:channel",
-            message_data
-        )
-        await self.redis_utils.publish(
-            f"chat:room:{room_id}:channel",
-            chat_list_item
+            user_channel(user.id),
+            codec.dumps({"type": "chat_read", "room_id": room_id, "unread_count": unread, "version": version})
         )
 
-        del message_data["type"]
-        try:
-            if await self.redis_utils.message_list_exists(room_id):
-                await self.redis_utils.add_message_to_list(room_id, message_data)
-        except Exception:
-            pass
-
     async def delete_room(self, room_id: int) -> None:
         """
-            Deletes a room from the active room list and cancel pub/sub task.
+            Deletes a room from the active room list, unsubscribes the worker from its channel
+            and drops its in-process history, which is no longer kept current.
         """
 
         if room_id in self.rooms:
             del self.rooms[room_id]
+        self.history_cache.discard_local(room_id)
+        await self.redis_utils.unsubscribe_channel(room_channel(room_id))
 
 
-websocket_manager = WebsocketManager(redis_utils)
+websocket_manager = WebsocketManager(redis_utils, history_cache)
 
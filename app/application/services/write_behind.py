@@ -0,0 +1,194 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+from typing import Optional
+
+from pydantic import ValidationError
+
+from app.infrastructure.config.config import settings
+from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.repositories.nosql.messages import MessageRepositoryMongoDB
+from app.infrastructure.utils.metrics import metrics
+from app.infrastructure.utils.redis_utils.redis_utils import RedisUtils, redis_utils
+
+MESSAGES_STREAM = "chat:messages:stream"
+MESSAGES_GROUP = "chat:messages:writers"
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriteBehind:
+    """
+        Write-behind persistence of chat messages.
+
+        Accepted messages are appended to a Redis stream and flushed to Mongo with `insert_many`
+        by every worker through a consumer group, once a batch is full or its oldest message has
+        waited for `message_flush_interval`. An entry is acknowledged and deleted from the stream
+        only after its batch is stored, so the entries of a crashed worker stay pending and are
+        claimed by another worker once idle for longer than `message_max_persist_lag`.
+        Messages carry their ObjectId from the start, so a replayed batch never stores duplicates.
+
+        While the oldest entry of the stream is older than `message_max_persist_lag`,
+        `lagging` is true and new messages should be inserted directly instead.
+
+        Until a message is stored, it is also indexed by sequence number in a sorted set per room,
+        so that reads can merge the messages Mongo does not have yet (`get_unflushed`).
+    """
+
+    def __init__(self, redis_utils: RedisUtils, repository: MessageRepositoryMongoDB):
+        self.redis_utils = redis_utils
+        self.repository = repository
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self.lag = 0.0
+        self._batch: dict[str, Message] = {}
+        self._batch_started: Optional[float] = None
+        self._stopping = asyncio.Event()
+
+        metrics.gauge("write_behind.lag", lambda: self.lag)
+        metrics.gauge("write_behind.batch", lambda: len(self._batch))
+
+    @property
+    def lagging(self) -> bool:
+        return self.lag > settings.message_max_persist_lag
+
+    async def append(self, message: Message) -> None:
+        """
+            Appends a message to the durable buffer.
+        """
+        await self.redis_utils.stream_add(
+            MESSAGES_STREAM,
+            message.model_dump_json(by_alias=True),
+            index=(self._room_key(message.room_id), message.seq),
+        )
+        metrics.incr("write_behind.appended")
+
+    async def get_unflushed(
+            self,
+            room_id: int,
+            after_seq: Optional[int] = None,
+            before_seq: Optional[int] = None,
+            limit: Optional[int] = None
+    ) -> list[Message]:
+        """
+            Returns the messages of a room appended to the buffer and not stored yet,
+            with a sequence number strictly between `after_seq` and `before_seq`, in ascending order.
+            With `limit`, only the newest `limit` of them are returned.
+        """
+        payloads = await self.redis_utils.get_sorted_set_range(
+            self._room_key(room_id),
+            min_score=after_seq,
+            max_score=before_seq,
+            limit=limit,
+            highest_first=True,
+        )
+        return [Message.model_validate_json(payload) for payload in reversed(payloads)]
+
+    async def run(self) -> None:
+        """
+            Flushes the buffer until `stop` is called, then flushes what is left.
+            Pending entries of crashed workers are claimed on start and then periodically.
+            The consumer leaves the group only if nothing is pending for it any more, e.g. entries
+            delivered by a read whose reply was lost stay pending until another worker claims them.
+        """
+        self._stopping.clear()
+        group_ready = False
+        last_claim = 0.0
+
+        while not self._stopping.is_set():
+            try:
+                if not group_ready:
+                    await self.redis_utils.stream_create_group(MESSAGES_STREAM, MESSAGES_GROUP)
+                    group_ready = True
+
+                if time.monotonic() - last_claim >= settings.message_max_persist_lag:
+                    last_claim = time.monotonic()
+                    await self._claim_idle()
+
+                await self._read()
+                self.lag = await self.redis_utils.stream_oldest_age(MESSAGES_STREAM)
+
+                if self._batch and (
+                        len(self._batch) >= settings.message_flush_batch_size
+                        or time.monotonic() - self._batch_started >= settings.message_flush_interval
+                ):
+                    await self.flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                metrics.incr("write_behind.errors")
+                logger.exception("Message flush failed, retrying in 1 second")
+                await asyncio.sleep(1)
+
+        await self.flush()
+        await self.redis_utils.stream_delete_consumer(MESSAGES_STREAM, MESSAGES_GROUP, self.consumer)
+
+    def stop(self) -> None:
+        """
+            Asks the flush loop to store the current batch and finish.
+        """
+        self._stopping.set()
+
+    async def flush(self) -> None:
+        """
+            Stores the current batch and removes it from the stream.
+        """
+        if not self._batch:
+            return
+
+        entry_ids = list(self._batch)
+        index_scores: dict[str, list[float]] = {}
+        for message in self._batch.values():
+            index_scores.setdefault(self._room_key(message.room_id), []).append(message.seq)
+
+        with metrics.timer("write_behind.flush"):
+            await self.repository.add_many(list(self._batch.values()))
+        await self.redis_utils.stream_ack(MESSAGES_STREAM, MESSAGES_GROUP, entry_ids, index_scores)
+
+        metrics.incr("write_behind.flushed", len(entry_ids))
+        self._batch.clear()
+        self._batch_started = None
+
+    @staticmethod
+    def _room_key(room_id: int) -> str:
+        return f"chat:room:{room_id}:unflushed"
+
+    async def _read(self) -> None:
+        entries = await self.redis_utils.stream_read_group(
+            MESSAGES_STREAM,
+            MESSAGES_GROUP,
+            self.consumer,
+            count=max(1, settings.message_flush_batch_size - len(self._batch)),
+            block_ms=int(settings.message_flush_interval * 1000),
+        )
+        await self._add(entries)
+
+    async def _claim_idle(self) -> None:
+        entries = await self.redis_utils.stream_claim(
+            MESSAGES_STREAM,
+            MESSAGES_GROUP,
+            self.consumer,
+            min_idle_ms=int(settings.message_max_persist_lag * 1000),
+            count=settings.message_flush_batch_size,
+        )
+        metrics.incr("write_behind.claimed", len(entries))
+        await self._add(entries)
+
+    async def _add(self, entries: list[tuple[str, str]]) -> None:
+        invalid = []
+        for entry_id, payload in entries:
+            try:
+                self._batch[entry_id] = Message.model_validate_json(payload)
+            except ValidationError:
+                invalid.append(entry_id)
+
+        if invalid:
+            metrics.incr("write_behind.invalid", len(invalid))
+            await self.redis_utils.stream_ack(MESSAGES_STREAM, MESSAGES_GROUP, invalid)
+
+        if self._batch and self._batch_started is None:
+            self._batch_started = time.monotonic()
+
+
+message_write_behind = MessageWriteBehind(redis_utils, MessageRepositoryMongoDB())
@@ -1,6 +1,9 @@
+import asyncio
 from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
 
-from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
 class IUnitOfWork(ABC):
     """
@@ -15,12 +18,26 @@ class IUnitOfWork(ABC):
     @abstractmethod
     async def __aexit__(self, exc_type, exc_value, traceback): ...
 
+    @abstractmethod
+    def read_only(self): ...
+
     @abstractmethod
     async def commit(self): ...
 
     @abstractmethod
     async def rollback(self): ...
 
+    @abstractmethod
+    def fork(self): ...
+
+    @property
+    @abstractmethod
+    def in_progress(self) -> bool: ...
+
+    @property
+    @abstractmethod
+    def reads_own_writes(self) -> bool: ...
+
     @abstractmethod
     def set_repository(self, name, repository_class): ...
 
@@ -33,6 +50,17 @@ class UnitOfWork(IUnitOfWork):
         Concrete implementation of the Unit of Work pattern that manages a session
         with a database and coordinates transaction commit and rollback.
         It also manages repository instances for different entities.
+
+        The session is opened lazily by the first unit of work. Outside of a scope it is closed
+        when the unit of work ends. Inside a scope (see `scope`) it is kept for the following
+        units of work, so all the service calls of one request share one session.
+        Units of work entered with `read_only()` are not committed.
+        Concurrent tasks sharing the instance take turns: a unit of work holds the session
+        from start to end, and units of work nested in the same task reuse it.
+
+        With a session factory that routes reads (`routes_reads`), a session opened for
+        a read-only unit of work may be on a replica. It is replaced by a primary session
+        when a unit of work that writes starts, unless it is nested in a read-only one.
     """
 
     def __init__(self, session_factory: async_sessionmaker):
@@ -42,26 +70,108 @@ class UnitOfWork(IUnitOfWork):
         """
         self.session_factory = session_factory
         self.repositories = {}
+        self.session: Optional[AsyncSession] = None
+        self._repository_instances = {}
+        self._lock = asyncio.Lock()
+        self._owner: Optional[asyncio.Task] = None
+        self._depth = 0
+        self._read_only = False
+        self._scoped = False
+        self._routes_reads = getattr(session_factory, "routes_reads", False)
+        self._on_replica = False
 
     async def __aenter__(self):
         """
-            Creates a new database session and starts the unit of work.
+            Starts a unit of work, opening a database session if there is none.
             Returns the UnitOfWork instance to be used within the 'async with' block.
         """
-        self.session = self.session_factory()
+        await self._enter(read_only=False)
         return self
 
     async def __aexit__(self, exc_type, exc_value, traceback):
         """
            Commits or rolls back the transaction depending on the outcome of the operations.
-           If an exception occurred, the transaction is rolled back, otherwise, it's committed.
-           Closes the session when done.
+           If an exception occurred, the transaction is rolled back, otherwise, it's committed
+           unless the unit of work is read-only.
+           Closes the session when done, unless it is kept for the request scope.
        """
-        if exc_type:
-            await self.rollback()
+        self._depth -= 1
+        if self._depth:
+            return
+
+        try:
+            if exc_type:
+                if self._routes_reads:
+                    self.session_factory.report_failure(self.session, exc_value)
+                await self.rollback()
+            elif not self._read_only:
+                await self.commit()
+                if self._routes_reads:
+                    self.session_factory.pin_primary()
+            if not self._scoped:
+                await self._close()
+        finally:
+            self._owner = None
+            self._lock.release()
+
+    @asynccontextmanager
+    async def read_only(self) -> AsyncIterator["UnitOfWork"]:
+        """
+            Starts a unit of work that only reads and therefore is not committed.
+            Nested in a unit of work that writes, it is committed with it.
+        """
+        await self._enter(read_only=True)
+        try:
+            yield self
+        except BaseException as e:
+            await self.__aexit__(type(e), e, e.__traceback__)
+            raise
         else:
-            await self.commit()
-        await self.session.close()
+            await self.__aexit__(None, None, None)
+
+    @asynccontextmanager
+    async def scope(self) -> AsyncIterator["UnitOfWork"]:
+        """
+            Keeps one session for all units of work until the end of the block.
+        """
+        self._scoped = True
+        try:
+            yield self
+        finally:
+            await self.release()
+
+    async def release(self) -> None:
+        """
+            Ends the scope early, e.g. once a WebSocket handshake is done: waits for the running
+            unit of work, closes the session and lets later units of work open their own.
+            Must not be called from inside a unit of work.
+        """
+        async with self._lock:
+            self._scoped = False
+            await self._close()
+
+    def fork(self) -> "UnitOfWork":
+        """
+            Returns a unit of work with the same repositories on its own sessions,
+            for lookups that must run concurrently with this unit of work instead of taking turns.
+        """
+        uow = UnitOfWork(self.session_factory)
+        uow.repositories.update(self.repositories)
+        return uow
+
+    @property
+    def in_progress(self) -> bool:
+        """
+            Whether the current task is inside a unit of work of this instance.
+        """
+        return self._owner is not None and self._owner is asyncio.current_task()
+
+    @property
+    def reads_own_writes(self) -> bool:
+        """
+            Whether the current request must read its own writes, so its reads go to the primary.
+        """
+        return self._routes_reads and self.session_factory.reads_own_writes()
 
     async def commit(self):
         """
@@ -85,8 +195,41 @@ class UnitOfWork(IUnitOfWork):
     def __getattr__(self, name):
         """
             Dynamically retrieves the repository associated with the given name.
+            Repository instances are created once per session.
             If no repository is found, raises an AttributeError.
         """
-        if name in self.repositories:
-            return self.repositories[name](self.session)
+        repositories = self.__dict__.get("repositories", {})
+        if name in repositories:
+            instances = self.__dict__["_repository_instances"]
+            if name not in instances:
+                instances[name] = repositories[name](self.session)
+            return instances[name]
         raise AttributeError(f"'UnitOfWork' object has no attribute '{name}'")
+
+    async def _enter(self, read_only: bool) -> None:
+        task = asyncio.current_task()
+        if self._owner is task:
+            # A nested unit of work writes if any of them does.
+            self._read_only = self._read_only and read_only
+        else:
+            await self._lock.acquire()
+            self._owner = task
+            self._read_only = read_only
+            if not read_only and self.session is not None and self._on_replica:
+                await self._close()
+        self._depth += 1
+
+        if self.session is None:
+            if self._routes_reads:
+                self.session = self.session_factory(read_only=self._read_only)
+                self._on_replica = self.session_factory.is_replica(self.session)
+            else:
+                self.session = self.session_factory()
+            self._repository_instances = {}
+
+    async def _close(self) -> None:
+        if self.session is not None:
+            session, self.session = self.session, None
+            self._repository_instances = {}
+            self._on_replica = False
+            await session.close()
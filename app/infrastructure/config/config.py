@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic_settings import BaseSettings
 from fastapi.templating import Jinja2Templates
 
@@ -9,11 +11,57 @@ class Settings(BaseSettings):
     db_port: int
     db_name: str
 
+    db_replica_hosts: list[str] = []
+    db_replica_retry_interval: float = 30.0
+    db_read_your_writes_seconds: float = 5.0
+
     secret: str
 
+    password_hash_workers: int = 4
+
+    metrics_token: str = ""
+
+    friends_count_reconcile_interval: float = 3600.0
+
+    token_cache_ttl: int = 300
+    token_cache_max_entries: int = 10000
+    token_cache_redis: bool = False
+
     redis_host: str = "localhost"
     redis_port: int = 6379
 
+    ws_send_queue_size: int = 256
+    ws_overflow_policy: Literal["disconnect", "drop"] = "disconnect"
+
+    json_codec: Literal["auto", "orjson", "json"] = "auto"
+
+    history_page_size: int = 50
+    history_max_page_size: int = 200
+    history_reconnect_max_messages: int = 500
+
+    history_cache_size: int = 500
+    history_cache_ttl: int = 86400
+    history_cache_max_rooms: int = 10000
+    history_local_cache_max_rooms: int = 1000
+
+    room_cache_ttl: int = 604800
+    room_cache_max_entries: int = 10000
+
+    chat_list_page_size: int = 50
+    chat_list_max_page_size: int = 200
+    friends_max_page_size: int = 100
+    search_max_page_size: int = 100
+    inbox_ttl: int = 604800
+    unread_ttl: int = 604800
+
+    message_retention: int = 500
+    message_retention_slack: int = 100
+
+    message_write_behind: bool = False
+    message_flush_batch_size: int = 500
+    message_flush_interval: float = 0.2
+    message_max_persist_lag: float = 5.0
+
     mongo_user: str
     mongo_pass: str
     mongo_host: str = "localhost"
@@ -33,6 +81,20 @@ class Settings(BaseSettings):
             f"{self.db_host}:{self.db_port}/{self.db_name}"
         )
 
+    @property
+    def replica_postgresql_urls(self) -> list[str]:
+        """
+        Replica hosts are given as "host" or "host:port", with the primary's credentials and database.
+        """
+        urls = []
+        for replica in self.db_replica_hosts:
+            host, _, port = replica.partition(":")
+            urls.append(
+                f"postgresql+asyncpg://{self.db_user}:{self.db_pass}@"
+                f"{host}:{port or self.db_port}/{self.db_name}"
+            )
+        return urls
+
     @property
     def mongo_uri(self) -> str:
         return (
@@ -1,3 +1,10 @@
+import asyncio
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.exc import InterfaceError, OperationalError
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     create_async_engine,
@@ -12,7 +19,10 @@ from sqlalchemy.orm import (
 from motor.motor_asyncio import AsyncIOMotorClient
 from beanie import init_beanie
 from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.models.nosql.read_states import ReadState
+from app.infrastructure.models.nosql.rooms import RoomState
 from app.infrastructure.config.config import settings
+from app.infrastructure.utils.metrics import metrics
 
 
 class MongoDB:
@@ -24,7 +34,7 @@ class MongoDB:
         """
         Initialization of models to work with Beanie.
         """
-        await init_beanie(database=self.db, document_models=[Message])
+        await init_beanie(database=self.db, document_models=[Message, RoomState, ReadState])
 
 class Base(DeclarativeBase):
     __abstract__ = True
@@ -52,3 +62,129 @@ async_session_maker = async_sessionmaker(
     class_=AsyncSession,
     expire_on_commit=False,
 )
+
+
+class PrimaryPin:
+    """
+    Read-your-writes state of the current request: whether reads must go to the primary
+    and whether the request has committed a write.
+    """
+
+    __slots__ = ("pinned", "wrote")
+
+    def __init__(self, pinned: bool = False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_primary_pin: ContextVar[Optional[PrimaryPin]] = ContextVar("primary_pin", default=None)
+
+
+class SessionRouter:
+    """
+    Creates sessions on the primary database or, for read-only units of work, on the replicas
+    in turn. A replica that fails a health check or a query is skipped for
+    `db_replica_retry_interval` seconds. Without an available replica, reads go to the primary.
+
+    Once a request has committed a write, it and the requests pinned after it (see `start_request`)
+    read from the primary as well.
+    """
+
+    routes_reads = True
+
+    def __init__(self, primary: async_sessionmaker, replicas: list[async_sessionmaker]):
+        self.primary = primary
+        self.replicas = replicas
+        self._down_until = [0.0] * len(replicas)
+        self._next = 0
+
+    def __call__(self, read_only: bool = False) -> AsyncSession:
+        if read_only:
+            if not self.reads_own_writes():
+                replica = self._pick_replica()
+                if replica is not None:
+                    return replica()
+        return self.primary()
+
+    def is_replica(self, session: AsyncSession) -> bool:
+        return self._replica_index(session) is not None
+
+    def report_failure(self, session: AsyncSession, error: BaseException) -> None:
+        """
+        Takes the replica of the session out of rotation if the error is a connection failure.
+        """
+        index = self._replica_index(session)
+        if index is not None and isinstance(error, (OperationalError, InterfaceError, OSError)):
+            self._mark_down(index)
+
+    def pin_primary(self) -> None:
+        """
+        Marks the current request as having written, so that its later reads go to the primary.
+        """
+        pin = _primary_pin.get()
+        if pin is not None:
+            pin.wrote = True
+
+    @staticmethod
+    def reads_own_writes() -> bool:
+        """
+        Returns whether the current request must read its own or recent writes, from the primary.
+        """
+        pin = _primary_pin.get()
+        return bool(pin and (pin.pinned or pin.wrote))
+
+    @staticmethod
+    def start_request(pinned: bool) -> PrimaryPin:
+        """
+        Starts the read-your-writes state of a request. `pinned` sends all its reads to the primary.
+        """
+        pin = PrimaryPin(pinned)
+        _primary_pin.set(pin)
+        return pin
+
+    async def check_replicas(self) -> None:
+        """
+        Checks every replica with a trivial query, periodically, until cancelled.
+        """
+        while True:
+            for index, replica in enumerate(self.replicas):
+                try:
+                    async with replica() as session:
+                        await asyncio.wait_for(session.execute(text("SELECT 1")), timeout=5)
+                    self._down_until[index] = 0.0
+                except (OperationalError, InterfaceError, OSError, asyncio.TimeoutError):
+                    self._mark_down(index)
+            await asyncio.sleep(settings.db_replica_retry_interval)
+
+    def _pick_replica(self) -> Optional[async_sessionmaker]:
+        now = time.monotonic()
+        for _ in range(len(self.replicas)):
+            index = self._next
+            self._next = (self._next + 1) % len(self.replicas)
+            if self._down_until[index] <= now:
+                return self.replicas[index]
+        return None
+
+    def _replica_index(self, session: AsyncSession) -> Optional[int]:
+        for index, replica in enumerate(self.replicas):
+            if session.bind is replica.kw.get("bind"):
+                return index
+        return None
+
+    def _mark_down(self, index: int) -> None:
+        if self._down_until[index] <= time.monotonic():
+            metrics.incr("db.replica_failures")
+        self._down_until[index] = time.monotonic() + settings.db_replica_retry_interval
+
+
+replica_engines = [
+    create_async_engine(url, pool_pre_ping=True, pool_size=10, max_overflow=20)
+    for url in settings.replica_postgresql_urls
+]
+session_router = SessionRouter(
+    async_session_maker,
+    [
+        async_sessionmaker(replica_engine, class_=AsyncSession, expire_on_commit=False)
+        for replica_engine in replica_engines
+    ],
+)
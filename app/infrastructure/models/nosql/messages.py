@@ -1,4 +1,6 @@
 from datetime import datetime
+from typing import Optional
+
 from beanie import Document
 from pydantic import Field
 
@@ -8,10 +10,12 @@ class Message(Document):
     text: str = Field(..., max_length=1024, description="Текст сообщения")
     created_at: datetime = Field(default_factory=datetime.now, description="Дата создания")
     username: str = Field(..., max_length=250, description="Никнейм пользователя")
+    seq: Optional[int] = Field(None, description="Порядковый номер сообщения в комнате")
 
     class Settings:
         name = "messages"
         indexes = [
             "room_id",
             [("room_id", 1), ("created_at", 1)],
+            [("room_id", 1), ("seq", 1)],
         ]
@@ -0,0 +1,22 @@
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+
+
+class ReadState(Document):
+    """
+    Read checkpoint of a user in a room.
+    Attributes:
+        user_id (int): The ID of the reader.
+        room_id (int): The ID of the relational room.
+        read_seq (int): The sequence number of the last message read by the user.
+    """
+    user_id: int = Field(..., description="ID пользователя")
+    room_id: int = Field(..., description="ID комнаты")
+    read_seq: int = Field(0, description="Номер последнего прочитанного сообщения")
+
+    class Settings:
+        name = "read_states"
+        indexes = [
+            IndexModel([("user_id", 1), ("room_id", 1)], unique=True),
+        ]
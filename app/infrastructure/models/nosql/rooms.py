@@ -0,0 +1,35 @@
+from datetime import datetime
+from typing import Optional
+
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+
+
+class RoomState(Document):
+    """
+    Per-room state kept next to the messages collection.
+    Attributes:
+        room_id (int): The ID of the relational room.
+        seq (int): The sequence number of the last message stored in the room.
+        trimmed_seq (int): Messages with a sequence number up to this one have been deleted.
+        retention (Optional[int]): The number of messages kept in the room, the global setting if not set.
+        last_message (Optional[str]): The text of the last message of the room.
+        last_message_time (Optional[datetime]): The creation time of the last message.
+        last_sender_id (Optional[int]): The ID of the author of the last message.
+        message_count (Optional[int]): The number of messages stored in the room, None until it is counted.
+    """
+    room_id: int = Field(..., description="ID комнаты")
+    seq: int = Field(0, description="Номер последнего сообщения в комнате")
+    trimmed_seq: int = Field(0, description="Номер последнего удалённого сообщения")
+    retention: Optional[int] = Field(None, gt=0, description="Количество хранимых сообщений")
+    last_message: Optional[str] = Field(None, description="Текст последнего сообщения")
+    last_message_time: Optional[datetime] = Field(None, description="Дата последнего сообщения")
+    last_sender_id: Optional[int] = Field(None, description="ID автора последнего сообщения")
+    message_count: Optional[int] = Field(None, description="Количество сообщений в комнате")
+
+    class Settings:
+        name = "room_states"
+        indexes = [
+            IndexModel([("room_id", 1)], unique=True),
+        ]
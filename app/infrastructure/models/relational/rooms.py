@@ -3,7 +3,9 @@ from sqlalchemy import (
     String,
     ForeignKey,
     BIGINT,
-    UniqueConstraint
+    Index,
+    UniqueConstraint,
+    func,
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 
@@ -19,6 +21,7 @@ class Room(Base):
         recipient (User): The recipient of the chat (foreign key to the User table).
     Constraints:
         UniqueConstraint: Ensures that there can only be one chat room for a specific sender-recipient pair.
+        uq_room_user_pair: Ensures that there can only be one chat room for a pair of users in either order.
     """
     room_id: Mapped[str] = mapped_column(String(length=250))
     sender_id: Mapped[int] = mapped_column(BIGINT, ForeignKey('user.id'))
@@ -30,3 +33,11 @@ class Room(Base):
         UniqueConstraint('sender_id', 'recipient_id',
                          name='uq_sender_recipient'),
     )
+
+
+Index(
+    'uq_room_user_pair',
+    func.least(Room.sender_id, Room.recipient_id),
+    func.greatest(Room.sender_id, Room.recipient_id),
+    unique=True,
+)
@@ -5,7 +5,8 @@ from sqlalchemy import (
     Table,
     Column,
     UniqueConstraint,
-    Boolean
+    Boolean,
+    Integer
 )
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
@@ -59,6 +60,7 @@ class User(Base):
        profile (Profile): The user's profile.
        friends (List[User]): A list of the user's friends.
        email_confirmed (bool): Indicates whether the user's email is confirmed.
+       friends_count (int): The number of the user's friends, maintained with the friend list.
    Relationships:
        profile: One-to-one relationship with the Profile model.
        friends: Many-to-many relationship with other User instances through the 'friends' table.
@@ -78,4 +80,5 @@ class User(Base):
         primaryjoin="User.id == friends.c.user_id",
         secondaryjoin="User.id == friends.c.friend_id",
     )
-    email_confirmed: Mapped[bool] = mapped_column(Boolean, default=False)
\ No newline at end of file
+    email_confirmed: Mapped[bool] = mapped_column(Boolean, default=False)
+    friends_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0", nullable=False)
\ No newline at end of file
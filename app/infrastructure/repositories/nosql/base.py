@@ -1,3 +1,9 @@
+from beanie import PydanticObjectId
+from pymongo.errors import BulkWriteError
+
+DUPLICATE_KEY_ERROR = 11000
+
+
 class BaseMongoRepository:
     model = None
 
@@ -6,6 +12,25 @@ class BaseMongoRepository:
         await obj.insert()
         return obj
 
+    def build_one(self, data: dict):
+        """
+        Creates a document with its ID already assigned, without storing it.
+        """
+        return self.model(id=PydanticObjectId(), **data)
+
+    async def add_many(self, objs: list) -> None:
+        """
+        Inserts documents in one unordered batch.
+        Documents that are already stored are skipped, so a batch can be safely inserted again.
+        """
+        try:
+            await self.model.insert_many(objs, ordered=False)
+        except BulkWriteError as e:
+            if any(error["code"] != DUPLICATE_KEY_ERROR for error in e.details.get("writeErrors", [])):
+                raise
+            if e.details.get("writeConcernErrors"):
+                raise
+
     @staticmethod
     async def delete(obj):
         await obj.delete()
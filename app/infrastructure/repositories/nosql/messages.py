@@ -1,4 +1,5 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional, Sequence
 
 from app.infrastructure.models.nosql.messages import Message
 from app.infrastructure.repositories.nosql.base import BaseMongoRepository
@@ -8,18 +9,95 @@ class MessageRepositoryMongoDB(BaseMongoRepository):
     model = Message
 
     async def get_messages_by_room_id(self, room_id: int, limit: int = 500) -> List[Message]:
-        return await self.model.find(self.model.room_id == room_id).sort("+created_at").limit(limit).to_list()
+        """
+        Returns up to `limit` of the latest messages of a room in ascending order.
+        Messages are ordered by sequence number, as the `before` cursor of the next page is one;
+        messages stored before sequence numbers were introduced come after all numbered ones.
+        """
+        messages = await self.model.find(
+            self.model.room_id == room_id
+        ).sort([("seq", -1), ("created_at", -1)]).limit(limit).to_list()
+        return list(reversed(messages))
+
+    async def get_messages_before(self, room_id: int, before: int | datetime, limit: int) -> List[Message]:
+        """
+        Returns up to `limit` messages older than the cursor in ascending order.
+        An integer cursor is a sequence number, a datetime cursor is a creation time.
+        Messages stored before sequence numbers were introduced come after all numbered ones.
+        """
+        if isinstance(before, datetime):
+            query = self.model.find(
+                self.model.room_id == room_id,
+                self.model.created_at < before
+            ).sort("-created_at")
+        else:
+            query = self.model.find(
+                {"room_id": room_id, "$or": [{"seq": {"$lt": before}}, {"seq": None}]}
+            ).sort([("seq", -1), ("created_at", -1)])
+
+        messages = await query.limit(limit).to_list()
+        return list(reversed(messages))
+
+    async def get_messages_after_seq(self, room_id: int, after_seq: int, limit: int = 500) -> List[Message]:
+        """
+        Returns up to `limit` of the messages following the sequence number `after_seq`,
+        in ascending order.
+        """
+        return await self.model.find(
+            self.model.room_id == room_id,
+            self.model.seq > after_seq
+        ).sort("+seq").limit(limit).to_list()
 
     async def get_messages_count(self, room_id: int) -> int:
         return await self.model.find(self.model.room_id == room_id).count()
 
-    async def get_oldest_message(self, room_id: int) -> Message:
-        return await self.model.find(self.model.room_id == room_id).sort("+created_at").first_or_none()
+    async def get_unnumbered_count(self, room_id: int) -> int:
+        """
+        Counts the messages of a room stored before sequence numbers were introduced.
+        """
+        return await self.model.find({"room_id": room_id, "seq": None}).count()
+
+    async def count_unread(
+            self,
+            user_id: int,
+            after_seqs: dict[int, int],
+            exclude_seqs: Optional[dict[int, Sequence[int]]] = None
+    ) -> dict[int, int]:
+        """
+        Counts in one aggregation, for each room of `after_seqs` ({room_id: after_seq}),
+        the messages written by others after the given sequence number, leaving out the sequence
+        numbers in `exclude_seqs` ({room_id: [seq, ...]}). Rooms without such messages are left out.
+        """
+        rooms = []
+        for room_id, after_seq in after_seqs.items():
+            seq_filter = {"$gt": after_seq}
+            excluded = (exclude_seqs or {}).get(room_id)
+            if excluded:
+                seq_filter["$nin"] = list(excluded)
+            rooms.append({"room_id": room_id, "seq": seq_filter})
+
+        if not rooms:
+            return {}
+
+        pipeline = [
+            {"$match": {"$or": rooms, "user_id": {"$ne": user_id}}},
+            {"$group": {"_id": "$room_id", "count": {"$sum": 1}}},
+        ]
+        cursor = self.model.get_motor_collection().aggregate(pipeline)
+        results = await cursor.to_list(length=len(rooms))
+
+        return {r["_id"]: r["count"] for r in results}
 
-    async def delete_oldest_message(self, room_id: int) -> None:
-        oldest_message = await self.get_oldest_message(room_id)
-        if oldest_message:
-            await oldest_message.delete()
+    async def delete_through_seq(self, room_id: int, seq: int) -> int:
+        """
+        Deletes in one request the messages of a room with a sequence number up to `seq`,
+        along with the messages stored before sequence numbers were introduced.
+        Returns the number of deleted messages.
+        """
+        result = await self.model.get_motor_collection().delete_many(
+            {"room_id": room_id, "$or": [{"seq": {"$lte": seq}}, {"seq": None}]}
+        )
+        return result.deleted_count
 
     async def get_last_messages_for_rooms(self, room_ids: list[int]) -> dict[int, Message]:
         pipeline = [
@@ -0,0 +1,31 @@
+from pymongo import ReturnDocument
+
+from app.infrastructure.models.nosql.read_states import ReadState
+from app.infrastructure.repositories.nosql.base import BaseMongoRepository
+
+
+class ReadStateRepositoryMongoDB(BaseMongoRepository):
+    model = ReadState
+
+    async def set_read_seq(self, user_id: int, room_id: int, read_seq: int) -> int:
+        """
+        Moves the read checkpoint of a user in a room forward, never backward.
+        Returns the checkpoint after the update, which is ahead of `read_seq`
+        if a later position was stored first.
+        """
+        state = await self.model.get_motor_collection().find_one_and_update(
+            {"user_id": user_id, "room_id": room_id},
+            {"$max": {"read_seq": read_seq}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return state["read_seq"]
+
+    async def get_read_seqs(self, user_id: int, room_ids: list[int]) -> dict[int, int]:
+        """
+        Returns the read checkpoints of a user in the given rooms by room ID.
+        """
+        states = await self.model.find(
+            {"user_id": user_id, "room_id": {"$in": room_ids}}
+        ).to_list()
+        return {state.room_id: state.read_seq for state in states}
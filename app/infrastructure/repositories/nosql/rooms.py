@@ -0,0 +1,116 @@
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from app.infrastructure.models.nosql.rooms import RoomState
+from app.infrastructure.repositories.nosql.base import BaseMongoRepository
+
+
+class RoomStateRepositoryMongoDB(BaseMongoRepository):
+    model = RoomState
+
+    async def next_seq(self, room_id: int, message: Optional[dict] = None) -> RoomState:
+        """
+        Atomically allocates the next message sequence number of a room.
+        If a message is given (with "text", "created_at" and "user_id"), the room summary
+        is updated with it in the same write, and the message count is incremented if it is known.
+        Returns the room state after the allocation.
+        """
+        collection = self.model.get_motor_collection()
+        update = {"$inc": {"seq": 1}}
+        if message is not None:
+            update["$set"] = {
+                "last_message": message["text"],
+                "last_message_time": message["created_at"],
+                "last_sender_id": message["user_id"],
+            }
+            counted = {"$inc": {"seq": 1, "message_count": 1}, "$set": update["$set"]}
+            state = await collection.find_one_and_update(
+                {"room_id": room_id, "message_count": {"$ne": None}},
+                counted,
+                return_document=ReturnDocument.AFTER,
+            )
+            if state is not None:
+                return self.model.model_validate(state)
+
+        # The count of a new room, or of a room with messages older than the room state,
+        # stays unknown until it is counted by `set_message_count`.
+        state = await collection.find_one_and_update(
+            {"room_id": room_id},
+            update,
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return self.model.model_validate(state)
+
+    async def set_trimmed_seq(self, room_id: int, trimmed_seq: int, deleted: int = 0) -> None:
+        """
+        Moves the trim point of a room forward, never backward,
+        and subtracts the deleted messages from the message count if it is known.
+        """
+        collection = self.model.get_motor_collection()
+        result = await collection.update_one(
+            {"room_id": room_id, "message_count": {"$ne": None}},
+            {"$max": {"trimmed_seq": trimmed_seq}, "$inc": {"message_count": -deleted}},
+        )
+        if not result.matched_count:
+            await collection.update_one({"room_id": room_id}, {"$max": {"trimmed_seq": trimmed_seq}})
+
+    async def set_message_count(self, room_id: int, message_count: int, state: RoomState) -> bool:
+        """
+        Stores the counted messages of a room whose count is unknown, provided that no message
+        was added or trimmed since `state` was read. Returns whether the count was stored.
+        """
+        result = await self.model.get_motor_collection().update_one(
+            {
+                "room_id": room_id,
+                "message_count": None,
+                "seq": _unchanged(state.seq),
+                "trimmed_seq": _unchanged(state.trimmed_seq),
+            },
+            {"$set": {"message_count": message_count}},
+        )
+        return bool(result.modified_count)
+
+    async def get_states(self, room_ids: list[int]) -> dict[int, RoomState]:
+        """
+        Returns the states of the given rooms by room ID, with one indexed lookup per room.
+        """
+        states = await self.model.find({"room_id": {"$in": room_ids}}).to_list()
+        return {state.room_id: state for state in states}
+
+    async def backfill_summary(self, room_id: int, message: dict, message_count: int) -> None:
+        """
+        Stores the summary of a room that has none yet, such as a room created before summaries
+        were maintained. A summary written meanwhile by a new message is left as is,
+        its message count is counted later by `set_message_count`.
+        """
+        try:
+            await self.model.get_motor_collection().update_one(
+                {"room_id": room_id, "last_message_time": None},
+                {"$set": {
+                    "last_message": message["text"],
+                    "last_message_time": message["created_at"],
+                    "last_sender_id": message["user_id"],
+                    "message_count": message_count,
+                }},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            pass
+
+    async def set_retention(self, room_id: int, retention: Optional[int]) -> None:
+        """
+        Sets the number of messages kept in a room. None falls back to the global setting.
+        """
+        await self.model.get_motor_collection().update_one(
+            {"room_id": room_id},
+            {"$set": {"retention": retention}},
+            upsert=True,
+        )
+
+
+def _unchanged(value: int):
+    # Fields that are still 0 may be missing from documents written before they existed.
+    return value if value else {"$in": [0, None]}
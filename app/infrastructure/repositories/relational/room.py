@@ -1,6 +1,7 @@
 import uuid
 
-from sqlalchemy import select
+from sqlalchemy import select, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 
 from app.infrastructure.repositories.relational.base import SQLAlchemyRepository
 from app.infrastructure.models.relational.rooms import Room
@@ -16,28 +17,42 @@ class RoomRepository(SQLAlchemyRepository):
 
     model = Room
 
-    async def get_and_create_room_by_users(self, sender: int, recipient: int) -> Room:
+    async def get_room_by_users(self, user_id: int, other_user_id: int) -> Room | None:
         """
-            Retrieves an existing chat room between two users or creates a new one
-            if no room exists.
+            Retrieves the chat room between two users, in either order, through the index
+            on the canonical pair (least, greatest) of their IDs.
         """
 
         stmt = select(Room).filter(
-            ((Room.sender_id == sender) & (Room.recipient_id == recipient)) |
-            ((Room.sender_id == recipient) & (Room.recipient_id == sender))
-        ).limit(1)
+            func.least(Room.sender_id, Room.recipient_id) == min(user_id, other_user_id),
+            func.greatest(Room.sender_id, Room.recipient_id) == max(user_id, other_user_id),
+        )
 
         result = await self.session.execute(stmt)
-        room = result.scalar_one_or_none()
+        return result.scalar_one_or_none()
+
+    async def get_and_create_room_by_users(self, sender: int, recipient: int) -> Room:
+        """
+            Retrieves an existing chat room between two users or creates a new one
+            if no room exists. Concurrent calls for the same pair end up with the same room:
+            the insert does nothing if another one has created the room in the meantime.
+        """
 
+        room = await self.get_room_by_users(sender, recipient)
+        if room is not None:
+            return room
+
+        result = await self.session.execute(
+            pg_insert(Room)
+            .values(room_id=str(uuid.uuid4()), sender_id=sender, recipient_id=recipient)
+            .on_conflict_do_nothing()
+            .returning(Room)
+        )
+        room = result.scalar_one_or_none()
         if room is None:
-            room_id = str(uuid.uuid4())
-            new_room = Room(room_id=room_id, sender_id=sender,
-                            recipient_id=recipient)
-            self.session.add(new_room)
-            await self.session.commit()
-            return new_room
+            room = await self.get_room_by_users(sender, recipient)
 
+        await self.session.commit()
         return room
 
     async def get_user_room_ids(self, user_id: int) -> list[tuple[int, int, int]]:
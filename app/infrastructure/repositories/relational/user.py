@@ -1,12 +1,13 @@
+import random
 from typing import Optional, Dict, Any, Sequence
 from sqlalchemy.future import select
-from sqlalchemy import insert, func
+from sqlalchemy import func, case, or_, and_, union_all, update, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.orm import selectinload, joinedload
 from starlette.datastructures import UploadFile
 from fastapi import HTTPException
 
 from app.infrastructure.models.relational.users import User, Profile, friends
-from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
 from app.infrastructure.repositories.relational.base import SQLAlchemyRepository
 from app.infrastructure.utils.files import save_and_get_avatar_path
 # from app.infrastructure.task_manager.tasks import send_registration_email
@@ -65,6 +66,21 @@ class UserRepository(SQLAlchemyRepository):
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
+    async def get_users_by_emails(self, emails: list[str]) -> list[User]:
+        """
+            Gets a list of users with their profiles by email.
+        """
+        if not emails:
+            return []
+
+        stmt = (
+            select(User)
+            .where(User.email.in_(emails))
+            .options(selectinload(User.profile))
+        )
+        result = await self.session.execute(stmt)
+        return result.scalars().all()
+
     async def update_user_profile(self, user_id: int, update_data: Dict[str, Any]) -> None:
         """
             Updates the profile of a user with the provided data.
@@ -101,58 +117,156 @@ class UserRepository(SQLAlchemyRepository):
         result = await self.session.execute(stmt)
         return result.scalar_one_or_none()
 
-    async def find_users_by_username(self, username_substring: str, page: int, limit: int) -> Sequence[User]:
+    async def find_users_by_username(
+            self,
+            username_substring: str,
+            limit: int,
+            after_score: Optional[int] = None,
+            after_id: Optional[int] = None
+    ) -> Sequence[tuple[User, int]]:
         """
-            Searches for users whose usernames contain the given substring.
+            Searches for users whose usernames contain the given substring, case-insensitively.
+            Returns (user, score) pairs ranked by score: 2 for an exact match, 1 for a prefix match
+            and 0 for any other match, then by ID. The next page starts after the given
+            (after_score, after_id) position. The substring match uses the trigram index on
+            lower(username).
         """
+        query = username_substring.lower()
+        username = func.lower(User.username)
+        score = case(
+            (username == query, 2),
+            (username.startswith(query, autoescape=True), 1),
+            else_=0
+        )
+
         stmt = (
-            select(User)
-            .where(func.lower(User.username).contains(func.lower(username_substring)))
+            select(User, score.label("score"))
+            .where(username.contains(query, autoescape=True))
             .options(selectinload(User.profile))
-            .order_by(User.id)
-            .offset((page - 1) * limit)
+            .order_by(score.desc(), User.id)
             .limit(limit)
         )
+        if after_score is not None and after_id is not None:
+            stmt = stmt.where(or_(
+                score < after_score,
+                and_(score == after_score, User.id > after_id)
+            ))
+
         result = await self.session.execute(stmt)
-        return result.scalars().all()
+        return result.tuples().all()
 
-    async def user_friends(self, user_id: int, page: int, limit: int, paginated: bool) -> Sequence[User]:
+    async def user_friends(self, user_id: int, limit: int, after_id: Optional[int] = None) -> Sequence[User]:
         """
-        Retrieves the friends of a user with optional pagination.
+        Retrieves up to `limit` friends of a user ordered by ID, starting after `after_id`.
+        Walks the (user_id, friend_id) index of the unique_user_friend constraint.
         """
-        stmt = select(User).join(
-            friends, User.id == friends.c.friend_id
-        ).filter(
-            friends.c.user_id == user_id
+        stmt = (
+            select(User)
+            .join(friends, User.id == friends.c.friend_id)
+            .filter(friends.c.user_id == user_id)
         )
+        if after_id is not None:
+            stmt = stmt.filter(friends.c.friend_id > after_id)
 
-        if paginated:
-            stmt = stmt.order_by(User.id)
-        else:
-            limit = 3
-            stmt = stmt.order_by(func.random())
-
-        stmt = stmt.options(selectinload(User.profile))
-        stmt = stmt.offset((page - 1) * limit).limit(limit)
+        stmt = stmt.options(selectinload(User.profile)).order_by(friends.c.friend_id).limit(limit)
         result = await self.session.execute(stmt)
         return result.scalars().all()
 
-    async def add_user_friend(self, friend_id: int, user_id: int) -> None:
+    async def random_friends(self, user_id: int, size: int) -> Sequence[User]:
         """
-            Adds a friend to the user's friend list.
+        Retrieves a random sample of up to `size` friends of a user.
+
+        Picks random points between the lowest and the highest friend ID and takes the first
+        friend at or after each of them, so the cost depends on the sample size only,
+        not on the number of friends. Friends that follow wide gaps in IDs are picked more often.
+        """
+        bounds = await self.session.execute(
+            select(func.min(friends.c.friend_id), func.max(friends.c.friend_id))
+            .filter(friends.c.user_id == user_id)
+        )
+        lowest, highest = bounds.one()
+        if lowest is None:
+            return []
+
+        probes = [
+            select(friends.c.friend_id)
+            .filter(friends.c.user_id == user_id, friends.c.friend_id >= random.randint(lowest, highest))
+            .order_by(friends.c.friend_id)
+            .limit(1)
+            .subquery()
+            .select()
+            for _ in range(size * 2)
+        ]
+        result = await self.session.execute(union_all(*probes))
+        friend_ids = list(dict.fromkeys(result.scalars().all()))
+
+        if len(friend_ids) < size:
+            # Few friends or an unlucky draw: the first ones complete the sample.
+            first = await self.session.execute(
+                select(friends.c.friend_id)
+                .filter(friends.c.user_id == user_id)
+                .order_by(friends.c.friend_id)
+                .limit(size)
+            )
+            friend_ids.extend(friend_id for friend_id in first.scalars().all() if friend_id not in friend_ids)
+
+        friend_ids = random.sample(friend_ids, min(size, len(friend_ids)))
+        return await self.get_users_with_profiles(friend_ids)
+
+    async def add_user_friend(self, friend_id: int, user_id: int) -> bool:
+        """
+            Adds a friend to the user's friend list and increments the user's friend counter
+            in the same transaction. Returns False if the user was already a friend.
         """
         try:
             friend = await self.get_by_id(friend_id)
-            if friend:
-                await self.session.execute(insert(friends).values(
-                    user_id=user_id,
-                    friend_id=friend.id
-                ))
-                await self.session.commit()
+            if not friend:
+                return False
+
+            result = await self.session.execute(
+                pg_insert(friends)
+                .values(user_id=user_id, friend_id=friend.id)
+                .on_conflict_do_nothing(constraint="unique_user_friend")
+                .returning(friends.c.id)
+            )
+            added = result.scalar() is not None
+            if added:
+                await self._change_friends_count(user_id, 1)
+
+            await self.session.commit()
+            return added
         except Exception as e:
             await self.session.rollback()
             raise e
 
+    async def remove_user_friend(self, friend_id: int, user_id: int) -> bool:
+        """
+            Removes a friend from the user's friend list and decrements the user's friend counter
+            in the same transaction. Returns False if the user was not a friend.
+        """
+        try:
+            result = await self.session.execute(
+                delete(friends)
+                .where((friends.c.user_id == user_id) & (friends.c.friend_id == friend_id))
+                .returning(friends.c.id)
+            )
+            removed = result.scalar() is not None
+            if removed:
+                await self._change_friends_count(user_id, -1)
+
+            await self.session.commit()
+            return removed
+        except Exception as e:
+            await self.session.rollback()
+            raise e
+
+    async def _change_friends_count(self, user_id: int, delta: int) -> None:
+        await self.session.execute(
+            update(User)
+            .where(User.id == user_id)
+            .values(friends_count=User.friends_count + delta)
+        )
+
     async def user_register(self, user_data: Dict[str, Any]) -> None:
         """
             Registers a new user and creates a profile for them.
@@ -179,21 +293,35 @@ class UserRepository(SQLAlchemyRepository):
         result = await self.session.execute(query)
         return result.scalar() is not None
 
-    async def get_user_friends_count(self, user: User) -> int:
+    async def get_user_friends_count(self, user_id: int) -> int:
         """
-            Retrieves the total number of friends a user has, with caching.
+            Retrieves the total number of friends a user has from the maintained counter.
         """
+        stmt = select(User.friends_count).where(User.id == user_id)
+        result = await self.session.execute(stmt)
+        return result.scalar() or 0
 
-        cache_key = f"user_friends_count:{user.id}"
-        cached_data = await redis_utils.get(cache_key)
-
-        if cached_data:
-            friends_count = int(cached_data)
-        else:
-            stmt = select(
-                func.count()
-            ).select_from(friends).filter(friends.c.user_id == user.id)
-            result = await self.session.execute(stmt)
-            friends_count = result.scalar()
-            await redis_utils.set(cache_key, friends_count, expire=3600)
-        return friends_count
+    async def reconcile_friends_counts(self) -> list[int]:
+        """
+            Recomputes the friend counters that differ from the friends table, in one statement.
+            Returns the IDs of the users whose counter was repaired.
+        """
+        try:
+            counts = (
+                select(User.id.label("user_id"), func.count(friends.c.id).label("friends_count"))
+                .outerjoin(friends, friends.c.user_id == User.id)
+                .group_by(User.id)
+                .subquery()
+            )
+            result = await self.session.execute(
+                update(User)
+                .where(User.id == counts.c.user_id, User.friends_count != counts.c.friends_count)
+                .values(friends_count=counts.c.friends_count)
+                .returning(User.id)
+            )
+            user_ids = list(result.scalars())
+            await self.session.commit()
+            return user_ids
+        except Exception as e:
+            await self.session.rollback()
+            raise e
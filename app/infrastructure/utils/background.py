@@ -0,0 +1,23 @@
+import asyncio
+from typing import Coroutine
+
+from app.infrastructure.utils.metrics import metrics
+
+_tasks: set[asyncio.Task] = set()
+
+
+def run_in_background(coro: Coroutine, name: str = "background") -> asyncio.Task:
+    """
+        Runs a coroutine detached from the caller.
+        A reference to the task is kept until it finishes, failures are counted as `{name}.errors`.
+    """
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(lambda done: _finish(done, name))
+    return task
+
+
+def _finish(task: asyncio.Task, name: str) -> None:
+    _tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        metrics.incr(f"{name}.errors")
@@ -0,0 +1,95 @@
+import asyncio
+from typing import Awaitable, Callable, Generic, Hashable, Iterable, Optional, TypeVar
+
+from app.infrastructure.utils.metrics import metrics
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class BatchLoader(Generic[K, V]):
+    """
+        DataLoader-style batching of lookups by key.
+
+        Keys requested during the same event loop tick are loaded with a single call
+        of the batch function, which returns the found values by key. Results are cached
+        for the lifetime of the loader, so it is meant to live for one request or one connection.
+        Failed loads are not cached.
+    """
+
+    def __init__(
+            self,
+            batch_fn: Callable[[list[K]], Awaitable[dict[K, V]]],
+            name: str = "batch_loader",
+            max_batch_size: int = 500,
+    ):
+        self.name = name
+        self.max_batch_size = max_batch_size
+        self._batch_fn = batch_fn
+        self._cache: dict[K, asyncio.Future] = {}
+        self._pending: list[K] = []
+
+    async def load(self, key: K) -> Optional[V]:
+        """
+            Returns the value for a key, or None if the batch function did not find it.
+        """
+        future = self._cache.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._cache[key] = future
+            if not self._pending:
+                asyncio.get_running_loop().call_soon(self._dispatch)
+            self._pending.append(key)
+        else:
+            metrics.incr(f"{self.name}.cache_hits")
+
+        # A cancelled caller must not cancel the load for the others.
+        return await asyncio.shield(future)
+
+    async def load_many(self, keys: Iterable[K]) -> list[Optional[V]]:
+        """
+            Returns the values for the keys in the same order, None for the keys not found.
+        """
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def prime(self, key: K, value: V) -> None:
+        """
+            Caches a value that is already known.
+        """
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(value)
+        self._cache[key] = future
+
+    def clear(self, key: Optional[K] = None) -> None:
+        """
+            Forgets the cached value of a key, or of all keys.
+        """
+        if key is None:
+            self._cache.clear()
+        else:
+            self._cache.pop(key, None)
+
+    def _dispatch(self) -> None:
+        keys, self._pending = self._pending, []
+        for start in range(0, len(keys), self.max_batch_size):
+            asyncio.ensure_future(self._load_batch(keys[start:start + self.max_batch_size]))
+
+    async def _load_batch(self, keys: list[K]) -> None:
+        metrics.incr(f"{self.name}.batches")
+        metrics.incr(f"{self.name}.keys", len(keys))
+
+        try:
+            values = await self._batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                future = self._cache.pop(key, None)
+                if future is not None and not future.done():
+                    future.set_exception(e)
+                    # Marks the exception as retrieved in case every caller was cancelled.
+                    future.exception()
+            return
+
+        for key in keys:
+            future = self._cache.get(key)
+            if future is not None and not future.done():
+                future.set_result(values.get(key))
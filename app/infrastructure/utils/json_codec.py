@@ -0,0 +1,52 @@
+import json
+from typing import Any, Literal
+
+from app.infrastructure.config.config import settings
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class JsonCodec:
+    """
+        JSON codec based on the standard library.
+    """
+
+    name = "json"
+
+    def dumps(self, obj: Any) -> str:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+    def loads(self, data: str | bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JsonCodec):
+    """
+        JSON codec based on orjson. Produces the same compact output as JsonCodec.
+    """
+
+    name = "orjson"
+
+    def dumps(self, obj: Any) -> str:
+        return orjson.dumps(obj).decode()
+
+    def loads(self, data: str | bytes) -> Any:
+        return orjson.loads(data)
+
+
+def get_codec(name: Literal["auto", "orjson", "json"] = "auto") -> JsonCodec:
+    """
+        Returns the codec by name. "auto" picks orjson when it is installed.
+    """
+    if name == "orjson" and orjson is None:
+        raise RuntimeError("orjson codec requested but orjson is not installed")
+
+    if name == "orjson" or (name == "auto" and orjson is not None):
+        return OrjsonCodec()
+    return JsonCodec()
+
+
+codec = get_codec(settings.json_codec)
@@ -0,0 +1,84 @@
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+
+class Metrics:
+    """
+        In-process metrics registry.
+
+        Keeps monotonically increasing counters, gauges that are computed on demand
+        and timings stored over a bounded window of recent observations.
+        Values are per worker process.
+    """
+
+    def __init__(self, window: int = 1024):
+        self._counters: dict[str, int] = defaultdict(int)
+        self._gauges: dict[str, Callable[[], float]] = {}
+        self._timings: dict[str, deque[float]] = defaultdict(lambda: deque(maxlen=window))
+
+    def incr(self, name: str, value: int = 1) -> None:
+        """
+            Increments a counter.
+        """
+        self._counters[name] += value
+
+    def counter(self, name: str) -> int:
+        """
+            Returns the current value of a counter.
+        """
+        return self._counters.get(name, 0)
+
+    def gauge(self, name: str, callback: Callable[[], float]) -> None:
+        """
+            Registers a gauge whose value is read from the callback at snapshot time.
+        """
+        self._gauges[name] = callback
+
+    def observe(self, name: str, seconds: float) -> None:
+        """
+            Records a single timing observation in seconds.
+        """
+        self._timings[name].append(seconds)
+
+    @contextmanager
+    def timer(self, name: str) -> Iterator[None]:
+        """
+            Measures the duration of the enclosed block.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> dict:
+        """
+            Returns the current values of all counters, gauges and timing summaries.
+        """
+        timings = {}
+        for name, values in self._timings.items():
+            ordered = sorted(values)
+            if not ordered:
+                continue
+            timings[name] = {
+                "count": len(ordered),
+                "p50": _percentile(ordered, 0.50),
+                "p99": _percentile(ordered, 0.99),
+                "max": ordered[-1],
+            }
+
+        return {
+            "counters": dict(self._counters),
+            "gauges": {name: callback() for name, callback in self._gauges.items()},
+            "timings": timings,
+        }
+
+
+def _percentile(ordered: list[float], quantile: float) -> float:
+    index = min(len(ordered) - 1, int(len(ordered) * quantile))
+    return ordered[index]
+
+
+metrics = Metrics()
@@ -0,0 +1,68 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Optional, TypeVar
+
+from passlib.context import CryptContext
+
+from app.infrastructure.config.config import settings
+from app.infrastructure.utils.metrics import metrics
+
+T = TypeVar("T")
+
+
+class PasswordHasher:
+    """
+        Hashes and verifies passwords with bcrypt on a bounded thread pool, off the event loop.
+
+        bcrypt releases the GIL while it works, so threads run it in parallel.
+        At most `workers` calls are handed to the pool at a time, the others wait
+        for their turn on the event loop. The wait is recorded as `password_hash.queue_time`,
+        the hashing itself as `password_hash.run_time`.
+    """
+
+    def __init__(self, workers: int = settings.password_hash_workers):
+        self.context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+        self.workers = workers
+        self.waiting = 0
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        metrics.gauge("password_hash.waiting", lambda: self.waiting)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(self.context.hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(self.context.verify, password, hashed_password)
+
+    def shutdown(self) -> None:
+        """
+            Stops the pool threads once the submitted calls have finished.
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="password-hash")
+            self._semaphore = asyncio.Semaphore(self.workers)
+
+        queued = time.perf_counter()
+        self.waiting += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+
+        try:
+            started = time.perf_counter()
+            metrics.observe("password_hash.queue_time", started - queued)
+            result = await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            metrics.observe("password_hash.run_time", time.perf_counter() - started)
+            return result
+        finally:
+            self._semaphore.release()
+
+
+password_hasher = PasswordHasher()
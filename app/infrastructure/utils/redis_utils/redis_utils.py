@@ -1,8 +1,74 @@
-import json
-from typing import Any, Union
+import asyncio
+import time
+from typing import Any, Optional
 import redis.asyncio as redis
+from redis.asyncio.client import PubSub
 from typing import AsyncGenerator
 from app.infrastructure.config.config import settings
+from app.infrastructure.utils.json_codec import codec
+
+MESSAGE_LISTS_LRU_KEY = "chat:rooms:messages:lru"
+
+# KEYS: message list, LRU sorted set.
+# ARGV: encoded message, its seq (or ""), list size, ttl, room id, timestamp.
+APPEND_MESSAGE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+
+local seq = tonumber(ARGV[2])
+local head = redis.call('LINDEX', KEYS[1], 0)
+if seq and head then
+    local ok, newest = pcall(cjson.decode, head)
+    if ok and type(newest) == 'table' and type(newest['seq']) == 'number' and newest['seq'] ~= seq - 1 then
+        redis.call('DEL', KEYS[1])
+        redis.call('ZREM', KEYS[2], ARGV[5])
+        return -1
+    end
+end
+
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[3]) - 1)
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+redis.call('ZADD', KEYS[2], ARGV[6], ARGV[5])
+return 1
+"""
+
+# KEYS: stream. ARGV: group, consumer.
+DELETE_IDLE_CONSUMER_SCRIPT = """
+if redis.call('XPENDING', KEYS[1], ARGV[1], '-', '+', 1, ARGV[2])[1] then
+    return 0
+end
+redis.call('XGROUP', 'DELCONSUMER', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+# KEYS: hash. ARGV: field, ttl.
+INCREMENT_EXISTING_FIELD_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return nil
+end
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+return redis.call('HINCRBY', KEYS[1], ARGV[1], 1)
+"""
+
+# KEYS: chat list state hash, changes sorted set. ARGV: epoch base, ttl, changed member (optional).
+CHAT_LIST_VERSION_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    redis.call('HSET', KEYS[1], 'base', ARGV[1], 'version', ARGV[1])
+    redis.call('DEL', KEYS[2])
+end
+
+local version = tonumber(redis.call('HGET', KEYS[1], 'version'))
+if ARGV[3] then
+    version = redis.call('HINCRBY', KEYS[1], 'version', 1)
+    redis.call('ZADD', KEYS[2], version, ARGV[3])
+end
+
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+redis.call('EXPIRE', KEYS[2], tonumber(ARGV[2]))
+return {version, tonumber(redis.call('HGET', KEYS[1], 'base'))}
+"""
 
 
 class RedisUtils:
@@ -23,6 +89,8 @@ class RedisUtils:
         self.redis_url = f"redis://{self.redis_host}:{self.redis_port}"
         self._pool = redis.ConnectionPool.from_url(self.redis_url)
         self._pubsub_client = redis.Redis.from_url(self.redis_url, decode_responses=True)
+        self._listener_pubsub: Optional[PubSub] = None
+        self._listener_channels: set[str] = set()
 
     async def subscribe(self, channel: str, timeout: int = 25) -> dict | None:
         """
@@ -39,7 +107,7 @@ class RedisUtils:
             )
             if message and message["type"] == "message":
                 try:
-                    return json.loads(message["data"])
+                    return codec.loads(message["data"])
                 except Exception:
                     return None
             return None
@@ -47,36 +115,70 @@ class RedisUtils:
             await pubsub.unsubscribe(channel)
             await pubsub.close()
 
-    async def publish(self, channel: str, message: dict) -> None:
+    async def publish(self, channel: str, message: dict | str) -> None:
         """
         Publishes a message to the specified channel.
+        A string is treated as an already encoded JSON payload.
         """
-        await self._pubsub_client.publish(channel, json.dumps(message))
+        if not isinstance(message, str):
+            message = codec.dumps(message)
+        await self._pubsub_client.publish(channel, message)
 
-    async def psubscribe(self, pattern: str) -> AsyncGenerator[tuple[int, dict], None]:
+    async def subscribe_channel(self, channel: str) -> None:
         """
-        Subscribes to all Redis channels matching the pattern and yields (room_id, message) pairs.
+        Adds a channel to the shared listener connection.
+        The channel is remembered, so it is subscribed again if the listener restarts.
+        """
+        self._listener_channels.add(channel)
+        if self._listener_pubsub is not None:
+            await self._listener_pubsub.subscribe(channel)
+
+    async def unsubscribe_channel(self, channel: str) -> None:
+        """
+        Removes a channel from the shared listener connection.
+        """
+        self._listener_channels.discard(channel)
+        if self._listener_pubsub is not None:
+            await self._listener_pubsub.unsubscribe(channel)
+
+    async def listen(self, poll_interval: float = 1.0) -> AsyncGenerator[tuple[str, str], None]:
+        """
+        Opens the shared pub/sub connection for the channels registered with subscribe_channel
+        and yields (channel, raw_payload) pairs.
+        The payload is not decoded, so it can be forwarded to clients as is.
         """
         pubsub = self._pubsub_client.pubsub()
-        await pubsub.psubscribe(pattern)
+        # Published before subscribing, so channels added concurrently go straight to this connection.
+        self._listener_pubsub = pubsub
 
         try:
-            async for message in pubsub.listen():
-                if message["type"] != "pmessage":
+            if self._listener_channels:
+                await pubsub.subscribe(*self._listener_channels)
+
+            while True:
+                if pubsub.connection is None:
+                    # Nothing has been subscribed yet, so there is no connection to read from.
+                    await asyncio.sleep(poll_interval)
+                    continue
+
+                message = await pubsub.get_message(
+                    ignore_subscribe_messages=True,
+                    timeout=poll_interval
+                )
+                if not message or message["type"] != "message":
                     continue
 
                 channel = message["channel"]
                 if isinstance(channel, bytes):
                     channel = channel.decode()
 
-                try:
-                    room_id = int(channel.split(":")[2])
-                    payload = json.loads(message["data"])
-                    yield room_id, payload
-                except Exception:
-                    continue
+                data = message["data"]
+                if isinstance(data, bytes):
+                    data = data.decode()
+
+                yield channel, data
         finally:
-            await pubsub.punsubscribe(pattern)
+            self._listener_pubsub = None
             await pubsub.close()
 
     async def pool_disconnect(self) -> None:
@@ -87,12 +189,12 @@ class RedisUtils:
 
     async def get(self, key: str) -> Any:
         """
-            Retrieves a value from Redis by its key.
+            Retrieves a value from Redis by its key. Returns None if the key does not exist.
         """
         client = redis.Redis.from_pool(self._pool)
         value = await client.get(key)
         await client.aclose()
-        return value.decode()
+        return None if value is None else value.decode()
 
     async def set(self, key: str, value: Any, expire: int = 60) -> None:
         """
@@ -103,23 +205,78 @@ class RedisUtils:
         await client.expire(key, expire)
         await client.aclose()
 
-    async def add_message_to_list(self, room_id: int, messages: Union[dict, list[dict]]):
+    async def delete(self, *keys: str) -> None:
         """
-        Adds one or multiple messages to the list of messages for a specific chat room.
+            Deletes the given keys.
         """
         client = redis.Redis.from_pool(self._pool)
+        await client.delete(*keys)
+        await client.aclose()
+
+    async def fill_message_list(self, room_id: int, messages: list[str], size: int, ttl: int) -> None:
+        """
+        Replaces the message list of a chat room with the given encoded messages (oldest first),
+        keeping at most `size` of the newest ones, and marks the room as recently used.
+        """
         key = f"chat:room:{room_id}:messages"
+        client = redis.Redis.from_pool(self._pool)
 
-        if isinstance(messages, dict):
-            messages = [messages]
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            if messages:
+                pipe.lpush(key, *messages[-size:])
+                pipe.expire(key, ttl)
+                pipe.zadd(MESSAGE_LISTS_LRU_KEY, {str(room_id): time.time()})
+            await pipe.execute()
+
+        await client.aclose()
+
+    async def append_message_to_list(
+            self,
+            room_id: int,
+            message: str,
+            seq: Optional[int],
+            size: int,
+            ttl: int
+    ) -> int:
+        """
+        Appends an encoded message to the message list of a chat room if the list is cached.
+        Returns 1 if the message was appended, 0 if the room is not cached and -1 if the list was
+        dropped because `seq` does not directly follow the newest cached message.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        result = await client.eval(
+            APPEND_MESSAGE_SCRIPT,
+            2,
+            f"chat:room:{room_id}:messages",
+            MESSAGE_LISTS_LRU_KEY,
+            message,
+            "" if seq is None else seq,
+            size,
+            ttl,
+            room_id,
+            time.time(),
+        )
+        await client.aclose()
+        return int(result)
+
+    async def evict_message_lists(self, max_rooms: int) -> int:
+        """
+        Deletes the message lists of the least recently used rooms above `max_rooms`.
+        Returns the number of evicted rooms.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        overflow = await client.zcard(MESSAGE_LISTS_LRU_KEY) - max_rooms
+        evicted = 0
 
-        json_messages = [json.dumps(message) for message in messages]
-        if json_messages:
-            await client.lpush(key, *json_messages)
-            await client.ltrim(key, 0, 499)
-            await client.expire(key, 10)
+        if overflow > 0:
+            rooms = await client.zpopmin(MESSAGE_LISTS_LRU_KEY, overflow)
+            if rooms:
+                await client.delete(*(f"chat:room:{room.decode()}:messages" for room, _ in rooms))
+            evicted = len(rooms)
 
         await client.aclose()
+        return evicted
 
     async def get_messages_list(self, room_id: int, start: int = 0, end: int = -1):
         """
@@ -129,7 +286,33 @@ class RedisUtils:
         key = f"chat:room:{room_id}:messages"
         messages = await client.lrange(key, start, end)
         await client.aclose()
-        return [json.loads(msg.decode()) for msg in messages]
+        return [codec.loads(msg) for msg in messages]
+
+    async def get_raw_messages_list(
+            self,
+            room_id: int,
+            start: int = 0,
+            end: int = -1,
+            ttl: Optional[int] = None
+    ) -> list[str]:
+        """
+            Retrieves messages from a chat room's message list as encoded JSON strings, newest first.
+            If `ttl` is given, a cached list is kept alive for that long and marked as recently used.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        key = f"chat:room:{room_id}:messages"
+
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.lrange(key, start, end)
+            if ttl is not None:
+                pipe.expire(key, ttl)
+            messages = (await pipe.execute())[0]
+
+        if messages and ttl is not None:
+            await client.zadd(MESSAGE_LISTS_LRU_KEY, {str(room_id): time.time()}, xx=True)
+
+        await client.aclose()
+        return [msg.decode() for msg in messages]
 
     async def delete_all_messages(self, room_id: int) -> None:
         """
@@ -139,17 +322,318 @@ class RedisUtils:
         key = f"chat:room:{room_id}:messages"
 
         await client.delete(key)
+        await client.zrem(MESSAGE_LISTS_LRU_KEY, str(room_id))
         await client.aclose()
 
-    async def message_list_exists(self, room_id: int) -> bool:
+
+    async def add_to_inboxes(self, members: dict[int, str], score: float, ttl: int) -> None:
         """
-            Checks if a message list exists for a specific chat room.
+            Adds or moves up a member in the inboxes of the given users ({user_id: member}).
+            A score is never lowered, so a late update cannot move a chat down.
         """
         client = redis.Redis.from_pool(self._pool)
-        key = f"chat:room:{room_id}:messages"
-        exists = await client.exists(key)
+        async with client.pipeline(transaction=False) as pipe:
+            for user_id, member in members.items():
+                key = f"chat:user:{user_id}:inbox"
+                pipe.zadd(key, {member: score}, gt=True)
+                pipe.expire(key, ttl)
+            await pipe.execute()
         await client.aclose()
-        return exists == 1
 
+    async def fill_inbox(self, user_id: int, members: dict[str, float], ttl: int) -> None:
+        """
+            Stores the inbox of a user built from the database and marks it as complete.
+        """
+        key = f"chat:user:{user_id}:inbox"
+        client = redis.Redis.from_pool(self._pool)
+        async with client.pipeline(transaction=True) as pipe:
+            if members:
+                pipe.zadd(key, members, gt=True)
+                pipe.expire(key, ttl)
+            pipe.set(f"{key}:ready", 1, ex=ttl)
+            await pipe.execute()
+        await client.aclose()
+
+    async def inbox_ready(self, user_id: int) -> bool:
+        """
+            Checks whether the inbox of a user is complete.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        ready = await client.exists(f"chat:user:{user_id}:inbox:ready")
+        await client.aclose()
+        return bool(ready)
+
+    async def get_inbox_page(
+            self,
+            user_id: int,
+            limit: int,
+            before: Optional[tuple[float, str]],
+            ttl: int
+    ) -> list[tuple[str, float]]:
+        """
+            Returns up to `limit` inbox members of a user that come after the (score, member)
+            position `before` in the order of the sorted set from the highest score, where
+            members with equal scores are ordered from the highest, and keeps the inbox alive
+            for `ttl` seconds.
+        """
+        key = f"chat:user:{user_id}:inbox"
+        client = redis.Redis.from_pool(self._pool)
+
+        async with client.pipeline(transaction=False) as pipe:
+            if before is None:
+                pipe.zrevrangebyscore(key, "+inf", "-inf", start=0, num=limit, withscores=True)
+            else:
+                # Members with the score of the cursor are read whole, as they cannot be ranged
+                # by member, and those not returned yet are put before the lower scores.
+                pipe.zrevrangebyscore(key, before[0], before[0], withscores=True)
+                pipe.zrevrangebyscore(key, f"({before[0]}", "-inf", start=0, num=limit, withscores=True)
+            pipe.expire(key, ttl)
+            pipe.expire(f"{key}:ready", ttl)
+            results = await pipe.execute()
+
+        await client.aclose()
+        if before is None:
+            members = results[0]
+        else:
+            ties = [(member, score) for member, score in results[0] if member.decode() < before[1]]
+            members = (ties + results[1])[:limit]
+        return [(member.decode(), score) for member, score in members]
+
+    async def chat_list_version(
+            self,
+            user_id: int,
+            ttl: int,
+            changed_member: Optional[str] = None
+    ) -> tuple[int, int]:
+        """
+            Returns the chat list version of a user and the version its change log starts from.
+            If `changed_member` is given, the version is incremented and the member is logged
+            as changed in the new version first. A lost state starts over from the current time
+            in milliseconds, so versions never go back.
+        """
+        key = f"chat:user:{user_id}:chat_list"
+        args = [int(time.time() * 1000), ttl]
+        if changed_member is not None:
+            args.append(changed_member)
+
+        client = redis.Redis.from_pool(self._pool)
+        version, base = await client.eval(CHAT_LIST_VERSION_SCRIPT, 2, key, f"{key}:changes", *args)
+        await client.aclose()
+        return int(version), int(base)
+
+    async def get_chat_list_changes(self, user_id: int, since: int, limit: int) -> list[str]:
+        """
+            Returns up to `limit` members of the chat list of a user changed after version `since`.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        members = await client.zrangebyscore(
+            f"chat:user:{user_id}:chat_list:changes", f"({since}", "+inf", start=0, num=limit
+        )
+        await client.aclose()
+        return [member.decode() for member in members]
+
+    async def increment_hash_field(self, key: str, field: str, ttl: int) -> Optional[int]:
+        """
+            Increments a field of a hash only if the field is set.
+            Returns the new value, or None if the field is not set.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        result = await client.eval(INCREMENT_EXISTING_FIELD_SCRIPT, 1, key, field, ttl)
+        await client.aclose()
+        return None if result is None else int(result)
+
+    async def set_hash_fields(self, key: str, mapping: dict[str, int], ttl: int) -> None:
+        """
+            Sets fields of a hash and keeps the hash alive for `ttl` seconds.
+        """
+        if not mapping:
+            return
+
+        client = redis.Redis.from_pool(self._pool)
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=mapping)
+            pipe.expire(key, ttl)
+            await pipe.execute()
+        await client.aclose()
+
+    async def get_hash_fields(self, key: str, fields: list[str]) -> list[Optional[str]]:
+        """
+            Returns the values of the given fields of a hash, None for unset fields.
+        """
+        if not fields:
+            return []
+
+        client = redis.Redis.from_pool(self._pool)
+        values = await client.hmget(key, fields)
+        await client.aclose()
+        return [None if value is None else value.decode() for value in values]
+
+    async def stream_add(self, stream: str, payload: str, index: Optional[tuple[str, float]] = None) -> str:
+        """
+            Appends a payload to a stream. Returns the ID of the new entry.
+            With `index` = (key, score), the payload is also added to that sorted set in the same
+            transaction, so that it can be looked up by score until it is acknowledged.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.xadd(stream, {"payload": payload})
+            if index is not None:
+                pipe.zadd(index[0], {payload: index[1]})
+            entry_id = (await pipe.execute())[0]
+        await client.aclose()
+        return entry_id.decode()
+
+    async def stream_create_group(self, stream: str, group: str) -> None:
+        """
+            Creates a consumer group reading the stream from the beginning, along with the stream.
+            Does nothing if the group already exists.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        try:
+            await client.xgroup_create(stream, group, id="0", mkstream=True)
+        except redis.ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+        finally:
+            await client.aclose()
+
+    async def stream_read_group(
+            self,
+            stream: str,
+            group: str,
+            consumer: str,
+            count: int,
+            block_ms: int
+    ) -> list[tuple[str, str]]:
+        """
+            Reads up to `count` new entries of the stream for a consumer of the group,
+            waiting up to `block_ms` for the first one. Returns (entry ID, payload) pairs.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        response = await client.xreadgroup(group, consumer, {stream: ">"}, count=count, block=block_ms)
+        await client.aclose()
+
+        if not response:
+            return []
+        return [(entry_id.decode(), fields[b"payload"].decode()) for entry_id, fields in response[0][1]]
+
+    async def stream_claim(
+            self,
+            stream: str,
+            group: str,
+            consumer: str,
+            min_idle_ms: int,
+            count: int
+    ) -> list[tuple[str, str]]:
+        """
+            Takes over entries pending in the group for longer than `min_idle_ms`,
+            such as the ones of a consumer that has crashed. Returns (entry ID, payload) pairs.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        response = await client.xautoclaim(stream, group, consumer, min_idle_ms, start_id="0-0", count=count)
+        await client.aclose()
+
+        return [
+            (entry_id.decode(), fields[b"payload"].decode())
+            for entry_id, fields in response[1]
+            if fields
+        ]
+
+    async def stream_ack(
+            self,
+            stream: str,
+            group: str,
+            entry_ids: list[str],
+            index_scores: Optional[dict[str, list[float]]] = None
+    ) -> None:
+        """
+            Acknowledges entries for the group and deletes them from the stream.
+            `index_scores` ({key: [score, ...]}) removes the entries from the sorted sets
+            they were indexed in by stream_add, in the same transaction.
+        """
+        if not entry_ids:
+            return
+
+        client = redis.Redis.from_pool(self._pool)
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.xack(stream, group, *entry_ids)
+            pipe.xdel(stream, *entry_ids)
+            for key, scores in (index_scores or {}).items():
+                for score in scores:
+                    pipe.zremrangebyscore(key, score, score)
+            await pipe.execute()
+        await client.aclose()
+
+    async def get_sorted_set_range(
+            self,
+            key: str,
+            min_score: Optional[float] = None,
+            max_score: Optional[float] = None,
+            limit: Optional[int] = None,
+            highest_first: bool = False
+    ) -> list[str]:
+        """
+            Returns the members of a sorted set with a score strictly between `min_score`
+            and `max_score` (unbounded if None), up to `limit` of them, lowest score first
+            unless `highest_first` is set.
+        """
+        low = "-inf" if min_score is None else f"({min_score}"
+        high = "+inf" if max_score is None else f"({max_score}"
+        paging = {"start": 0, "num": limit} if limit is not None else {}
+
+        client = redis.Redis.from_pool(self._pool)
+        if highest_first:
+            members = await client.zrevrangebyscore(key, high, low, **paging)
+        else:
+            members = await client.zrangebyscore(key, low, high, **paging)
+        await client.aclose()
+        return [member.decode() for member in members]
+
+    async def stream_oldest_age(self, stream: str) -> float:
+        """
+            Returns the age in seconds of the oldest entry of the stream, 0 if the stream is empty.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        entries = await client.xrange(stream, count=1)
+        await client.aclose()
+
+        if not entries:
+            return 0.0
+        timestamp_ms = int(entries[0][0].decode().split("-")[0])
+        return max(0.0, time.time() - timestamp_ms / 1000)
+
+    async def stream_delete_consumer(self, stream: str, group: str, consumer: str) -> bool:
+        """
+            Removes a consumer from the group, unless entries are still pending for it:
+            deleting the consumer would drop them, so they are left for another consumer to claim.
+            Returns whether the consumer was removed.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        deleted = await client.eval(DELETE_IDLE_CONSUMER_SCRIPT, 1, stream, group, consumer)
+        await client.aclose()
+        return bool(deleted)
+
+    async def set_indexed(self, key: str, value: str, index_key: str, ttl: int) -> None:
+        """
+            Stores a value with an expiration time and records its key in an index set,
+            so that the keys of a group can be deleted together with delete_indexed.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        async with client.pipeline(transaction=True) as pipe:
+            pipe.set(key, value, ex=ttl)
+            pipe.sadd(index_key, key)
+            pipe.expire(index_key, ttl, gt=True)
+            pipe.expire(index_key, ttl, nx=True)
+            await pipe.execute()
+        await client.aclose()
+
+    async def delete_indexed(self, index_key: str) -> None:
+        """
+            Deletes the keys recorded in an index set and the set itself.
+        """
+        client = redis.Redis.from_pool(self._pool)
+        keys = await client.smembers(index_key)
+        await client.delete(index_key, *keys)
+        await client.aclose()
 
 redis_utils = RedisUtils()
@@ -0,0 +1,69 @@
+import asyncio
+import functools
+from typing import Any, Awaitable, Callable, Hashable, TypeVar
+
+from app.infrastructure.utils.metrics import metrics
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+        Shares one in-flight call per key between concurrent callers.
+
+        The first caller starts the call, callers arriving while it runs await the same result
+        (or exception). The call is shielded, so a cancelled caller does not cancel it for the others.
+        Nothing is cached once the call has finished.
+    """
+
+    def __init__(self, name: str = "single_flight"):
+        self.name = name
+        self._calls: dict[Hashable, asyncio.Task] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(functools.partial(self._forget, key))
+        else:
+            metrics.incr(f"{self.name}.shared")
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            # Marks the exception as retrieved in case every caller was cancelled.
+            task.exception()
+
+
+def _freeze(value: Any) -> Hashable:
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def single_flight(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+    """
+        Coalesces concurrent calls of a service read method with equal arguments, across all instances.
+        Only for methods that read, on services with a `uow` and a `fork()`.
+
+        The shared call runs on a fork of the service, on its own unit of work, so it neither uses
+        nor waits for the session of the caller. Calls made inside a unit of work of the caller
+        or in a request that must read its own writes are not shared and run on the caller's service.
+    """
+    group = SingleFlight(f"single_flight.{method.__qualname__}")
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        if self.uow.in_progress or self.uow.reads_own_writes:
+            return await method(self, *args, **kwargs)
+
+        key = (_freeze(args), _freeze(kwargs))
+        return await group.do(key, lambda: method(self.fork(), *args, **kwargs))
+
+    return wrapper
@@ -1,6 +1,13 @@
 import asyncio
 
+from app.application.services.auth.token_cache import TOKEN_INVALIDATION_CHANNEL, token_cache
+from app.application.services.history_cache import INVALIDATION_CHANNEL
+from app.application.services.user import UserService
 from app.application.services.websocket.websocket_manager import WebsocketManager
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.config import settings
+from app.infrastructure.config.database import session_router
+from app.infrastructure.utils.metrics import metrics
 from app.infrastructure.utils.redis_utils.redis_utils import RedisUtils
 
 
@@ -9,16 +16,38 @@ async def start_listener(
     websocket_manager: WebsocketManager,
 ) -> None:
     """
-    Global Redis Pub/Sub listener across all rooms.
+    Redis Pub/Sub listener for the rooms and chat lists hosted by this worker.
+    The websocket manager subscribes and unsubscribes channels as local sockets come and go.
+    Messages are routed by channel name and forwarded to the sockets without decoding.
+    Room messages also keep the in-process history cache current, and invalidations
+    are applied to the in-process history and token caches.
     """
-    async for room_id, payload in redis_utils.psubscribe("chat:room:*:channel"):
-        msg_type = payload.get("type", "chat_message")
+    # Messages published while the listener was down are not in the in-process history.
+    websocket_manager.history_cache.clear_local()
+    token_cache.clear_local()
+    await redis_utils.subscribe_channel(INVALIDATION_CHANNEL)
+    await redis_utils.subscribe_channel(TOKEN_INVALIDATION_CHANNEL)
 
-        if msg_type == "chat_message":
-            await websocket_manager.broadcast_to_room(room_id, payload)
+    async for channel, payload in redis_utils.listen():
+        if channel == INVALIDATION_CHANNEL:
+            websocket_manager.history_cache.discard_local(int(payload))
+            continue
+        if channel == TOKEN_INVALIDATION_CHANNEL:
+            token_cache.discard_local(int(payload))
+            continue
 
-        elif msg_type == "chat_update":
-            await websocket_manager.broadcast_chat_update(payload)
+        try:
+            _, kind, target_id, _ = channel.split(":")
+            target_id = int(target_id)
+        except ValueError:
+            continue
+
+        if kind == "room":
+            websocket_manager.history_cache.apply_local(target_id, payload)
+            await websocket_manager.broadcast_to_room(target_id, payload)
+
+        elif kind == "user":
+            await websocket_manager.broadcast_chat_update(target_id, payload)
 
 async def start_listener_with_restart(
         redis_utils: RedisUtils,
@@ -30,3 +59,17 @@ async def start_listener_with_restart(
         except Exception as e:
             print(f"Listener crashed with error: {e}. Restarting in 5 seconds...")
             await asyncio.sleep(5)
+
+
+async def reconcile_friends_counts() -> None:
+    """
+    Repairs the friend counters that drifted from the friend lists
+    every `friends_count_reconcile_interval` seconds, until cancelled.
+    """
+    while True:
+        await asyncio.sleep(settings.friends_count_reconcile_interval)
+        try:
+            repaired = await UserService(UnitOfWork(session_router)).reconcile_friends_counts()
+            metrics.incr("friends_count.repaired", len(repaired))
+        except Exception as e:
+            print(f"Friend counter reconciliation failed with error: {e}")
@@ -1,4 +1,7 @@
 import asyncio
+import logging
+import math
+import time
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
@@ -7,12 +10,18 @@ from fastapi.responses import RedirectResponse, JSONResponse
 from starlette.exceptions import HTTPException as StarletteHTTPException
 
 from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
-from app.infrastructure.config.config import templates
+from app.infrastructure.config.config import settings, templates
 from .api.chat import router as chat_router
 from .api.users import router as user_router
+from .api.metrics import router as metrics_router
+from .application.services.write_behind import message_write_behind
 from .application.services.websocket.websocket_manager import websocket_manager, WebsocketManager
-from .infrastructure.config.database import init_mongo, mongo_db
-from .infrastructure.utils.tasks import start_listener_with_restart
+from .infrastructure.config.database import init_mongo, mongo_db, session_router
+from .infrastructure.utils.metrics import metrics
+from .infrastructure.utils.password_hasher import password_hasher
+from .infrastructure.utils.tasks import start_listener_with_restart, reconcile_friends_counts
+
+logger = logging.getLogger(__name__)
 
 
 @asynccontextmanager
@@ -26,8 +35,35 @@ async def lifespan(app: FastAPI):
         )
     )
 
+    replica_check_task = None
+    if session_router.replicas:
+        replica_check_task = asyncio.create_task(session_router.check_replicas())
+
+    reconcile_task = None
+    if settings.friends_count_reconcile_interval > 0:
+        reconcile_task = asyncio.create_task(reconcile_friends_counts())
+
+    write_behind_task = None
+    if settings.message_write_behind:
+        write_behind_task = asyncio.create_task(message_write_behind.run())
+
     yield
 
+    if write_behind_task:
+        message_write_behind.stop()
+        try:
+            await write_behind_task
+        except Exception:
+            metrics.incr("write_behind.errors")
+            logger.exception("Final message flush failed")
+
+    if replica_check_task:
+        replica_check_task.cancel()
+
+    if reconcile_task:
+        reconcile_task.cancel()
+
+    password_hasher.shutdown()
     await redis_utils.pool_disconnect()
     mongo_db.client.close()
 
@@ -40,6 +76,32 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
+PRIMARY_PIN_COOKIE = "db_primary_until"
+
+
+@app.middleware("http")
+async def read_your_writes(request: Request, call_next):
+    """
+        Sends the reads of a client to the primary database for a few seconds after it has written,
+        so that it sees its own writes despite the replication lag.
+    """
+    try:
+        pinned_until = float(request.cookies.get(PRIMARY_PIN_COOKIE, 0))
+    except ValueError:
+        pinned_until = 0
+    pin = session_router.start_request(pinned=pinned_until > time.time())
+
+    response = await call_next(request)
+
+    if pin.wrote and session_router.replicas and settings.db_read_your_writes_seconds > 0:
+        response.set_cookie(
+            PRIMARY_PIN_COOKIE,
+            str(time.time() + settings.db_read_your_writes_seconds),
+            max_age=math.ceil(settings.db_read_your_writes_seconds),
+            httponly=True,
+        )
+    return response
+
 @app.exception_handler(RequestValidationError)
 async def http_exception_handler(request, exc):
     """
@@ -86,4 +148,5 @@ async def redirect_to_profile():
 
 app.include_router(user_router, tags=["users"])
 app.include_router(chat_router, tags=["chat"])
+app.include_router(metrics_router, tags=["metrics"])
 
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete
+
+from app.application.services.chat import ChatService
+from app.application.services.user import UserService
+from app.application.services.websocket.websocket_manager import websocket_manager
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.models.nosql.rooms import RoomState
+from app.infrastructure.models.relational.rooms import Room
+from app.infrastructure.repositories.relational.room import RoomRepository
+
+
+@pytest_asyncio.fixture
+async def room(create_user, recipient):
+    async with async_session_maker() as session:
+        room = await RoomRepository(session).get_and_create_room_by_users(create_user.id, recipient.id)
+    yield room
+    async with async_session_maker() as session:
+        await session.execute(delete(Room).where(Room.id == room.id))
+        await session.commit()
+
+
+async def send_message(room: Room, sender_id: int, recipient_id: int, text: str) -> None:
+    uow = UnitOfWork(async_session_maker)
+    async with uow.scope():
+        user_service = UserService(uow)
+        sender = await user_service.load_user(sender_id)
+        recipient = await user_service.load_user(recipient_id)
+        await websocket_manager.send_message(
+            {"username": sender.username, "text": text}, ChatService(uow), room.id, sender, recipient
+        )
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo")
+class TestChatRetention:
+
+    async def test_participant_sets_room_retention(self, authorized_client, room):
+        response = await authorized_client.put(f"/api/chats/{room.id}/retention", json={"retention": 10})
+        assert response.status_code == 200
+        assert (await RoomState.find_one(RoomState.room_id == room.id)).retention == 10
+
+        response = await authorized_client.put(f"/api/chats/{room.id}/retention", json={"retention": None})
+        assert response.status_code == 200
+        assert (await RoomState.find_one(RoomState.room_id == room.id)).retention is None
+
+        response = await authorized_client.put(f"/api/chats/{room.id}/retention", json={"retention": 0})
+        assert response.status_code == 400
+
+    async def test_retention_of_unknown_chat_is_not_found(self, authorized_client):
+        response = await authorized_client.put("/api/chats/999999/retention", json={"retention": 10})
+        assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo", "redis_client")
+class TestChatMessages:
+
+    async def test_pages_are_walked_with_the_before_cursor(self, authorized_client, room, create_user):
+        # Two messages stored before sequence numbers were introduced, then three numbered ones.
+        started = datetime(2024, 1, 1)
+        for number, seq in enumerate([None, None, 1, 2, 3]):
+            await Message(
+                room_id=room.id, user_id=create_user.id, username="testuser",
+                text=str(number), seq=seq, created_at=started + timedelta(minutes=number)
+            ).insert()
+
+        pages = []
+        params = {"limit": 2}
+        while True:
+            response = await authorized_client.get(f"/api/chats/{room.id}/messages", params=params)
+            assert response.status_code == 200
+            page = response.json()
+            pages.append(([message["text"] for message in page["messages"]], page["next_before"]))
+            if page["next_before"] is None:
+                break
+            params["before"] = page["next_before"]
+
+        assert pages == [
+            (["3", "4"], 2),
+            (["1", "2"], (started + timedelta(minutes=1)).isoformat()),
+            (["0"], None),
+        ]
+
+    async def test_pages_follow_sequence_numbers_when_creation_times_disagree(
+            self, authorized_client, room, create_user
+    ):
+        # Concurrent senders take their creation time before their sequence number.
+        started = datetime(2024, 1, 1)
+        for seq, minute in [(1, 0), (2, 2), (3, 1), (4, 4), (5, 3)]:
+            await Message(
+                room_id=room.id, user_id=create_user.id, username="testuser",
+                text=str(seq), seq=seq, created_at=started + timedelta(minutes=minute)
+            ).insert()
+
+        pages = []
+        params = {"limit": 2}
+        while True:
+            page = (await authorized_client.get(f"/api/chats/{room.id}/messages", params=params)).json()
+            pages.append([message["seq"] for message in page["messages"]])
+            if page["next_before"] is None:
+                break
+            params["before"] = page["next_before"]
+
+        assert pages == [[4, 5], [2, 3], [1]]
+
+    async def test_messages_of_unknown_chat_are_not_found(self, authorized_client):
+        response = await authorized_client.get("/api/chats/999999/messages", params={"before": 10})
+        assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo", "redis_client")
+class TestChatListSync:
+
+    async def test_unchanged_chat_list_is_not_modified(self, authorized_client, room):
+        response = await authorized_client.get("/api/chats")
+        assert response.status_code == 200
+        version = response.headers["X-Chat-List-Version"]
+        etag = response.headers["ETag"]
+        assert etag == f'"{version}"'
+
+        response = await authorized_client.get("/api/chats", params={"since": version})
+        assert response.status_code == 304
+        assert response.headers["X-Chat-List-Version"] == version
+
+        response = await authorized_client.get("/api/chats", headers={"If-None-Match": etag})
+        assert response.status_code == 304
+
+    async def test_changes_since_a_version_are_returned(self, authorized_client, room, create_user, recipient):
+        response = await authorized_client.get("/api/chats")
+        version = int(response.headers["X-Chat-List-Version"])
+
+        await send_message(room, recipient.id, create_user.id, "hello")
+
+        response = await authorized_client.get("/api/chats", params={"since": version})
+        assert response.status_code == 200
+        assert int(response.headers["X-Chat-List-Version"]) == version + 1
+        assert "X-Chat-List-Reset" not in response.headers
+        [chat] = response.json()
+        assert (chat["room_id"], chat["last_message"], chat["unread_count"]) == (room.id, "hello", 1)
+
+        response = await authorized_client.get("/api/chats", params={"since": version + 1})
+        assert response.status_code == 304
+
+    async def test_unknown_version_resets_the_chat_list(self, authorized_client, room, create_user, recipient):
+        await send_message(room, create_user.id, recipient.id, "hello")
+        response = await authorized_client.get("/api/chats")
+        version = int(response.headers["X-Chat-List-Version"])
+
+        for since in (version - 100, version + 100):
+            response = await authorized_client.get("/api/chats", params={"since": since})
+            assert response.status_code == 200
+            assert response.headers["X-Chat-List-Reset"] == "1"
+            assert [chat["room_id"] for chat in response.json()] == [room.id]
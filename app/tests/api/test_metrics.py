@@ -0,0 +1,23 @@
+import pytest
+
+from app.infrastructure.config.config import settings
+
+
+@pytest.mark.asyncio
+class TestMetrics:
+
+    async def test_metrics_do_not_exist_without_token(self, client, monkeypatch):
+        monkeypatch.setattr(settings, "metrics_token", "")
+
+        response = await client.get("/api/metrics")
+        assert response.status_code == 404
+
+    async def test_metrics_require_the_token(self, client, monkeypatch):
+        monkeypatch.setattr(settings, "metrics_token", "metrics-secret")
+
+        response = await client.get("/api/metrics", headers={"Authorization": "Bearer wrong"})
+        assert response.status_code == 401
+
+        response = await client.get("/api/metrics", headers={"Authorization": "Bearer metrics-secret"})
+        assert response.status_code == 200
+        assert "counters" in response.json()
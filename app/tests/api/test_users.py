@@ -1,8 +1,12 @@
 import pytest
-from sqlalchemy import select
+import pytest_asyncio
+from sqlalchemy import delete, event, select, update
+from sqlalchemy.engine import Engine
 
+from app.application.services.user import UserService
+from app.application.unit_of_work.unit_of_work import UnitOfWork
 from app.infrastructure.config.database import async_session_maker
-from app.infrastructure.models.relational.users import Profile
+from app.infrastructure.models.relational.users import Profile, User
 from app.tests.fixtures.client import authorized_client
 
 @pytest.mark.asyncio
@@ -34,6 +38,31 @@ async def test_update_profile(authorized_client):
         assert updated_profile.last_name == "Name"
 
 
+@pytest.mark.asyncio
+async def test_search_users_exact_match_first(authorized_client):
+    response = await authorized_client.get("/search/", params={"query": "TestUser", "limit": 1})
+
+    assert response.status_code == 200
+    assert response.json()[0]["username"] == "testuser"
+    assert response.headers["X-Next-After-Score"] == "2"
+
+    next_page = await authorized_client.get("/search/", params={
+        "query": "TestUser",
+        "after_score": response.headers["X-Next-After-Score"],
+        "after_id": response.headers["X-Next-After-Id"],
+    })
+    assert next_page.status_code == 200
+    assert next_page.json() == []
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("limit", [0, -1, 101])
+async def test_search_rejects_out_of_range_page_size(authorized_client, limit):
+    response = await authorized_client.get("/search/", params={"query": "TestUser", "limit": limit})
+
+    assert response.status_code == 400
+
+
 @pytest.mark.asyncio
 class TestLoginUser:
 
@@ -77,3 +106,113 @@ class TestLoginUser:
 
         assert response.status_code == 400
         assert response.json()["detail"] == "User not found"
+
+
+@pytest.mark.asyncio
+class TestFriends:
+
+    async def test_friend_count_follows_adds_and_removals(self, authorized_client, recipient):
+        async def friends_count() -> int:
+            response = await authorized_client.get("/protect/profile/")
+            return response.json()["friends_count"]
+
+        before = await friends_count()
+
+        assert (await authorized_client.post(f"/add/friend/{recipient.id}/")).status_code == 200
+        assert await friends_count() == before + 1
+
+        assert (await authorized_client.post(f"/remove/friend/{recipient.id}/")).status_code == 200
+        assert await friends_count() == before
+        assert (await authorized_client.post(f"/remove/friend/{recipient.id}/")).status_code == 404
+
+    async def test_drifted_friend_counts_are_repaired(self, create_user):
+        async with async_session_maker() as session:
+            await session.execute(update(User).where(User.id == create_user.id).values(friends_count=5))
+            await session.commit()
+
+        repaired = await UserService(UnitOfWork(async_session_maker)).reconcile_friends_counts()
+
+        assert repaired == [create_user.id]
+        async with async_session_maker() as session:
+            assert await session.scalar(select(User.friends_count).where(User.id == create_user.id)) == 0
+
+
+@pytest_asyncio.fixture
+async def friends(authorized_client):
+    async with async_session_maker() as session:
+        users = [
+            User(
+                email=f"friend{number}@example.com",
+                username=f"friend{number}",
+                hashed_password="-",
+                profile=Profile(first_name="Friend", last_name=str(number)),
+            )
+            for number in range(5)
+        ]
+        session.add_all(users)
+        await session.commit()
+        friend_ids = [user.id for user in users]
+
+    for friend_id in friend_ids:
+        assert (await authorized_client.post(f"/add/friend/{friend_id}/")).status_code == 200
+    yield friend_ids
+
+    for friend_id in friend_ids:
+        await authorized_client.post(f"/remove/friend/{friend_id}/")
+    async with async_session_maker() as session:
+        await session.execute(delete(Profile).where(Profile.user_id.in_(friend_ids)))
+        await session.execute(delete(User).where(User.id.in_(friend_ids)))
+        await session.commit()
+
+
+@pytest.fixture
+def statements():
+    """Records the SQL statements sent to the databases."""
+    recorded = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        recorded.append(statement.lower())
+
+    event.listen(Engine, "before_cursor_execute", record)
+    yield recorded
+    event.remove(Engine, "before_cursor_execute", record)
+
+
+@pytest.mark.asyncio
+class TestFriendsPages:
+
+    async def test_friends_are_paged_by_id(self, authorized_client, friends):
+        pages = []
+        params = {"pagination": True, "limit": 2}
+        while True:
+            response = await authorized_client.get("/friends/", params=params)
+            assert response.status_code == 200
+            pages.append([friend["id"] for friend in response.json()])
+            if "X-Next-After-Id" not in response.headers:
+                break
+            params["after_id"] = response.headers["X-Next-After-Id"]
+
+        assert pages == [friends[0:2], friends[2:4], friends[4:5]]
+
+    @pytest.mark.parametrize("limit", [0, -1, 101])
+    async def test_out_of_range_page_size_is_rejected(self, authorized_client, limit):
+        response = await authorized_client.get("/friends/", params={"pagination": True, "limit": limit})
+
+        assert response.status_code == 400
+
+    async def test_friends_are_sampled_without_sorting_by_random(self, authorized_client, friends, statements):
+        response = await authorized_client.get("/friends/")
+
+        assert response.status_code == 200
+        sample = [friend["id"] for friend in response.json()]
+        assert len(sample) == 3 and len(set(sample)) == 3
+        assert set(sample) <= set(friends)
+        assert statements and not any("random()" in statement for statement in statements)
+
+    async def test_sample_of_few_friends_holds_all_of_them(self, authorized_client, friends):
+        for friend_id in friends[2:]:
+            await authorized_client.post(f"/remove/friend/{friend_id}/")
+
+        response = await authorized_client.get("/friends/")
+
+        assert sorted(friend["id"] for friend in response.json()) == friends[:2]
@@ -0,0 +1,82 @@
+import time
+
+import pytest
+
+from app.api.schemas.users import UserRead
+from app.application.services.auth.auth_manager import AuthManager
+from app.application.services.auth.token_cache import TokenCache
+from app.application.services.user import UserService
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
+
+
+def make_user(user_id: int = 1) -> UserRead:
+    return UserRead(id=user_id, username="testuser", email="testuser@example.com", profile=None)
+
+
+@pytest.mark.asyncio
+class TestTokenCache:
+
+    async def test_second_lookup_skips_the_load(self):
+        cache = TokenCache(redis_utils)
+        loads = 0
+
+        async def load():
+            nonlocal loads
+            loads += 1
+            return make_user()
+
+        expires_at = time.time() + 3600
+        first = await cache.get_user("token", expires_at, load)
+        second = await cache.get_user("token", expires_at, load)
+
+        assert first == second == make_user()
+        assert loads == 1
+
+    async def test_entry_does_not_outlive_the_token(self):
+        cache = TokenCache(redis_utils)
+        loads = 0
+
+        async def load():
+            nonlocal loads
+            loads += 1
+            return make_user()
+
+        await cache.get_user("token", time.time() - 1, load)
+        await cache.get_user("token", time.time() - 1, load)
+
+        assert loads == 2
+
+    async def test_discarded_user_is_loaded_again(self):
+        cache = TokenCache(redis_utils)
+        loads = 0
+
+        async def load():
+            nonlocal loads
+            loads += 1
+            return make_user()
+
+        expires_at = time.time() + 3600
+        await cache.get_user("token", expires_at, load)
+        cache.discard_local(1)
+        await cache.get_user("token", expires_at, load)
+
+        assert loads == 2
+
+    @pytest.mark.usefixtures("redis_client")
+    async def test_friend_change_drops_the_cached_user(self, create_user, recipient):
+        auth_manager = AuthManager(UserService(UnitOfWork(async_session_maker)))
+        token = auth_manager.create_access_token({"sub": create_user.email})
+        user_service = UserService(UnitOfWork(async_session_maker))
+
+        before = await auth_manager.get_user(token=token)
+        assert await user_service.add_user_friend(recipient.id, create_user.id)
+        try:
+            after = await AuthManager(UserService(UnitOfWork(async_session_maker))).get_user(token=token)
+            assert after.friends_count == before.friends_count + 1
+        finally:
+            assert await user_service.remove_user_friend(recipient.id, create_user.id)
+
+        restored = await AuthManager(UserService(UnitOfWork(async_session_maker))).get_user(token=token)
+        assert restored.friends_count == before.friends_count
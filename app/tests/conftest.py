@@ -4,4 +4,5 @@ pytest_plugins = [
     "app.tests.fixtures.users",
     "app.tests.fixtures.event_loop",
     "app.tests.fixtures.auth",
+    "app.tests.fixtures.storage",
 ]
\ No newline at end of file
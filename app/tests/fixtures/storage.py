@@ -0,0 +1,38 @@
+import pytest_asyncio
+import redis.asyncio as redis
+
+from app.application.services.chat import ChatService
+
+from app.infrastructure.config.config import settings
+from app.infrastructure.config.database import init_mongo
+from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.models.nosql.read_states import ReadState
+from app.infrastructure.models.nosql.rooms import RoomState
+
+
+@pytest_asyncio.fixture(scope="session")
+async def mongo_models():
+    await init_mongo()
+
+
+@pytest_asyncio.fixture(scope="function")
+async def mongo(mongo_models):
+    yield
+    for model in (Message, RoomState, ReadState):
+        await model.get_motor_collection().delete_many({})
+
+
+@pytest_asyncio.fixture(scope="function")
+async def redis_client():
+    client = redis.Redis(host=settings.redis_host, port=settings.redis_port)
+    yield client
+    await client.flushdb()
+    await client.aclose()
+
+
+async def send_messages(chat_service: ChatService, room_id: int, count: int, user_id: int = 1) -> None:
+    """Sends `count` numbered messages of a user to a room."""
+    for number in range(count):
+        await chat_service.add_message_to_room(
+            room_id, {"text": f"message {number}", "user_id": user_id, "username": "testuser"}
+        )
@@ -10,7 +10,7 @@ async def create_user():
     auth_manager = AuthManager(user_service=None)
 
     password = "test_password"
-    hashed_password = auth_manager.get_password_hash(password)
+    hashed_password = await auth_manager.get_password_hash(password)
 
     async with async_session_maker() as session:
         user = User(
@@ -22,4 +22,19 @@ async def create_user():
         session.add(user)
         await session.commit()
         await session.refresh(user)
-        return user
\ No newline at end of file
+        return user
+
+
+@pytest_asyncio.fixture(scope="session")
+async def recipient():
+    async with async_session_maker() as session:
+        user = User(
+            email="recipient@example.com",
+            username="recipient",
+            hashed_password="-",
+            profile=Profile(first_name="Connect", last_name="Peer"),
+        )
+        session.add(user)
+        await session.commit()
+        await session.refresh(user)
+        return user
@@ -0,0 +1,19 @@
+class FakeWebSocket:
+    """A client that authenticates with `token` and records what it is sent."""
+
+    def __init__(self, token: str):
+        self.token = token
+        self.sent: list[str] = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def receive_text(self) -> str:
+        return self.token
+
+    async def send_text(self, payload: str):
+        self.sent.append(payload)
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
@@ -0,0 +1,119 @@
+import pytest
+import pytest_asyncio
+
+from app.application.services.history_cache import INVALIDATION_CHANNEL, HistoryCache
+from app.infrastructure.utils.json_codec import codec
+from app.infrastructure.utils.redis_utils.redis_utils import MESSAGE_LISTS_LRU_KEY, redis_utils
+
+ROOM_ID = 1
+KEY = f"chat:room:{ROOM_ID}:messages"
+
+
+def message(seq: int) -> dict:
+    return {"text": f"message {seq}", "user_id": 1, "seq": seq, "type": "chat_message"}
+
+
+def seqs(raw_messages: list[bytes]) -> list[int]:
+    return [codec.loads(raw_message)["seq"] for raw_message in raw_messages]
+
+
+def page_seqs(page: str) -> list[int]:
+    return [cached["seq"] for cached in codec.loads(page)]
+
+
+@pytest_asyncio.fixture
+async def cache(redis_client):
+    cache = HistoryCache(redis_utils)
+    cache.size = 3
+    return cache
+
+
+@pytest_asyncio.fixture
+async def invalidations(redis_client):
+    pubsub = redis_client.pubsub()
+    await pubsub.subscribe(INVALIDATION_CHANNEL)
+    await pubsub.get_message(timeout=1)
+    yield pubsub
+    await pubsub.aclose()
+
+
+@pytest.mark.asyncio
+class TestHistoryCacheAppend:
+
+    async def test_append_to_an_uncached_room_is_ignored(self, cache, redis_client):
+        await cache.append(ROOM_ID, codec.dumps(message(1)), 1)
+
+        assert not await redis_client.exists(KEY)
+
+    async def test_append_writes_through_and_trims_the_window(self, cache, redis_client):
+        await cache.fill(ROOM_ID, [message(1), message(2)])
+
+        for seq in (3, 4):
+            await cache.append(ROOM_ID, codec.dumps(message(seq)), seq)
+
+        assert seqs(await redis_client.lrange(KEY, 0, -1)) == [4, 3, 2]
+
+    async def test_seq_gap_drops_the_window_and_invalidates_workers(self, cache, redis_client, invalidations):
+        await cache.fill(ROOM_ID, [message(1), message(2)])
+
+        await cache.append(ROOM_ID, codec.dumps(message(4)), 4)
+
+        assert not await redis_client.exists(KEY)
+        assert await redis_client.zscore(MESSAGE_LISTS_LRU_KEY, str(ROOM_ID)) is None
+        published = await invalidations.get_message(ignore_subscribe_messages=True, timeout=1)
+        assert published["data"] == str(ROOM_ID).encode()
+
+
+@pytest.mark.asyncio
+class TestHistoryCacheLocal:
+
+    async def test_filled_room_is_served_from_process(self, cache, redis_client):
+        await cache.fill(ROOM_ID, [message(1), message(2)])
+        await redis_client.delete(KEY)
+
+        assert seqs(await cache.get(ROOM_ID)) == [2, 1]
+
+    async def test_next_message_is_applied(self, cache):
+        await cache.fill(ROOM_ID, [message(1), message(2)])
+        assert page_seqs(await cache.get_page(ROOM_ID, 2)) == [1, 2]
+
+        cache.apply_local(ROOM_ID, codec.dumps(message(3)))
+
+        assert page_seqs(await cache.get_page(ROOM_ID, 2)) == [2, 3]
+
+    async def test_already_applied_message_is_ignored(self, cache):
+        await cache.fill(ROOM_ID, [message(1), message(2)])
+
+        cache.apply_local(ROOM_ID, codec.dumps(message(2)))
+
+        assert seqs(await cache.get(ROOM_ID)) == [2, 1]
+
+    async def test_message_after_a_gap_discards_the_room(self, cache, redis_client):
+        await cache.fill(ROOM_ID, [message(1), message(2)])
+
+        cache.apply_local(ROOM_ID, codec.dumps(message(4)))
+        await redis_client.delete(KEY)
+
+        assert await cache.get(ROOM_ID) is None
+
+    async def test_message_of_an_uncached_room_is_not_applied(self, cache):
+        cache.apply_local(ROOM_ID, codec.dumps(message(1)))
+
+        assert await cache.get(ROOM_ID) is None
+
+    async def test_discarded_room_is_read_from_redis_again(self, cache, redis_client):
+        await cache.fill(ROOM_ID, [message(1), message(2)])
+        await redis_client.lpush(KEY, codec.dumps(message(3)))
+
+        assert seqs(await cache.get(ROOM_ID)) == [2, 1]
+        cache.discard_local(ROOM_ID)
+        assert seqs(await cache.get(ROOM_ID)) == [3, 2, 1]
+
+    async def test_least_recently_used_rooms_leave_the_process(self, cache, redis_client):
+        cache.max_local_rooms = 1
+        await cache.fill(ROOM_ID, [message(1)])
+        await cache.fill(ROOM_ID + 1, [message(1)])
+        await redis_client.delete(KEY)
+
+        assert await cache.get(ROOM_ID) is None
+        assert seqs(await cache.get(ROOM_ID + 1)) == [1]
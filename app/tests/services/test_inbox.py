@@ -0,0 +1,35 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.application.services.inbox import inbox
+
+USER_ID = 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("redis_client")
+class TestInbox:
+
+    async def test_pages_do_not_skip_chats_active_at_the_same_time(self):
+        now = datetime.now()
+        earlier = now - timedelta(minutes=1)
+        rooms = [(room_id, room_id + 100, now) for room_id in range(1, 6)]
+        rooms += [(room_id, room_id + 100, earlier) for room_id in range(6, 8)]
+        await inbox.fill(USER_ID, rooms)
+
+        pages, cursor = [], None
+        while True:
+            page, cursor = await inbox.get_page(USER_ID, 2, cursor)
+            pages.append(page)
+            if cursor is None:
+                break
+
+        seen = [room_id for page in pages for room_id, _ in page]
+        assert sorted(seen) == list(range(1, 8))
+        assert len(seen) == len(set(seen))
+        assert set(seen[:5]) == set(range(1, 6))
+
+    async def test_malformed_cursor_is_rejected(self):
+        with pytest.raises(ValueError):
+            await inbox.get_page(USER_ID, 2, "not-a-cursor")
@@ -0,0 +1,49 @@
+import pytest
+
+from app.application.services.chat import ChatService
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.models.nosql.read_states import ReadState
+from app.infrastructure.repositories.nosql.messages import MessageRepositoryMongoDB
+from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
+from app.tests.fixtures.storage import send_messages
+
+ROOM_ID = 1
+SENDER_ID = 1
+READER_ID = 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo", "redis_client")
+class TestReadReceipts:
+
+    async def test_late_receipt_does_not_bring_back_read_messages(self):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await send_messages(chat_service, ROOM_ID, 5, SENDER_ID)
+
+        assert await chat_service.mark_read(READER_ID, ROOM_ID, 4) == 1
+        assert await chat_service.mark_read(READER_ID, ROOM_ID, 2) == 1
+
+        state = await ReadState.find_one(ReadState.user_id == READER_ID, ReadState.room_id == ROOM_ID)
+        assert state.read_seq == 4
+        assert await chat_service.get_unread_counts(READER_ID, [ROOM_ID]) == {ROOM_ID: 1}
+
+    async def test_missing_counts_of_all_rooms_are_rebuilt_with_one_query(self, monkeypatch):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        for room_id, sent in ((1, 3), (2, 2), (3, 1)):
+            await send_messages(chat_service, room_id, sent, SENDER_ID)
+        await send_messages(chat_service, 2, 1, READER_ID)
+        await chat_service.mark_read(READER_ID, 1, 1)
+        await redis_utils.delete(f"chat:user:{READER_ID}:unread")
+
+        queries = []
+        count_unread = MessageRepositoryMongoDB.count_unread
+
+        async def recorded(self, user_id, after_seqs, exclude_seqs=None):
+            queries.append(dict(after_seqs))
+            return await count_unread(self, user_id, after_seqs, exclude_seqs)
+
+        monkeypatch.setattr(MessageRepositoryMongoDB, "count_unread", recorded)
+
+        assert await chat_service.get_unread_counts(READER_ID, [1, 2, 3, 4]) == {1: 2, 2: 2, 3: 1, 4: 0}
+        assert queries == [{1: 1, 2: 0, 3: 0, 4: 0}]
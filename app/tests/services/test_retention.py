@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+from app.application.services.chat import ChatService
+from app.application.services.history_cache import history_cache
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.config import settings
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.models.nosql.messages import Message
+from app.tests.fixtures.storage import send_messages
+
+ROOM_ID = 1
+TRIM_TIME = 0.05
+
+
+@pytest.fixture
+def trims(monkeypatch):
+    """Slows the trims down and records the sequence numbers they trim through."""
+    calls = []
+    trim_room = ChatService.trim_room
+
+    async def slow_trim_room(self, room_id, through_seq, retention):
+        calls.append(through_seq)
+        await asyncio.sleep(TRIM_TIME)
+        await trim_room(self, room_id, through_seq, retention)
+
+    monkeypatch.setattr(ChatService, "trim_room", slow_trim_room)
+    monkeypatch.setattr(settings, "message_retention_slack", 2)
+    return calls
+
+
+async def stored_seqs() -> list[int]:
+    messages = await Message.find(Message.room_id == ROOM_ID).sort("+seq").to_list()
+    return [message.seq for message in messages]
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo", "redis_client")
+class TestRetention:
+
+    async def test_room_is_trimmed_past_retention_and_slack(self, trims):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await chat_service.set_room_retention(ROOM_ID, 3)
+
+        await send_messages(chat_service, ROOM_ID, 5)
+        await asyncio.sleep(TRIM_TIME * 2)
+        assert trims == []
+
+        await send_messages(chat_service, ROOM_ID, 1)
+        await asyncio.sleep(TRIM_TIME * 2)
+        assert trims == [3]
+        assert await stored_seqs() == [4, 5, 6]
+
+    async def test_trims_of_a_room_are_coalesced(self, trims):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await chat_service.set_room_retention(ROOM_ID, 3)
+
+        await send_messages(chat_service, ROOM_ID, 8)
+        await asyncio.sleep(TRIM_TIME * 2)
+        assert trims == [3]
+
+        await send_messages(chat_service, ROOM_ID, 1)
+        await asyncio.sleep(TRIM_TIME * 2)
+        assert trims == [3, 6]
+        assert await stored_seqs() == [7, 8, 9]
+
+    async def test_history_cache_is_dropped_only_if_it_may_hold_trimmed_messages(self, monkeypatch):
+        invalidated = []
+
+        async def invalidate(room_id):
+            invalidated.append(room_id)
+
+        monkeypatch.setattr(history_cache, "invalidate", invalidate)
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+
+        await chat_service.trim_room(ROOM_ID, 1, retention=settings.history_cache_size)
+        assert invalidated == []
+
+        await chat_service.trim_room(ROOM_ID, 2, retention=settings.history_cache_size - 1)
+        assert invalidated == [ROOM_ID]
@@ -0,0 +1,60 @@
+import pytest
+
+from app.application.services.chat import ChatService
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.models.nosql.rooms import RoomState
+from app.tests.fixtures.storage import send_messages
+
+ROOM_ID = 1
+
+
+async def add_legacy_messages(count: int) -> None:
+    """Stores messages the way they were stored before sequence numbers."""
+    for number in range(count):
+        await Message(room_id=ROOM_ID, user_id=1, username="testuser", text=f"legacy {number}").insert()
+
+
+async def get_message_count(chat_service: ChatService) -> int:
+    summaries = await chat_service.get_room_summaries([ROOM_ID])
+    return summaries[ROOM_ID].message_count
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo")
+class TestRoomSummaries:
+
+    async def test_count_of_room_with_legacy_messages_is_backfilled(self):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await add_legacy_messages(2)
+        await send_messages(chat_service, ROOM_ID, 1)
+
+        state = await RoomState.find_one(RoomState.room_id == ROOM_ID)
+        assert state.message_count is None
+
+        assert await get_message_count(chat_service) == 3
+        await send_messages(chat_service, ROOM_ID, 2)
+        assert await get_message_count(chat_service) == 5
+
+    async def test_trim_subtracts_only_from_a_known_count(self):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await add_legacy_messages(2)
+        await send_messages(chat_service, ROOM_ID, 4)
+
+        await chat_service.trim_room(ROOM_ID, through_seq=1, retention=3)
+        assert await get_message_count(chat_service) == 3
+
+        await chat_service.trim_room(ROOM_ID, through_seq=2, retention=2)
+        assert await get_message_count(chat_service) == 2
+        assert await Message.find(Message.room_id == ROOM_ID).count() == 2
+
+    async def test_new_room_is_counted_once(self):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await send_messages(chat_service, ROOM_ID, 2)
+
+        assert await get_message_count(chat_service) == 2
+        await send_messages(chat_service, ROOM_ID, 1)
+
+        state = await RoomState.find_one(RoomState.room_id == ROOM_ID)
+        assert state.message_count == 3
@@ -0,0 +1,109 @@
+import asyncio
+import uuid
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import delete, func, select, text
+
+from app.api.schemas.chat import RoomSchema
+from app.application.services.room_cache import RoomCache, room_cache
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.models.nosql.read_states import ReadState
+from app.infrastructure.models.nosql.rooms import RoomState
+from app.infrastructure.models.relational.rooms import Room
+from app.infrastructure.repositories.relational.room import RoomRepository
+from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
+from scripts.merge_duplicate_rooms import find_duplicates, merge_rooms
+
+
+@pytest_asyncio.fixture
+async def users(create_user, recipient):
+    async def clear():
+        async with async_session_maker() as session:
+            await session.execute(delete(Room))
+            await session.commit()
+        await room_cache.invalidate(create_user.id, recipient.id)
+
+    await clear()
+    yield create_user.id, recipient.id
+    await clear()
+
+
+async def get_or_create(sender: int, recipient: int) -> Room:
+    async with async_session_maker() as session:
+        return await RoomRepository(session).get_and_create_room_by_users(sender, recipient)
+
+
+async def count_rooms() -> int:
+    async with async_session_maker() as session:
+        return await session.scalar(select(func.count()).select_from(Room))
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("redis_client")
+class TestRooms:
+
+    async def test_concurrent_get_or_create_returns_one_room(self, users):
+        user_id, other_user_id = users
+
+        rooms = await asyncio.gather(
+            *(get_or_create(user_id, other_user_id) for _ in range(3)),
+            *(get_or_create(other_user_id, user_id) for _ in range(3)),
+        )
+
+        assert len({room.id for room in rooms}) == 1
+        assert await count_rooms() == 1
+
+    async def test_room_cache_is_keyed_by_the_pair(self, users):
+        user_id, other_user_id = users
+        room = RoomSchema.model_validate(await get_or_create(user_id, other_user_id))
+
+        await room_cache.set(room)
+        assert await room_cache.get(other_user_id, user_id) == room
+        assert await RoomCache(redis_utils).get(other_user_id, user_id) == room
+
+        await room_cache.invalidate(other_user_id, user_id)
+        assert await room_cache.get(user_id, other_user_id) is None
+
+    @pytest.mark.usefixtures("mongo")
+    async def test_duplicate_rooms_are_merged(self, users):
+        user_id, other_user_id = users
+        async with async_session_maker() as session:
+            await session.execute(text("DROP INDEX uq_room_user_pair"))
+            rooms = [
+                Room(room_id=str(uuid.uuid4()), sender_id=user_id, recipient_id=other_user_id),
+                Room(room_id=str(uuid.uuid4()), sender_id=other_user_id, recipient_id=user_id),
+            ]
+            session.add_all(rooms)
+            await session.commit()
+        kept, merged = rooms[0].id, rooms[1].id
+
+        # Interleaved histories: the other user read the first room, nothing of the second one.
+        for seq, (room_id, sender_id) in enumerate(
+                [(kept, user_id), (merged, user_id), (kept, user_id)], start=1
+        ):
+            await Message(room_id=room_id, user_id=sender_id, username="testuser", text=str(seq), seq=seq).insert()
+        await ReadState(user_id=other_user_id, room_id=kept, read_seq=3).insert()
+
+        try:
+            async with async_session_maker() as session:
+                duplicates = await find_duplicates(session)
+                assert duplicates == [(user_id, other_user_id, [kept, merged])]
+                assert await merge_rooms(session, (user_id, other_user_id), [kept, merged]) == 3
+        finally:
+            async with async_session_maker() as session:
+                await session.execute(delete(Room).where(Room.id == merged))
+                await session.execute(text(
+                    "CREATE UNIQUE INDEX uq_room_user_pair ON room "
+                    "(least(sender_id, recipient_id), greatest(sender_id, recipient_id))"
+                ))
+                await session.commit()
+
+        messages = await Message.find(Message.room_id == kept).sort("+seq").to_list()
+        assert [(message.seq, message.text) for message in messages] == [(1, "1"), (2, "2"), (3, "3")]
+        state = await RoomState.find_one(RoomState.room_id == kept)
+        assert (state.seq, state.message_count, state.last_message) == (3, 3, "3")
+        read_state = await ReadState.find_one(ReadState.user_id == other_user_id)
+        assert (read_state.room_id, read_state.read_seq) == (kept, 1)
+        assert await count_rooms() == 1
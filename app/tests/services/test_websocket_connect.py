@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import pytest
+
+from app.application.services.auth.auth_manager import AuthManager
+from app.application.services.auth.token_cache import token_cache
+from app.application.services.chat import ChatService
+from app.application.services.history_cache import history_cache
+from app.application.services.user import UserService
+from app.application.services.websocket.websocket_manager import WebsocketManager
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.repositories.relational.user import UserRepository
+from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
+from app.tests.fixtures.websocket import FakeWebSocket
+
+QUERY_TIME = 0.2
+
+
+def record_intervals(monkeypatch, intervals: dict) -> None:
+    """Makes the user lookups slow and records when each one ran."""
+    for name in ("get_users_by_emails", "get_users_with_profiles"):
+        original = getattr(UserRepository, name)
+
+        async def timed(self, keys, original=original, name=name):
+            started = time.perf_counter()
+            await asyncio.sleep(QUERY_TIME)
+            result = await original(self, keys)
+            intervals[name] = (started, time.perf_counter())
+            return result
+
+        monkeypatch.setattr(UserRepository, name, timed)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo", "redis_client")
+class TestConnect:
+
+    async def test_user_and_recipient_are_looked_up_concurrently(self, monkeypatch, create_user, recipient):
+        intervals = {}
+        record_intervals(monkeypatch, intervals)
+        token_cache.clear_local()
+
+        uow = UnitOfWork(async_session_maker)
+        async with uow.scope():
+            user_service = UserService(uow)
+            auth_manager = AuthManager(user_service)
+            websocket = FakeWebSocket(auth_manager.create_access_token({"sub": create_user.email}))
+            manager = WebsocketManager(redis_utils, history_cache)
+
+            room, user, peer = await manager.connect(
+                websocket, recipient.id, ChatService(uow), user_service, auth_manager
+            )
+            await manager.disconnect(room.id, websocket)
+
+        assert (user.id, peer.id) == (create_user.id, recipient.id)
+        assert websocket.close_code is None and len(websocket.sent) == 1
+
+        auth_started, auth_ended = intervals["get_users_by_emails"]
+        recipient_started, recipient_ended = intervals["get_users_with_profiles"]
+        assert auth_started < recipient_ended and recipient_started < auth_ended
@@ -0,0 +1,70 @@
+import asyncio
+
+import pytest
+
+from app.application.services.websocket.connection import WebsocketConnection
+
+
+class StalledWebSocket:
+    """A client that receives nothing until it is released."""
+
+    def __init__(self):
+        self.sent: list[str] = []
+        self.close_code = None
+        self.released = asyncio.Event()
+
+    async def send_text(self, payload: str):
+        await self.released.wait()
+        self.sent.append(payload)
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+@pytest.mark.asyncio
+class TestWebsocketConnection:
+
+    async def test_queued_payloads_are_sent_in_order_once_started(self):
+        websocket = StalledWebSocket()
+        websocket.released.set()
+        connection = WebsocketConnection(websocket, max_queue_size=3)
+
+        assert connection.send("1") and connection.send("2")
+        connection.start()
+        assert connection.send("3")
+        await asyncio.sleep(0.01)
+
+        assert websocket.sent == ["1", "2", "3"]
+        connection.close()
+
+    async def test_drop_policy_discards_payloads_of_a_full_queue(self):
+        websocket = StalledWebSocket()
+        connection = WebsocketConnection(websocket, max_queue_size=2, overflow_policy="drop")
+
+        assert all(connection.send(str(number)) for number in range(4))
+        assert not connection.closed
+        assert connection.queue.qsize() == 2
+
+        connection.start()
+        websocket.released.set()
+        await asyncio.sleep(0.01)
+
+        assert websocket.sent == ["0", "1"]
+        connection.close()
+
+    async def test_disconnect_policy_evicts_and_closes_with_1013(self):
+        websocket = StalledWebSocket()
+        connection = WebsocketConnection(websocket, max_queue_size=2, overflow_policy="disconnect")
+        connection.start()
+
+        # The writer takes the first payload and stalls on it, the queue then fills up.
+        assert connection.send("0")
+        await asyncio.sleep(0)
+        assert connection.send("1") and connection.send("2")
+        assert not connection.send("3")
+        await asyncio.sleep(0.01)
+
+        assert connection.closed
+        assert websocket.close_code == 1013
+        assert not connection.send("4")
+        assert websocket.sent == []
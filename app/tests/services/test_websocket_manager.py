@@ -0,0 +1,209 @@
+import asyncio
+from typing import Optional
+
+import pytest
+import pytest_asyncio
+
+from app.application.services.auth.auth_manager import AuthManager
+from app.application.services.chat import ChatService
+from app.application.services.history_cache import history_cache
+from app.application.services.user import UserService
+from app.application.services.websocket.websocket_manager import (
+    WebsocketManager,
+    room_channel,
+    user_channel,
+)
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.config import settings
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.utils.json_codec import codec
+from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
+from app.infrastructure.utils.tasks import start_listener
+from app.tests.fixtures.storage import send_messages
+from app.tests.fixtures.websocket import FakeWebSocket
+
+DELIVERY_TIME = 0.2
+
+
+@pytest_asyncio.fixture
+async def manager(redis_client):
+    history_cache.clear_local()
+    manager = WebsocketManager(redis_utils, history_cache)
+    listener = asyncio.create_task(start_listener(redis_utils, manager))
+    yield manager
+    listener.cancel()
+    for user_id, connections in list(manager.chat_listeners.items()):
+        for websocket in list(connections):
+            await manager.disconnect_chat_list(user_id, websocket)
+
+
+async def open_chat_list(manager: WebsocketManager, user) -> FakeWebSocket:
+    auth_manager = AuthManager(UserService(UnitOfWork(async_session_maker)))
+    websocket = FakeWebSocket(auth_manager.create_access_token({"sub": user.email}))
+    await manager.connect_chat_list(websocket, auth_manager)
+    return websocket
+
+
+async def open_room(
+        manager: WebsocketManager, user, peer, last_seq: Optional[int] = None
+) -> tuple[int, FakeWebSocket]:
+    uow = UnitOfWork(async_session_maker)
+    async with uow.scope():
+        user_service = UserService(uow)
+        auth_manager = AuthManager(user_service)
+        websocket = FakeWebSocket(auth_manager.create_access_token({"sub": user.email}))
+        room, _, _ = await manager.connect(
+            websocket, peer.id, ChatService(uow), user_service, auth_manager, last_seq=last_seq
+        )
+    return room.id, websocket
+
+
+def history_seqs(websocket: FakeWebSocket) -> list[int]:
+    return [message["seq"] for message in codec.loads(websocket.sent[0])]
+
+
+async def subscribers(redis_client, channel: str) -> int:
+    [(_, count)] = await redis_client.pubsub_numsub(channel)
+    return count
+
+
+@pytest.mark.asyncio
+class TestChatUpdateRouting:
+
+    async def test_chat_update_reaches_only_its_user(self, manager, create_user, recipient):
+        own = await open_chat_list(manager, create_user)
+        other = await open_chat_list(manager, recipient)
+        await asyncio.sleep(DELIVERY_TIME)
+
+        await redis_utils.publish(user_channel(create_user.id), '{"type":"chat_update"}')
+        await asyncio.sleep(DELIVERY_TIME)
+
+        assert own.sent == ['{"type":"chat_update"}']
+        assert other.sent == []
+
+    async def test_room_messages_do_not_reach_chat_lists(self, manager, create_user):
+        websocket = await open_chat_list(manager, create_user)
+        await redis_utils.subscribe_channel(room_channel(1))
+        await asyncio.sleep(DELIVERY_TIME)
+
+        try:
+            await redis_utils.publish(room_channel(1), '{"type":"chat_message"}')
+            await asyncio.sleep(DELIVERY_TIME)
+        finally:
+            await redis_utils.unsubscribe_channel(room_channel(1))
+
+        assert websocket.sent == []
+
+
+@pytest.mark.asyncio
+class TestChannelSubscriptions:
+
+    async def test_chat_list_channel_follows_the_users_sockets(self, manager, redis_client, create_user):
+        channel = user_channel(create_user.id)
+        assert await subscribers(redis_client, channel) == 0
+
+        first = await open_chat_list(manager, create_user)
+        second = await open_chat_list(manager, create_user)
+        await asyncio.sleep(DELIVERY_TIME)
+        assert await subscribers(redis_client, channel) == 1
+
+        await manager.disconnect_chat_list(create_user.id, first)
+        assert await subscribers(redis_client, channel) == 1
+
+        await manager.disconnect_chat_list(create_user.id, second)
+        await asyncio.sleep(DELIVERY_TIME)
+        assert await subscribers(redis_client, channel) == 0
+        assert create_user.id not in manager.chat_listeners
+
+    @pytest.mark.usefixtures("mongo")
+    async def test_room_channel_follows_the_rooms_sockets(self, manager, redis_client, create_user, recipient):
+        room_id, first = await open_room(manager, create_user, recipient)
+        other_room_id, second = await open_room(manager, recipient, create_user)
+        assert other_room_id == room_id
+        await asyncio.sleep(DELIVERY_TIME)
+        assert await subscribers(redis_client, room_channel(room_id)) == 1
+
+        await manager.disconnect(room_id, first)
+        assert await subscribers(redis_client, room_channel(room_id)) == 1
+
+        await manager.disconnect(room_id, second)
+        await asyncio.sleep(DELIVERY_TIME)
+        assert await subscribers(redis_client, room_channel(room_id)) == 0
+        assert room_id not in manager.rooms
+
+
+@pytest.fixture
+def database_reads(monkeypatch):
+    """Records the sequence numbers the history after a reconnect is read from the database after."""
+    calls = []
+    get_messages_after_seq = ChatService.get_messages_after_seq
+
+    async def recorded(self, room_id, after_seq, limit):
+        calls.append(after_seq)
+        return await get_messages_after_seq(self, room_id, after_seq, limit)
+
+    monkeypatch.setattr(ChatService, "get_messages_after_seq", recorded)
+    return calls
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo")
+class TestReconnect:
+
+    async def test_reconnect_sends_only_the_missing_messages_from_the_cache(
+            self, manager, database_reads, create_user, recipient
+    ):
+        room_id, websocket = await open_room(manager, create_user, recipient)
+        await manager.disconnect(room_id, websocket)
+        await send_messages(ChatService(UnitOfWork(async_session_maker)), room_id, 5)
+
+        # The first connect fills the history cache, the reconnect is answered from it.
+        room_id, websocket = await open_room(manager, create_user, recipient)
+        assert history_seqs(websocket) == [1, 2, 3, 4, 5]
+        await manager.disconnect(room_id, websocket)
+
+        room_id, websocket = await open_room(manager, create_user, recipient, last_seq=3)
+        assert history_seqs(websocket) == [4, 5]
+        assert database_reads == []
+        await manager.disconnect(room_id, websocket)
+
+        room_id, websocket = await open_room(manager, create_user, recipient, last_seq=5)
+        assert history_seqs(websocket) == []
+        await manager.disconnect(room_id, websocket)
+
+    async def test_reconnect_past_the_cached_window_reads_the_database(
+            self, manager, database_reads, monkeypatch, create_user, recipient
+    ):
+        monkeypatch.setattr(history_cache, "size", 2)
+        room_id, websocket = await open_room(manager, create_user, recipient)
+        await manager.disconnect(room_id, websocket)
+        await send_messages(ChatService(UnitOfWork(async_session_maker)), room_id, 5)
+
+        # Fills the cache with the two newest messages.
+        room_id, websocket = await open_room(manager, create_user, recipient)
+        await manager.disconnect(room_id, websocket)
+
+        room_id, websocket = await open_room(manager, create_user, recipient, last_seq=1)
+        assert history_seqs(websocket) == [2, 3, 4, 5]
+        assert database_reads == [1]
+        await manager.disconnect(room_id, websocket)
+
+    async def test_reconnect_after_too_many_messages_resets_the_history(
+            self, manager, monkeypatch, create_user, recipient
+    ):
+        monkeypatch.setattr(history_cache, "size", 2)
+        monkeypatch.setattr(settings, "history_reconnect_max_messages", 3)
+        monkeypatch.setattr(settings, "history_page_size", 2)
+        room_id, websocket = await open_room(manager, create_user, recipient)
+        await manager.disconnect(room_id, websocket)
+        await send_messages(ChatService(UnitOfWork(async_session_maker)), room_id, 5)
+
+        room_id, websocket = await open_room(manager, create_user, recipient, last_seq=2)
+        assert history_seqs(websocket) == [3, 4, 5]
+        await manager.disconnect(room_id, websocket)
+
+        room_id, websocket = await open_room(manager, create_user, recipient, last_seq=1)
+        frame = codec.loads(websocket.sent[0])
+        assert frame["type"] == "history_reset"
+        assert [message["seq"] for message in frame["messages"]] == [4, 5]
+        await manager.disconnect(room_id, websocket)
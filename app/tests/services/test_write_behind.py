@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from app.application.services.chat import ChatService
+from app.application.services.write_behind import MESSAGES_GROUP, MESSAGES_STREAM, MessageWriteBehind
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.config import settings
+from app.infrastructure.config.database import async_session_maker
+from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.repositories.nosql.messages import MessageRepositoryMongoDB
+from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
+from app.tests.fixtures.storage import send_messages
+
+ROOM_ID = 1
+READER_ID = 2
+
+
+def make_writer(consumer: str) -> MessageWriteBehind:
+    writer = MessageWriteBehind(redis_utils, MessageRepositoryMongoDB())
+    writer.consumer = consumer
+    return writer
+
+
+@pytest.fixture
+def write_behind(monkeypatch):
+    monkeypatch.setattr(settings, "message_write_behind", True)
+
+
+@pytest.mark.asyncio
+@pytest.mark.usefixtures("mongo", "redis_client")
+class TestMessageWriteBehind:
+
+    async def test_reads_include_messages_not_flushed_yet(self, monkeypatch):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await send_messages(chat_service, ROOM_ID, 1)
+        monkeypatch.setattr(settings, "message_write_behind", True)
+        await send_messages(chat_service, ROOM_ID, 3)
+
+        assert await Message.find(Message.room_id == ROOM_ID).count() == 1
+
+        after = await chat_service.get_messages_after_seq(ROOM_ID, 1)
+        page, _ = await chat_service.get_messages_page(ROOM_ID)
+        older, _ = await chat_service.get_messages_page(ROOM_ID, before=4, limit=2)
+        latest = await chat_service.get_messages_for_room(ROOM_ID, limit=2)
+
+        assert [message.seq for message in after] == [2, 3, 4]
+        assert [message.seq for message in page] == [1, 2, 3, 4]
+        assert [message.seq for message in older] == [2, 3]
+        assert [message.seq for message in latest] == [3, 4]
+        assert await chat_service.mark_read(READER_ID, ROOM_ID, 1) == 3
+
+    async def test_flushed_messages_are_not_read_twice(self, write_behind):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await send_messages(chat_service, ROOM_ID, 3)
+
+        writer = make_writer("worker-1")
+        await redis_utils.stream_create_group(MESSAGES_STREAM, MESSAGES_GROUP)
+        await writer._read()
+        await writer.flush()
+
+        assert await Message.find(Message.room_id == ROOM_ID).count() == 3
+        assert await writer.get_unflushed(ROOM_ID) == []
+        assert [message.seq for message in await chat_service.get_messages_after_seq(ROOM_ID, 0)] == [1, 2, 3]
+        assert await chat_service.mark_read(READER_ID, ROOM_ID, 0) == 3
+
+    async def test_entries_of_a_crashed_worker_are_replayed_once(self, write_behind, monkeypatch):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await send_messages(chat_service, ROOM_ID, 3)
+
+        crashed = make_writer("worker-1")
+        await redis_utils.stream_create_group(MESSAGES_STREAM, MESSAGES_GROUP)
+        await crashed._read()
+        # The first worker stores the batch, then dies before acknowledging it.
+        await crashed.repository.add_many(list(crashed._batch.values()))
+
+        monkeypatch.setattr(settings, "message_max_persist_lag", 0)
+        survivor = make_writer("worker-2")
+        await survivor._claim_idle()
+        await survivor.flush()
+
+        stored = await Message.find(Message.room_id == ROOM_ID).sort("seq").to_list()
+        assert [message.seq for message in stored] == [1, 2, 3]
+        assert await survivor.get_unflushed(ROOM_ID) == []
+        assert await redis_utils.stream_oldest_age(MESSAGES_STREAM) == 0.0
+
+    async def test_consumer_with_pending_entries_is_kept_on_stop(self, write_behind, redis_client, monkeypatch):
+        chat_service = ChatService(UnitOfWork(async_session_maker))
+        await send_messages(chat_service, ROOM_ID, 3)
+
+        # The entries are delivered to the worker, but the reply never reaches it.
+        await redis_utils.stream_create_group(MESSAGES_STREAM, MESSAGES_GROUP)
+        await redis_utils.stream_read_group(MESSAGES_STREAM, MESSAGES_GROUP, "worker-1", count=10, block_ms=0)
+
+        writer = make_writer("worker-1")
+        flushing = asyncio.create_task(writer.run())
+        await asyncio.sleep(0.05)
+        writer.stop()
+        await flushing
+
+        consumers = await redis_client.xinfo_consumers(MESSAGES_STREAM, MESSAGES_GROUP)
+        assert [(consumer["name"], consumer["pending"]) for consumer in consumers] == [(b"worker-1", 3)]
+
+        monkeypatch.setattr(settings, "message_max_persist_lag", 0)
+        survivor = make_writer("worker-2")
+        await survivor._claim_idle()
+        await survivor.flush()
+        assert await Message.find(Message.room_id == ROOM_ID).count() == 3
+
+    async def test_idle_consumer_leaves_the_group_on_stop(self, write_behind, redis_client):
+        writer = make_writer("worker-1")
+        flushing = asyncio.create_task(writer.run())
+        await asyncio.sleep(0.05)
+        writer.stop()
+        await flushing
+
+        assert await redis_client.xinfo_consumers(MESSAGES_STREAM, MESSAGES_GROUP) == []
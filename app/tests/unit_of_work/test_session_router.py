@@ -0,0 +1,134 @@
+import asyncio
+import os
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+from app.infrastructure.config.config import settings
+from app.infrastructure.config.database import SessionRouter, async_session_maker, session_router
+from app.main import PRIMARY_PIN_COOKIE
+
+# A streaming replica of the test database, as "host" or "host:port" (see docker-compose.test.yaml).
+REPLICA_HOST = os.environ.get("TEST_DB_REPLICA_HOST")
+
+requires_replica = pytest.mark.skipif(not REPLICA_HOST, reason="TEST_DB_REPLICA_HOST is not set")
+
+
+def replica_session_maker(host: str) -> async_sessionmaker:
+    [url] = settings.model_copy(update={"db_replica_hosts": [host]}).replica_postgresql_urls
+    return async_sessionmaker(create_async_engine(url), class_=AsyncSession, expire_on_commit=False)
+
+
+async def reads_replica(uow: UnitOfWork) -> bool:
+    return await uow.session.scalar(text("SELECT pg_is_in_recovery()"))
+
+
+@pytest_asyncio.fixture
+async def replica():
+    session_maker = replica_session_maker(REPLICA_HOST)
+    yield session_maker
+    await session_maker.kw["bind"].dispose()
+
+
+@pytest_asyncio.fixture
+async def unreachable_replica():
+    session_maker = replica_session_maker("localhost:1")
+    yield session_maker
+    await session_maker.kw["bind"].dispose()
+
+
+@pytest.mark.asyncio
+class TestSessionRouter:
+
+    @requires_replica
+    async def test_reads_go_to_the_replica_and_writes_to_the_primary(self, replica):
+        uow = UnitOfWork(SessionRouter(async_session_maker, [replica]))
+
+        async with uow.read_only():
+            assert await reads_replica(uow)
+        async with uow:
+            assert not await reads_replica(uow)
+
+    @requires_replica
+    async def test_committed_write_pins_the_reads_of_the_request(self, replica):
+        uow = UnitOfWork(SessionRouter(async_session_maker, [replica]))
+        pin = SessionRouter.start_request(pinned=False)
+
+        async with uow.read_only():
+            assert await reads_replica(uow)
+        async with uow:
+            await uow.session.execute(text("SELECT 1"))
+
+        assert pin.wrote
+        async with uow.read_only():
+            assert not await reads_replica(uow)
+
+    @requires_replica
+    async def test_pinned_request_reads_from_the_primary(self, replica):
+        uow = UnitOfWork(SessionRouter(async_session_maker, [replica]))
+        SessionRouter.start_request(pinned=True)
+
+        async with uow.read_only():
+            assert not await reads_replica(uow)
+
+    async def test_unit_of_work_reads_its_writes_after_the_request_wrote(self):
+        uow = UnitOfWork(SessionRouter(async_session_maker, []))
+        pin = SessionRouter.start_request(pinned=False)
+        assert not uow.reads_own_writes
+
+        pin.wrote = True
+
+        assert uow.reads_own_writes
+        assert not UnitOfWork(async_session_maker).reads_own_writes
+
+    async def test_failed_replica_is_skipped_until_the_retry_interval(self, monkeypatch, unreachable_replica):
+        monkeypatch.setattr(settings, "db_replica_retry_interval", 0.2)
+        router = SessionRouter(async_session_maker, [unreachable_replica])
+        uow = UnitOfWork(router)
+
+        with pytest.raises((OperationalError, OSError)):
+            async with uow.read_only():
+                await uow.session.execute(text("SELECT 1"))
+
+        async with uow.read_only():
+            assert not router.is_replica(uow.session)
+            assert not await reads_replica(uow)
+
+        await asyncio.sleep(0.3)
+        assert router.is_replica(router(read_only=True))
+
+    async def test_health_check_takes_the_replica_out_of_rotation(self, monkeypatch, unreachable_replica):
+        monkeypatch.setattr(settings, "db_replica_retry_interval", 10)
+        router = SessionRouter(async_session_maker, [unreachable_replica])
+        assert router.is_replica(router(read_only=True))
+
+        check = asyncio.create_task(router.check_replicas())
+        await asyncio.sleep(0.5)
+        check.cancel()
+
+        assert not router.is_replica(router(read_only=True))
+
+
+@pytest.mark.asyncio
+class TestReadYourWrites:
+
+    @requires_replica
+    async def test_client_is_pinned_to_the_primary_after_a_write(
+            self, monkeypatch, authorized_client, replica, recipient
+    ):
+        monkeypatch.setattr(session_router, "replicas", [replica])
+        monkeypatch.setattr(session_router, "_down_until", [0.0])
+
+        response = await authorized_client.get("/friends/")
+        assert response.status_code == 200
+        assert PRIMARY_PIN_COOKIE not in response.cookies
+
+        response = await authorized_client.post(f"/add/friend/{recipient.id}/")
+        assert response.status_code == 200
+        assert PRIMARY_PIN_COOKIE in response.cookies
+
+        await authorized_client.post(f"/remove/friend/{recipient.id}/")
@@ -0,0 +1,69 @@
+import pytest
+
+from app.application.unit_of_work.unit_of_work import UnitOfWork
+
+
+class FakeSession:
+
+    def __init__(self, log: list):
+        self.log = log
+
+    async def commit(self):
+        self.log.append("commit")
+
+    async def rollback(self):
+        self.log.append("rollback")
+
+    async def close(self):
+        self.log.append("close")
+
+
+class FakeRepository:
+
+    def __init__(self, session):
+        self.session = session
+
+
+@pytest.mark.asyncio
+class TestUnitOfWork:
+
+    async def test_scope_shares_one_session(self):
+        log = []
+        sessions = []
+
+        def session_factory():
+            sessions.append(FakeSession(log))
+            return sessions[-1]
+
+        uow = UnitOfWork(session_factory)
+        async with uow.scope():
+            async with uow:
+                pass
+            async with uow.read_only():
+                pass
+
+        assert len(sessions) == 1
+        assert log == ["commit", "close"]
+
+    async def test_read_only_skips_commit_and_closes_outside_scope(self):
+        log = []
+        uow = UnitOfWork(lambda: FakeSession(log))
+
+        async with uow.read_only():
+            pass
+
+        assert log == ["close"]
+        assert uow.session is None
+
+    async def test_repositories_are_cached_per_session(self):
+        log = []
+        uow = UnitOfWork(lambda: FakeSession(log))
+        uow.set_repository("fake", FakeRepository)
+
+        async with uow:
+            first = uow.fake
+            assert uow.fake is first
+            assert first.session is uow.session
+
+        async with uow:
+            assert uow.fake is not first
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app.infrastructure.utils.batch_loader import BatchLoader
+
+
+@pytest.mark.asyncio
+class TestBatchLoader:
+
+    async def test_concurrent_loads_are_batched(self):
+        batches = []
+
+        async def load(keys):
+            batches.append(keys)
+            return {key: key * 10 for key in keys if key != 3}
+
+        loader = BatchLoader(load)
+        results = await asyncio.gather(loader.load(1), loader.load(2), loader.load(3), loader.load(1))
+
+        assert results == [10, 20, None, 10]
+        assert batches == [[1, 2, 3]]
+
+    async def test_loaded_values_are_cached(self):
+        batches = []
+
+        async def load(keys):
+            batches.append(keys)
+            return {key: key for key in keys}
+
+        loader = BatchLoader(load)
+        assert await loader.load(1) == 1
+        assert await loader.load_many([1, 2]) == [1, 2]
+        assert batches == [[1], [2]]
+
+        loader.clear(1)
+        assert await loader.load(1) == 1
+        assert batches == [[1], [2], [1]]
+
+    async def test_failed_load_is_not_cached(self):
+        calls = 0
+
+        async def load(keys):
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                raise ValueError("boom")
+            return {key: "ok" for key in keys}
+
+        loader = BatchLoader(load)
+        results = await asyncio.gather(loader.load(1), loader.load(2), return_exceptions=True)
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await loader.load(1) == "ok"
@@ -0,0 +1,30 @@
+import asyncio
+
+import pytest
+
+from app.infrastructure.utils.metrics import metrics
+from app.infrastructure.utils.password_hasher import PasswordHasher
+
+
+@pytest.mark.asyncio
+class TestPasswordHasher:
+
+    async def test_hash_and_verify(self):
+        hasher = PasswordHasher(workers=2)
+
+        hashed_password = await hasher.hash("secret")
+
+        assert await hasher.verify("secret", hashed_password)
+        assert not await hasher.verify("wrong", hashed_password)
+        hasher.shutdown()
+
+    async def test_calls_beyond_the_limit_wait_for_their_turn(self):
+        hasher = PasswordHasher(workers=1)
+        hashed_password = await hasher.hash("secret")
+
+        results = await asyncio.gather(*(hasher.verify("secret", hashed_password) for _ in range(3)))
+
+        assert results == [True] * 3
+        assert hasher.waiting == 0
+        assert metrics.snapshot()["timings"]["password_hash.queue_time"]["count"] >= 4
+        hasher.shutdown()
@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from app.infrastructure.utils.single_flight import SingleFlight, single_flight
+
+
+class FakeUnitOfWork:
+
+    def __init__(self, in_progress: bool = False, reads_own_writes: bool = False):
+        self.in_progress = in_progress
+        self.reads_own_writes = reads_own_writes
+
+    def fork(self):
+        return FakeUnitOfWork(reads_own_writes=self.reads_own_writes)
+
+
+class FakeService:
+
+    def __init__(self, uow: FakeUnitOfWork):
+        self.uow = uow
+        self.calls = []
+
+    def fork(self):
+        service = FakeService(self.uow.fork())
+        service.calls = self.calls
+        return service
+
+    @single_flight
+    async def load(self, key: str):
+        self.calls.append(self)
+        await asyncio.sleep(0.01)
+        return key
+
+
+@pytest.mark.asyncio
+class TestSingleFlight:
+
+    async def test_concurrent_calls_share_one_execution(self):
+        group = SingleFlight()
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "value"
+
+        results = await asyncio.gather(*(group.do("key", load) for _ in range(10)))
+
+        assert results == ["value"] * 10
+        assert calls == 1
+
+    async def test_call_runs_again_after_completion(self):
+        group = SingleFlight()
+        calls = 0
+
+        async def load():
+            nonlocal calls
+            calls += 1
+            return calls
+
+        assert await group.do("key", load) == 1
+        assert await group.do("key", load) == 2
+
+    async def test_exception_is_shared_and_not_cached(self):
+        group = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(
+            group.do("key", fail),
+            group.do("key", fail),
+            return_exceptions=True
+        )
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert await group.do("key", lambda: asyncio.sleep(0, result="ok")) == "ok"
+
+
+@pytest.mark.asyncio
+class TestSingleFlightDecorator:
+
+    async def test_shared_call_runs_on_a_fork(self):
+        services = [FakeService(FakeUnitOfWork()) for _ in range(3)]
+
+        results = await asyncio.gather(*(service.load("key") for service in services))
+
+        assert results == ["key"] * 3
+        assert len(services[0].calls) == 1
+        assert services[0].calls[0] not in services
+
+    async def test_call_inside_unit_of_work_runs_on_caller(self):
+        service = FakeService(FakeUnitOfWork(in_progress=True))
+
+        assert await service.load("key") == "key"
+        assert service.calls == [service]
+
+    async def test_request_reading_its_writes_is_not_shared(self):
+        service = FakeService(FakeUnitOfWork(reads_own_writes=True))
+
+        await asyncio.gather(service.load("key"), service.load("key"))
+
+        assert service.calls == [service, service]
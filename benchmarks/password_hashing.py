@@ -0,0 +1,71 @@
+"""
+    Measures the event loop lag caused by concurrent logins, with bcrypt run inline
+    on the event loop (as before) and on the password hasher pool.
+
+    Run from the repository root with the application settings in the environment (see env.example):
+    python -m benchmarks.password_hashing [--logins 100] [--workers 4]
+"""
+import argparse
+import asyncio
+import time
+
+from passlib.context import CryptContext
+
+from app.infrastructure.utils.password_hasher import PasswordHasher
+
+PASSWORD = "test_password"
+TICK = 0.005
+
+
+async def measure_lag(stop: asyncio.Event) -> list[float]:
+    """
+        Sleeps in short ticks and records how late every wake-up is.
+    """
+    lags = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(TICK)
+        lags.append(time.perf_counter() - start - TICK)
+    return lags
+
+
+async def run(name: str, login, logins: int) -> None:
+    stop = asyncio.Event()
+    probe = asyncio.create_task(measure_lag(stop))
+    await asyncio.sleep(TICK * 2)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - start
+
+    stop.set()
+    lags = sorted(await probe)
+    print(
+        f"{name:>7}: {logins} logins in {elapsed:.2f}s, "
+        f"loop lag p50={lags[len(lags) // 2] * 1000:.1f}ms "
+        f"p99={lags[int(len(lags) * 0.99)] * 1000:.1f}ms max={lags[-1] * 1000:.1f}ms"
+    )
+
+
+async def main(logins: int, workers: int) -> None:
+    context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    hasher = PasswordHasher(workers=workers)
+    hashed_password = context.hash(PASSWORD)
+
+    async def inline_login():
+        context.verify(PASSWORD, hashed_password)
+
+    async def pooled_login():
+        await hasher.verify(PASSWORD, hashed_password)
+
+    await run("inline", inline_login, logins)
+    await run("pooled", pooled_login, logins)
+    hasher.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--logins", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+    asyncio.run(main(args.logins, args.workers))
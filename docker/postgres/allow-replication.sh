@@ -0,0 +1,3 @@
+#!/bin/sh
+# Lets the test replica stream from this server (see test_db_replica in docker-compose.test.yaml).
+echo "host replication all all trust" >> "$PGDATA/pg_hba.conf"
@@ -38,7 +38,10 @@ async function initializeWebSocket() {
 
     const wsProtocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
     const wsHost = window.location.host;
-    let socket = new WebSocket(`${wsProtocol}//${wsHost}/ws/${recipient_id}`);
+    let socket;
+    let lastSeq = null;
+    let nextBefore = null;
+    let historyRequested = false;
     let messagesContainer = document.getElementById('messagesContainer');
     let sendMessageForm = document.getElementById('sendMessageForm');
     let messageInput = document.getElementById('messageInput');
@@ -70,44 +73,122 @@ async function initializeWebSocket() {
     }
   });
 
-    socket.onopen = () => {
-      console.log('WebSocket connection established');
-      socket.send(jwtToken); 
-    };
+    function handleMessage(msg) {
+      if (!msg || !msg.text || msg.text.trim() === "") {
+        return;
+      }
+      if (msg.seq !== undefined && msg.seq !== null) {
+        // Messages can arrive twice around a reconnect: once in the delta and once live.
+        if (lastSeq !== null && msg.seq <= lastSeq) {
+          return;
+        }
+        lastSeq = msg.seq;
+        scheduleReadReceipt();
+      }
+      addMessageToContainer(msg.username, msg.text, msg.avatarUrl);
+    }
 
-    
-    socket.onmessage = (event) => {
-    let messageData = JSON.parse(event.data);
-    
+    let readTimer = null;
+    let lastReadSeq = null;
+
+    function scheduleReadReceipt() {
+      if (readTimer !== null) return;
+      // Receipts are batched: one frame per second at most, for the newest message shown.
+      readTimer = setTimeout(() => {
+        readTimer = null;
+        if (lastSeq === null || lastSeq === lastReadSeq || socket.readyState !== WebSocket.OPEN) {
+          return;
+        }
+        lastReadSeq = lastSeq;
+        socket.send(JSON.stringify({type: "read", seq: lastSeq}));
+      }, 1000);
+    }
+
+    function requestOlderMessages() {
+      if (nextBefore === null || historyRequested || socket.readyState !== WebSocket.OPEN) {
+        return;
+      }
+      historyRequested = true;
+      socket.send(JSON.stringify({type: "history", before: nextBefore}));
+    }
 
-    if (Array.isArray(messageData)) {
-      messageData.forEach((msg) => {
+    function handleHistoryPage(page) {
+      historyRequested = false;
+      nextBefore = page.next_before;
+
+      const previousHeight = messagesContainer.scrollHeight;
+      page.messages.slice().reverse().forEach((msg) => {
         if (msg && msg.text && msg.text.trim() !== "") {
-          addMessageToContainer(msg.username, msg.text, msg.avatarUrl);
+          messagesContainer.prepend(createMessageElement(msg.username, msg.text, msg.avatarUrl));
         }
       });
-    } else if (messageData && messageData.text && messageData.text.trim() !== "") {
-      addMessageToContainer(messageData.username, messageData.text, messageData.avatarUrl);
-    } else {
-      console.warn("Неизвестный формат сообщения:", messageData);
+      messagesContainer.scrollTop = messagesContainer.scrollHeight - previousHeight;
     }
-};
 
+    messagesContainer.addEventListener('scroll', () => {
+      if (messagesContainer.scrollTop === 0) {
+        requestOlderMessages();
+      }
+    });
 
-    socket.onerror = (error) => {
-      console.error('WebSocket error:', error);
-    };
-    
-
-    socket.onclose = (event) => {
-      if (event.code === 1008) {
-        window.location.href = '/profile/';
-      } else {
-        console.log('Соединение закрыто:', event);
+    function showMessages(messages) {
+      if (lastSeq === null && messages.length > 0) {
+        const oldest = messages[0];
+        nextBefore = oldest.seq !== undefined && oldest.seq !== null ? oldest.seq : null;
       }
-    };
+      messages.forEach(handleMessage);
+    }
+
+    function openSocket() {
+      const query = lastSeq !== null ? `?last_seq=${lastSeq}` : '';
+      socket = new WebSocket(`${wsProtocol}//${wsHost}/ws/${recipient_id}${query}`);
+
+      socket.onopen = () => {
+        console.log('WebSocket connection established');
+        socket.send(jwtToken); 
+      };
+
+      socket.onmessage = (event) => {
+        let messageData = JSON.parse(event.data);
+
+        if (Array.isArray(messageData)) {
+          showMessages(messageData);
+        } else if (messageData && messageData.type === "history_reset") {
+          // Too many messages were missed while disconnected: the chat starts over from the latest page.
+          messagesContainer.replaceChildren();
+          lastSeq = null;
+          showMessages(messageData.messages);
+        } else if (messageData && messageData.type === "history") {
+          handleHistoryPage(messageData);
+        } else if (messageData && messageData.text && messageData.text.trim() !== "") {
+          handleMessage(messageData);
+        } else {
+          console.warn("Неизвестный формат сообщения:", messageData);
+        }
+      };
+
+      socket.onerror = (error) => {
+        console.error('WebSocket error:', error);
+      };
+
+      socket.onclose = (event) => {
+        if (event.code === 1008) {
+          window.location.href = '/profile/';
+        } else {
+          console.log('Соединение закрыто, переподключение через 5 секунд:', event);
+          setTimeout(openSocket, 5000);
+        }
+      };
+    }
+
+    openSocket();
     
     function addMessageToContainer(username, messageText, avatarUrl) {
+      messagesContainer.appendChild(createMessageElement(username, messageText, avatarUrl));
+      messagesContainer.scrollTop = messagesContainer.scrollHeight;
+    }
+
+    function createMessageElement(username, messageText, avatarUrl) {
       let messageElement = document.createElement('div');
       messageElement.classList.add('message');
       messageElement.style.marginBottom = '10px';
@@ -130,9 +211,8 @@ async function initializeWebSocket() {
       messageTextElement.classList.add('message-text');
       messageTextElement.textContent = messageText;
       messageElement.appendChild(messageTextElement);
-    
-      messagesContainer.appendChild(messageElement);
-      messagesContainer.scrollTop = messagesContainer.scrollHeight;
+
+      return messageElement;
     }
 
     sendMessageForm.addEventListener('submit', (event) => {
@@ -140,7 +220,7 @@ async function initializeWebSocket() {
     let inputText = messageInput.value.trim();
     if (inputText) {
       try {
-        socket.send(inputText); 
+        socket.send(JSON.stringify({type: "message", text: inputText}));
         messageInput.value = '';
       } catch (error) {
       console.error("Ошибка при отправке сообщения:", error);
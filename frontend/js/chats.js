@@ -46,31 +46,111 @@ function renderChatItem(chat) {
     });
   }
 
+  const unread = document.createElement("span");
+  unread.className = "chat-unread";
+  setUnreadCount(unread, chat.unread_count ?? 0);
+
   li.appendChild(avatar);
   li.appendChild(info);
   li.appendChild(time);
+  li.appendChild(unread);
 
   return li;
 }
 
-async function loadChats() {
+function setUnreadCount(badge, count) {
+  if (count === undefined || count === null) return;
+  badge.textContent = count > 0 ? count : "";
+  badge.style.display = count > 0 ? "" : "none";
+}
+
+let nextCursor = null;
+let loadingChats = false;
+let chatListVersion = null;
+
+async function loadChats(cursor = null) {
+  if (loadingChats) return;
+  loadingChats = true;
+
   try {
-    const response = await fetch("/api/chats", { credentials: "include" });
+    const url = cursor === null ? "/api/chats" : `/api/chats?cursor=${encodeURIComponent(cursor)}`;
+    const response = await fetch(url, { credentials: "include" });
     if (!response.ok) throw new Error("Ошибка загрузки чатов");
     const chats = await response.json();
+    nextCursor = response.headers.get("X-Next-Cursor");
+    if (cursor === null) {
+      chatListVersion = Number(response.headers.get("X-Chat-List-Version"));
+    }
 
     const chatList = document.getElementById("chatList");
-    chatList.innerHTML = "";
+    if (cursor === null) {
+      chatList.innerHTML = "";
+    }
 
     chats.forEach(chat => {
-      chatList.appendChild(renderChatItem(chat));
+      if (!chatList.querySelector(`[data-room-id="${chat.room_id}"]`)) {
+        chatList.appendChild(renderChatItem(chat));
+      }
     });
   } catch (error) {
     console.error(error);
-    document.getElementById("chatList").innerHTML = "<p>Ошибка загрузки чатов</p>";
+    if (cursor === null) {
+      document.getElementById("chatList").innerHTML = "<p>Ошибка загрузки чатов</p>";
+    }
+  } finally {
+    loadingChats = false;
+  }
+}
+
+async function syncChats() {
+  if (chatListVersion === null) {
+    return loadChats();
+  }
+
+  try {
+    const response = await fetch(`/api/chats?since=${chatListVersion}`, { credentials: "include" });
+    if (response.status === 304) return;
+    if (!response.ok) throw new Error("Ошибка синхронизации чатов");
+
+    const chats = await response.json();
+    const reset = response.headers.get("X-Chat-List-Reset") !== null;
+    chatListVersion = Number(response.headers.get("X-Chat-List-Version"));
+
+    if (reset) {
+      nextCursor = response.headers.get("X-Next-Cursor");
+      const chatList = document.getElementById("chatList");
+      chatList.innerHTML = "";
+      chats.forEach(chat => chatList.appendChild(renderChatItem(chat)));
+      return;
+    }
+
+    // Changed chats come newest first, so prepending them in reverse keeps the order.
+    chats.slice().reverse().forEach(upsertChatItem);
+  } catch (error) {
+    console.error(error);
+  }
+}
+
+function upsertChatItem(chat) {
+  const chatList = document.getElementById("chatList");
+  const existingItem = chatList.querySelector(`[data-room-id="${chat.room_id}"]`);
+  if (existingItem) {
+    existingItem.remove();
+  }
+  chatList.prepend(renderChatItem(chat));
+}
+
+function loadMoreChatsOnScroll() {
+  if (nextCursor === null || loadingChats) return;
+
+  const wrapper = document.querySelector(".chats-wrapper");
+  if (wrapper.scrollTop + wrapper.clientHeight >= wrapper.scrollHeight - 100) {
+    loadChats(nextCursor);
   }
 }
 
+document.querySelector(".chats-wrapper").addEventListener("scroll", loadMoreChatsOnScroll);
+
 let audioCtx;
 
 function initAudio() {
@@ -119,6 +199,8 @@ async function initializeChatListWebSocket() {
   socket.onopen = () => {
     console.log('WebSocket connection for chat list established');
     socket.send(jwtToken);
+    // Catches up with the changes missed while the socket was closed.
+    syncChats();
   };
 
   socket.onmessage = (event) => {
@@ -126,6 +208,18 @@ async function initializeChatListWebSocket() {
       let data = JSON.parse(event.data);
       console.log("WebSocket message data:", data);
 
+      if (data.version !== undefined && chatListVersion !== null) {
+        if (data.version <= chatListVersion) {
+          return;
+        }
+        if (data.version > chatListVersion + 1) {
+          // An event was missed, the sync also brings this one.
+          syncChats();
+          return;
+        }
+        chatListVersion = data.version;
+      }
+
       if (data.type === "chat_update") {
         const chatList = document.getElementById("chatList");
         const existingItem = chatList.querySelector(`[data-room-id="${data.room_id}"]`);
@@ -142,12 +236,18 @@ async function initializeChatListWebSocket() {
               month: "2-digit"
             });
           }
+          setUnreadCount(existingItem.querySelector(".chat-unread"), data.unread_count);
           chatList.prepend(existingItem);
         } else {
           const newChat = renderChatItem(data);
           chatList.prepend(newChat);
         }
         playNotificationSound();
+      } else if (data.type === "chat_read") {
+        const existingItem = document.querySelector(`#chatList [data-room-id="${data.room_id}"]`);
+        if (existingItem) {
+          setUnreadCount(existingItem.querySelector(".chat-unread"), data.unread_count);
+        }
       }
     } catch (err) {
       console.error("Ошибка обработки сообщения чата:", err);
@@ -13,6 +13,7 @@ async function handleRequest() {
     let lastNameValue = document.getElementById("last_name_value");
     firstNameValue.textContent = data.profile.first_name;
     lastNameValue.textContent = data.profile.last_name;
+    document.getElementById("friends_count_value").textContent = data.friends_count;
     let usernameElement = document.querySelector(".shifting-h1");
     usernameElement.textContent = data.username;
   } 
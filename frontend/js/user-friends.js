@@ -4,6 +4,9 @@ let isSearching = false;
 let hasMoreFriends = true;
 let hasMoreSearchResults = true;
 let currentSearchQuery = "";
+let searchAfterScore = null;
+let searchAfterId = null;
+let friendsAfterId = null;
 
 let scrollTimeout = null;
 
@@ -26,7 +29,13 @@ window.addEventListener("scroll", () => {
 });
 
 async function getFUserFriends(page) {
-    let friendsResponse = await fetch(`/friends/?pagination=true&page=${page}`);
+    let url = "/friends/?pagination=true";
+    if (page > 1) {
+        if (friendsAfterId === null) return;
+        url += `&after_id=${friendsAfterId}`;
+    }
+
+    let friendsResponse = await fetch(url);
 
     if (friendsResponse.status === 401) {
         window.location.href = "/login/";
@@ -35,6 +44,7 @@ async function getFUserFriends(page) {
 
     if (friendsResponse.status === 200) {
         let friendsData = await friendsResponse.json();
+        friendsAfterId = friendsResponse.headers.get("X-Next-After-Id");
         let friendsList = document.getElementById("friends_list");
         if (page === 1) {
             friendsList.innerHTML = ""; 
@@ -46,7 +56,7 @@ async function getFUserFriends(page) {
             hasMoreFriends = false;
         } else {
             friendsData.forEach(friend => appendFriendToList(friendsList, friend));
-            if (friendsData.length === 0) {
+            if (friendsAfterId === null) {
                 hasMoreFriends = false;
             }
         }
@@ -73,9 +83,17 @@ async function searchFriends() {
 async function searchFriendsPaginated(page, query) {
     if (!query) return;
 
-    let searchResponse = await fetch(`/search/?query=${query}&pagination=true&page=${page}`);
+    let url = `/search/?query=${encodeURIComponent(query)}`;
+    if (page > 1) {
+        if (searchAfterId === null) return;
+        url += `&after_score=${searchAfterScore}&after_id=${searchAfterId}`;
+    }
+
+    let searchResponse = await fetch(url);
     if (searchResponse.status === 200) {
         let searchData = await searchResponse.json();
+        searchAfterScore = searchResponse.headers.get("X-Next-After-Score");
+        searchAfterId = searchResponse.headers.get("X-Next-After-Id");
 
         let searchList = document.getElementById("search_list");
         if (page === 1) {
@@ -88,7 +106,7 @@ async function searchFriendsPaginated(page, query) {
             hasMoreSearchResults = false;
         } else {
             searchData.forEach(friend => appendFriendToList(searchList, friend));
-            if (searchData.length === 0) {
+            if (searchAfterId === null) {
                 hasMoreSearchResults = false;
             }
         }
@@ -27,8 +27,11 @@ async function CheckProtectUserId() {
     let parentDiv = addFriendLink.parentElement;
     let textElement = document.createElement("p");
     textElement.textContent = "Пользователь уже добавлен в друзья";
-    parentDiv.removeChild(addFriendLink); 
-    parentDiv.appendChild(textElement); 
+    parentDiv.insertBefore(textElement, addFriendLink);
+    addFriendLink.textContent = "Удалить из друзей";
+    addFriendLink.classList.remove("hidden");
+    addFriendLink.setAttribute("data-friend-id", user_id);
+    addFriendLink.addEventListener("click", removeFriend);
   } else if (protectUserId && protectUserId !== user_id) {
     addFriendLink.classList.remove("hidden");
     addFriendLink.setAttribute("data-friend-id", user_id); 
@@ -52,6 +55,7 @@ async function CheckProtectUserId() {
   document.getElementById("avatar_image").src = profile.avatar || "/static/images/default-avatar.png";
   document.getElementById("first_name_value").textContent = profile.first_name || "";
   document.getElementById("last_name_value").textContent = profile.last_name || "";
+  document.getElementById("friends_count_value").textContent = userProfile.friends_count;
 }
 
 
@@ -72,6 +76,23 @@ async function addFriend() {
 }
 
 
+async function removeFriend() {
+  const friend_id = this.getAttribute("data-friend-id");
+
+  const response = await fetch(`/remove/friend/${friend_id}/`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+  });
+
+  if (response.ok) {
+    alert("Пользователь удалён из друзей");
+    location.reload();
+  } else {
+    alert("Ошибка при удалении пользователя из друзей");
+  }
+}
+
+
 
 
 
@@ -0,0 +1,29 @@
+"""username trigram index
+
+Revision ID: 3f6a9c1d2b7e
+Revises: fba2049d49b5
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f6a9c1d2b7e'
+down_revision: Union[str, None] = 'fba2049d49b5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.execute(
+        'CREATE INDEX ix_user_username_lower_trgm ON "user" '
+        'USING gin (lower(username) gin_trgm_ops)'
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS ix_user_username_lower_trgm")
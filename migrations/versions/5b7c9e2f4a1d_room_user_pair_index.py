@@ -0,0 +1,42 @@
+"""room user pair index
+
+Revision ID: 5b7c9e2f4a1d
+Revises: 8d2e4b6a1c3f
+Create Date: 2026-10-18 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b7c9e2f4a1d'
+down_revision: Union[str, None] = '8d2e4b6a1c3f'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Mirrored rooms hold separate message histories in MongoDB, which the migration cannot reach.
+    # They are merged beforehand by scripts/merge_duplicate_rooms.py.
+    duplicates = op.get_bind().execute(sa.text(
+        'SELECT count(*) FROM (SELECT 1 FROM room '
+        'GROUP BY least(sender_id, recipient_id), greatest(sender_id, recipient_id) '
+        'HAVING count(*) > 1) AS pairs'
+    )).scalar()
+    if duplicates:
+        raise RuntimeError(
+            f"{duplicates} pairs of users have more than one room; "
+            "merge them with `python -m scripts.merge_duplicate_rooms` before upgrading"
+        )
+
+    op.execute(
+        'CREATE UNIQUE INDEX uq_room_user_pair ON room '
+        '(least(sender_id, recipient_id), greatest(sender_id, recipient_id))'
+    )
+
+
+def downgrade() -> None:
+    op.execute("DROP INDEX IF EXISTS uq_room_user_pair")
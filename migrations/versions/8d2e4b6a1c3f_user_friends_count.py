@@ -0,0 +1,31 @@
+"""user friends count
+
+Revision ID: 8d2e4b6a1c3f
+Revises: 3f6a9c1d2b7e
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e4b6a1c3f'
+down_revision: Union[str, None] = '3f6a9c1d2b7e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('user', sa.Column('friends_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute(
+        'UPDATE "user" SET friends_count = counts.friends_count '
+        'FROM (SELECT user_id, count(*) AS friends_count FROM friends GROUP BY user_id) AS counts '
+        'WHERE "user".id = counts.user_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('user', 'friends_count')
@@ -0,0 +1,137 @@
+"""
+    Merges the rooms of a pair of users into the oldest one, so that the unique index
+    on the pair (migration 5b7c9e2f4a1d) can be created.
+
+    The messages of the other rooms are moved into the kept room and the messages of the pair
+    are renumbered in the order they were created. The room state is rebuilt and the read
+    checkpoints are moved to the new numbers: a message unread in its original room stays unread.
+    The other rooms are deleted last, so an interrupted run can simply be started again.
+
+    Run from the repository root with the application settings in the environment (see env.example),
+    with the application stopped and the write-behind stream flushed, before upgrading:
+    python -m scripts.merge_duplicate_rooms [--dry-run]
+    alembic upgrade head
+"""
+import argparse
+import asyncio
+
+from pymongo import UpdateOne
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.application.services.history_cache import history_cache
+from app.application.services.room_cache import room_cache
+from app.infrastructure.config.database import async_session_maker, init_mongo
+from app.infrastructure.models.nosql.messages import Message
+from app.infrastructure.models.nosql.read_states import ReadState
+from app.infrastructure.models.nosql.rooms import RoomState
+from app.infrastructure.utils.redis_utils.redis_utils import redis_utils
+
+DUPLICATES_QUERY = text(
+    "SELECT least(sender_id, recipient_id), greatest(sender_id, recipient_id), array_agg(id ORDER BY id) "
+    "FROM room GROUP BY 1, 2 HAVING count(*) > 1"
+)
+
+
+async def find_duplicates(session: AsyncSession) -> list[tuple[int, int, list[int]]]:
+    """
+        Returns (user_id, other_user_id, room IDs from the oldest) for every pair with several rooms.
+    """
+    result = await session.execute(DUPLICATES_QUERY)
+    return [(user_id, other_user_id, list(room_ids)) for user_id, other_user_id, room_ids in result.all()]
+
+
+async def merge_rooms(session: AsyncSession, user_ids: tuple[int, int], room_ids: list[int]) -> int:
+    """
+        Merges the rooms into the first one. Returns the number of messages of the merged room.
+    """
+    kept_room_id = room_ids[0]
+    messages = await Message.find({"room_id": {"$in": room_ids}}).sort(
+        [("created_at", 1), ("_id", 1)]
+    ).to_list()
+    read_seqs = {
+        (state.user_id, state.room_id): state.read_seq
+        for state in await ReadState.find({"room_id": {"$in": room_ids}}).to_list()
+    }
+
+    # A user has read the new numbers up to the first message still unread in its original room.
+    new_read_seqs = {user_id: 0 for user_id in user_ids}
+    reading = set(user_ids)
+    updates = []
+    for seq, message in enumerate(messages, start=1):
+        for user_id in list(reading):
+            if (
+                message.user_id == user_id
+                or message.seq is None
+                or message.seq <= read_seqs.get((user_id, message.room_id), 0)
+            ):
+                new_read_seqs[user_id] = seq
+            else:
+                reading.discard(user_id)
+        updates.append(UpdateOne({"_id": message.id}, {"$set": {"room_id": kept_room_id, "seq": seq}}))
+
+    if updates:
+        await Message.get_motor_collection().bulk_write(updates, ordered=False)
+
+    kept_state = await RoomState.find_one(RoomState.room_id == kept_room_id)
+    await RoomState.find({"room_id": {"$in": room_ids}}).delete()
+    state = RoomState(
+        room_id=kept_room_id,
+        seq=len(messages),
+        retention=kept_state.retention if kept_state else None,
+        message_count=len(messages),
+    )
+    if messages:
+        state.last_message = messages[-1].text
+        state.last_message_time = messages[-1].created_at
+        state.last_sender_id = messages[-1].user_id
+    await state.insert()
+
+    await ReadState.find({"room_id": {"$in": room_ids}}).delete()
+    for user_id, read_seq in new_read_seqs.items():
+        if read_seq:
+            await ReadState(user_id=user_id, room_id=kept_room_id, read_seq=read_seq).insert()
+
+    await session.execute(text("DELETE FROM room WHERE id = ANY(:room_ids)"), {"room_ids": room_ids[1:]})
+    await session.commit()
+
+    await drop_cached(user_ids, room_ids)
+    return len(messages)
+
+
+async def drop_cached(user_ids: tuple[int, int], room_ids: list[int]) -> None:
+    """
+        Drops the cached state of the merged rooms and the chat lists of their users,
+        which are rebuilt from the databases on the next read.
+    """
+    for room_id in room_ids:
+        await history_cache.invalidate(room_id)
+    await room_cache.invalidate(*user_ids)
+
+    keys = []
+    for user_id in user_ids:
+        inbox = f"chat:user:{user_id}:inbox"
+        chat_list = f"chat:user:{user_id}:chat_list"
+        keys += [inbox, f"{inbox}:ready", chat_list, f"{chat_list}:changes", f"chat:user:{user_id}:unread"]
+    await redis_utils.delete(*keys)
+
+
+async def main(dry_run: bool) -> None:
+    await init_mongo()
+    async with async_session_maker() as session:
+        duplicates = await find_duplicates(session)
+        print(f"{len(duplicates)} pairs of users have more than one room")
+
+        for user_id, other_user_id, room_ids in duplicates:
+            if dry_run:
+                print(f"users {user_id} and {other_user_id}: rooms {room_ids}")
+                continue
+            count = await merge_rooms(session, (user_id, other_user_id), room_ids)
+            print(f"users {user_id} and {other_user_id}: rooms {room_ids} merged into {room_ids[0]}, {count} messages")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only list the pairs with several rooms")
+    args = parser.parse_args()
+    asyncio.run(main(args.dry_run))